@@ -0,0 +1,264 @@
+import asyncio
+import signal
+import time
+
+import DeathLoopVaccine
+import EventPublisher
+import EverquestLogFile
+import LogFileWaiter
+import Metrics
+
+
+#
+# asyncio-based log engine, as an alternative to running each EverquestLogFile in its own thread.
+#
+# An AsyncLogTailer follows one log file, and yields batches of new lines as they are written.
+# It uses an EverquestLogFile object for the file handling (opening the latest log, chunked reads,
+# heartbeat rollover), but never starts that object's thread.  On Linux, the tailer waits on an
+# inotify descriptor registered with the event loop, elsewhere it polls with an adaptive backoff
+# using asyncio.sleep(), so any number of tailers and consumers share one event loop and one thread.
+#
+# An AsyncLogEngine runs any number of tailers, each feeding any number of async handler coroutines.
+# elf_handler() adapts an EverquestLogFile child class (e.g. DeathLoopVaccine) into such a handler,
+# so the existing process_lines() / process_line() logic runs on the event loop unchanged.
+#
+# Note that the file reads themselves are ordinary blocking reads, done on the event loop thread.
+# Reads of a regular file return immediately, and are bounded by EverquestLogFile.read_size.
+#
+class AsyncLogTailer:
+    """
+    class to follow one log file on an asyncio event loop
+    """
+
+    def __init__(self, elf: EverquestLogFile.EverquestLogFile, follow_latest: bool = True) -> None:
+        """
+        ctor
+
+        :param elf: EverquestLogFile object used for the file handling.  its thread is never started
+        :param follow_latest: True to open the latest log file, and switch to a newer log file when this
+                              one goes quiet for a heartbeat, False to follow whatever file elf has open
+        """
+        self.elf = elf
+        self.follow_latest = follow_latest
+        self._closed = False
+
+        # the waiter must be assigned before the file is opened, so that it gets watched
+        if self.elf.waiter is None:
+            self.elf.waiter = LogFileWaiter.create_waiter()
+        self.waiter = self.elf.waiter
+
+    def open(self) -> bool:
+        """
+        open the latest log file, if not already open
+
+        :return: True if a log file is open
+        """
+        if not self.elf.is_parsing() and self.follow_latest:
+            if self.elf.open_latest():
+                EverquestLogFile.starprint('Now parsing character log for: [{}]'.format(self.elf.char_name))
+        return self.elf.is_parsing()
+
+    def close(self) -> None:
+        """
+        stop following the log file, and close it
+        """
+        self._closed = True
+        if self.elf.is_parsing():
+            self.elf.close()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> list[str]:
+        """
+        wait for the next batch of lines
+
+        :return: list of lines
+        """
+        while not self._closed:
+            lines = self.elf.read_lines()
+            now = time.time()
+            if lines:
+                self.elf.prevtime = now
+                return lines
+
+            # how long to wait for the file to grow
+            timeout = self.elf.heartbeat
+
+            # check the heartbeat.  Has our logfile gone silent?
+            if self.follow_latest:
+                elapsed_seconds = now - self.elf.prevtime
+                if elapsed_seconds > self.elf.heartbeat:
+                    self.elf.prevtime = now
+                    if self.elf.open_latest():
+                        Metrics.HEARTBEAT_ROLLOVERS.inc()
+                        EventPublisher.publish(EventPublisher.HEARTBEAT_ROLLOVER,
+                                               int(now + time.localtime(now).tm_gmtoff), 0, self.elf.char_name)
+                        EverquestLogFile.starprint('Now parsing character log for: [{}]'.format(self.elf.char_name))
+                else:
+                    timeout = self.elf.heartbeat - elapsed_seconds
+
+            await self.wait(timeout)
+
+        raise StopAsyncIteration
+
+    async def wait(self, timeout: float) -> None:
+        """
+        block this coroutine until the file grows, or the timeout expires
+
+        :param timeout: maximum number of seconds to wait
+        """
+        loop = asyncio.get_running_loop()
+        fd = self.waiter.fileno()
+
+        if fd is not None:
+            future = loop.create_future()
+            try:
+                loop.add_reader(fd, lambda: future.done() or future.set_result(None))
+            except NotImplementedError:
+                # e.g. the Windows proactor event loop, fall through to polling
+                fd = None
+            else:
+                try:
+                    await asyncio.wait_for(future, timeout)
+                except asyncio.TimeoutError:
+                    pass
+                finally:
+                    loop.remove_reader(fd)
+                    self.waiter.poll()
+                return
+
+        # no descriptor to wait on, so poll with an adaptive backoff
+        deadline = loop.time() + timeout
+        interval = 0.005
+        while not self.waiter.poll():
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return
+            await asyncio.sleep(min(interval, remaining))
+            interval = min(interval * 2, 0.1)
+
+
+class AsyncLogEngine:
+    """
+    class to run any number of AsyncLogTailers, each feeding any number of async handlers,
+    on one event loop
+    """
+
+    def __init__(self) -> None:
+        """
+        ctor
+        """
+        # list of (tailer, list of handlers) tuples
+        self._feeds = list()
+        self._loop = None
+        self._stop = None
+
+    def add(self, tailer: AsyncLogTailer, *handlers) -> None:
+        """
+        add a log file, and the handlers for its lines
+
+        :param tailer: AsyncLogTailer
+        :param handlers: coroutine functions, each called with every batch of lines
+        """
+        self._feeds.append((tailer, list(handlers)))
+
+    def add_log_file(self, elf: EverquestLogFile.EverquestLogFile, follow_latest: bool = True) -> AsyncLogTailer:
+        """
+        add an EverquestLogFile child class object, which handles its own lines, e.g. a DeathLoopVaccine
+
+        :param elf: EverquestLogFile object, whose thread is never started
+        :param follow_latest: see AsyncLogTailer
+        :return: the AsyncLogTailer created for it
+        """
+        tailer = AsyncLogTailer(elf, follow_latest)
+        self.add(tailer, elf_handler(elf))
+        return tailer
+
+    @staticmethod
+    async def _feed(tailer: AsyncLogTailer, handlers: list) -> None:
+        """
+        pass every batch of lines from one tailer to its handlers
+        """
+        async for lines in tailer:
+            for handler in handlers:
+                await handler(lines)
+
+    async def run(self) -> None:
+        """
+        open all the log files, and run until stop() is called
+        """
+        self._loop = asyncio.get_running_loop()
+        self._stop = asyncio.Event()
+
+        for tailer, handlers in self._feeds:
+            if not tailer.open():
+                EverquestLogFile.starprint('ERROR: Could not open character log file for: [{}]'.format(tailer.elf.char_name))
+
+        tasks = [asyncio.create_task(self._feed(tailer, handlers)) for tailer, handlers in self._feeds]
+        try:
+            await self._stop.wait()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            for tailer, handlers in self._feeds:
+                tailer.close()
+
+    def stop(self) -> None:
+        """
+        stop the engine.  safe to call from any thread, or from a signal handler
+        """
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._stop.set)
+
+
+#################################################################################################
+#
+# standalone functions
+#
+
+def elf_handler(elf: EverquestLogFile.EverquestLogFile):
+    """
+    adapt an EverquestLogFile object into an async handler, which runs its process_lines() logic,
+    updating the parsing metrics just as the EverquestLogFile thread does
+
+    :param elf: EverquestLogFile object
+    :return: coroutine function
+    """
+    async def handler(lines: list[str]) -> None:
+        elf.dispatch_lines(lines)
+    return handler
+
+
+async def run_log_files(*elfs) -> None:
+    """
+    run one or more EverquestLogFile child class objects on the current event loop until SIGINT/SIGTERM
+
+    :param elfs: EverquestLogFile objects
+    """
+    engine = AsyncLogEngine()
+    for elf in elfs:
+        engine.add_log_file(elf)
+
+    loop = asyncio.get_running_loop()
+    for name in ('SIGINT', 'SIGTERM'):
+        try:
+            loop.add_signal_handler(getattr(signal, name), engine.stop)
+        except (NotImplementedError, AttributeError):
+            # e.g. Windows, where Ctrl-C raises KeyboardInterrupt instead
+            pass
+
+    await engine.run()
+
+
+def main():
+    # run the death loop vaccine on the asyncio engine
+    try:
+        asyncio.run(run_log_files(DeathLoopVaccine.DeathLoopVaccine()))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
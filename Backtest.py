@@ -0,0 +1,257 @@
+import argparse
+import collections
+import concurrent.futures
+import itertools
+import sys
+import time
+
+import ConsoleWriter
+import DeathLoopVaccine
+import EverquestLogFile
+import LogFileWaiter
+
+
+#
+# offline replay and backtesting for DeathLoopVaccine.
+#
+# An existing log file is streamed through the DeathLoopVaccine detection logic as fast as it
+# can be read, with the "process-killer gun" permanently disarmed, and every point where the
+# kill would have fired is reported.  Grids of death loop parameters (deaths, seconds, and
+# which player activities count as proof the player is not AFK) can be swept in parallel
+# across a process pool, to tune the thresholds against real logs.
+#
+# usage:
+#
+#   python Backtest.py LOGFILE [--deaths 3,4,5] [--seconds 60,120,180] [--afk all,casting+melee]
+#
+
+# one point in the log where the kill would have fired
+KillPoint = collections.namedtuple('KillPoint', ['line_number', 'epoch', 'armed', 'death_lines'])
+
+# results of one replay
+ReplayResult = collections.namedtuple('ReplayResult', ['deaths', 'seconds', 'afk', 'lines', 'elapsed', 'kill_points'])
+
+# the AFK rules understood by parse_afk_rule(), i.e. '+' separated lists of these names
+AFK_RULE_NAMES = {
+    'all': DeathLoopVaccine.AFK_BREAKERS,
+    'none': frozenset(),
+    'casting': frozenset((DeathLoopVaccine.CASTING,)),
+    'communication': frozenset((DeathLoopVaccine.COMMUNICATION,)),
+    'melee': frozenset((DeathLoopVaccine.MELEE,)),
+}
+
+
+class ReplayVaccine(DeathLoopVaccine.DeathLoopVaccine):
+    """
+    DeathLoopVaccine child class, which replays a log file from start to end,
+    recording each point where the kill would have fired, rather than killing anything
+    """
+
+    def __init__(self) -> None:
+        """
+        ctor
+        """
+        super().__init__()
+
+        # no need for an OS-level file watch, we never wait for the file to grow
+        self.waiter = LogFileWaiter.PollingWaiter()
+        self.read_size = 1024 * 1024
+
+        # lines are never echoed, so there is no need to decode any but the death lines
+        self.bytes_mode = True
+
+        self.line_number = 0
+        self.kill_points = list()
+
+    def process_line(self, line: bytes) -> None:
+        """
+        same as the DeathLoopVaccine behavior, minus echoing the line, and the detector plugins
+
+        :param line: bytes with a single line from the logfile
+        """
+        self.line_number += 1
+        category = self.classify(line)
+        self.check_for_death(line, category)
+        self.check_not_afk(line, category)
+        self.deathloop_response()
+
+    def deathloop_response(self) -> None:
+        """
+        record the kill point, rather than killing anything
+        """
+        rule = self.triggered_rule()
+        if rule:
+            epoch, line = rule.window.newest()
+            death_lines = [self.decode(line) for epoch, line in rule.window]
+            self.kill_points.append(KillPoint(self.line_number, epoch, self._kill_armed, death_lines))
+            self.reset()
+
+    def replay(self, filename: str) -> int:
+        """
+        stream the entire log file through the detector
+
+        :param filename: full log filename
+        :return: number of lines replayed
+        """
+        charname = self.parse_charname(filename) or 'Unknown'
+        if not self.open(charname, filename, seek_end=False):
+            raise OSError(f'Unable to open filename: [{filename}]')
+
+        try:
+            while True:
+                lines = self.read_lines()
+                if not lines:
+                    break
+                self.process_lines(lines)
+
+            # a last line with no line terminator
+            if self._partial:
+                self.process_line(self.convert_line(self._partial))
+        finally:
+            self.close()
+
+        return self.line_number
+
+
+#################################################################################################
+#
+# standalone functions
+#
+
+def parse_afk_rule(rule: str) -> frozenset:
+    """
+    convert an AFK rule name, e.g. 'casting+melee', to the set of line categories
+    which count as proof the player is not AFK
+
+    :param rule: '+' separated list of names from AFK_RULE_NAMES
+    :return: frozenset of line categories
+    """
+    rv = frozenset()
+    for name in rule.split('+'):
+        if name not in AFK_RULE_NAMES:
+            raise ValueError(f'Unknown AFK rule [{name}], choose from {sorted(AFK_RULE_NAMES)}')
+        rv = rv | AFK_RULE_NAMES[name]
+    return rv
+
+
+def replay(filename: str, deaths: int, seconds: int, afk: str = 'all') -> ReplayResult:
+    """
+    replay one log file with one set of death loop parameters.
+    runs with console output turned down to QUIET, so it is suitable for a process pool worker
+
+    :param filename: full log filename
+    :param deaths: number of deaths which define a death loop
+    :param seconds: number of seconds which define a death loop
+    :param afk: AFK rule name, see parse_afk_rule()
+    :return: ReplayResult
+    """
+    rv = ReplayVaccine()
+    rv.deathloop_deaths = deaths
+    rv.deathloop_seconds = seconds
+    rv.afk_breakers = parse_afk_rule(afk)
+    rv.build_rules()
+
+    verbosity = ConsoleWriter.set_verbosity(ConsoleWriter.QUIET)
+    try:
+        start = time.perf_counter()
+        lines = rv.replay(filename)
+        elapsed = time.perf_counter() - start
+    finally:
+        ConsoleWriter.set_verbosity(verbosity)
+
+    return ReplayResult(deaths, seconds, afk, lines, elapsed, rv.kill_points)
+
+
+def sweep(filename: str, deaths_grid: list[int], seconds_grid: list[int], afk_grid: list[str],
+          max_workers: int = None):
+    """
+    replay one log file with every combination of the death loop parameters, in parallel
+    across a process pool.  results are yielded as they complete
+
+    :param filename: full log filename
+    :param deaths_grid: list of death counts
+    :param seconds_grid: list of window lengths, seconds
+    :param afk_grid: list of AFK rule names
+    :param max_workers: number of worker processes, None for one per CPU
+    :return: generator of ReplayResult
+    """
+    # validate the AFK rules up front, rather than in every worker
+    for afk in afk_grid:
+        parse_afk_rule(afk)
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(replay, filename, deaths, seconds, afk)
+                   for deaths, seconds, afk in itertools.product(deaths_grid, seconds_grid, afk_grid)]
+        for future in concurrent.futures.as_completed(futures):
+            yield future.result()
+
+
+def report_kill_points(result: ReplayResult) -> None:
+    """
+    print every kill point from one replay
+
+    :param result: ReplayResult
+    """
+    for kp in result.kill_points:
+        armed = '' if kp.armed else ' (disarmed, test deaths)'
+        EverquestLogFile.starprint(f'Kill would have fired at line {kp.line_number}{armed}:')
+        for line in kp.death_lines:
+            EverquestLogFile.starprint('    ' + line)
+
+
+def report_summary(result: ReplayResult) -> None:
+    """
+    print a one line summary of one replay
+
+    :param result: ReplayResult
+    """
+    armed = sum(1 for kp in result.kill_points if kp.armed)
+    rate = result.lines / result.elapsed if result.elapsed > 0 else 0.0
+    EverquestLogFile.starprint(f'deaths={result.deaths:<3} seconds={result.seconds:<5} afk={result.afk:<30} '
+                               f'kills={armed:<5} ({len(result.kill_points) - armed} disarmed), '
+                               f'{result.lines} lines at {rate:,.0f} lines/sec')
+
+
+def int_list(text: str) -> list[int]:
+    """
+    argparse type for a comma separated list of integers
+    """
+    return [int(field) for field in text.split(',')]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay an Everquest log through DeathLoopVaccine, '
+                                                 'reporting where the kill would have fired')
+    parser.add_argument('logfile', help='Everquest log file to replay')
+    parser.add_argument('--deaths', type=int_list, default=[DeathLoopVaccine.myconfig.DEATHLOOP_DEATHS],
+                        help='comma separated list of death counts to test')
+    parser.add_argument('--seconds', type=int_list, default=[DeathLoopVaccine.myconfig.DEATHLOOP_SECONDS],
+                        help='comma separated list of window lengths (seconds) to test')
+    parser.add_argument('--afk', type=lambda text: text.split(','), default=['all'],
+                        help=f'comma separated list of AFK rules to test, each a "+" separated list '
+                             f'of {sorted(AFK_RULE_NAMES)}')
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes')
+    args = parser.parse_args()
+
+    try:
+        combos = len(args.deaths) * len(args.seconds) * len(args.afk)
+
+        # a single combination is simply replayed here, and every kill point reported
+        if combos == 1:
+            result = replay(args.logfile, args.deaths[0], args.seconds[0], args.afk[0])
+            report_kill_points(result)
+            report_summary(result)
+
+        # otherwise sweep the grid, and summarize each combination
+        else:
+            for result in sweep(args.logfile, args.deaths, args.seconds, args.afk, args.workers):
+                report_summary(result)
+
+    except (OSError, ValueError) as err:
+        EverquestLogFile.starprint(f'ERROR: {err}', ConsoleWriter.QUIET)
+        ConsoleWriter.flush()
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,270 @@
+import argparse
+import contextlib
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+import myconfig
+import ConsoleWriter
+import DeathLoopVaccine
+import EverquestLogFile
+import SyntheticLog
+
+# numpy is only needed for the analytics benchmark
+try:
+    import LogAnalytics
+except ImportError:
+    LogAnalytics = None
+
+
+#
+# benchmark suite for the log parsing and death loop detection paths.
+#
+# Results are written as JSON, so runs can be saved and compared to catch regressions.
+#
+# usage:
+#
+#   python Benchmark.py [--lines 200000] [--trials 20] [--output bench.json] [--only NAME,NAME...]
+#
+# benchmarks:
+#
+#   classify:       lines/sec through DeathLoopVaccine.classify()
+#   timestamp:      lines/sec through TimestampParser.parse()
+#   process_line:   lines/sec through DeathLoopVaccine.process_line()
+#   process_bytes:  lines/sec through DeathLoopVaccine.process_line(), in bytes mode
+#   tail:           lines/sec through the full EverquestLogFile tail path, from file to process_lines()
+#   latency:        seconds from a death line being appended to the log until deathloop_response() fires
+#   analytics:      MB/sec through LogAnalytics.LogAnalyzer, over a synthetic log file.  requires numpy.
+#                   on one core, a 141 MB, 2M line synthetic log runs at about 150 MB/sec, short of the
+#                   hundreds of MB/sec hoped for.  what time is left is spent gathering the stamps and
+#                   message heads out of the mapped file, and finding the newlines, so it is memory bound
+#
+
+# character name used in all the synthetic logs
+CHAR_NAME = 'Benchmark'
+
+
+class QuietVaccine(DeathLoopVaccine.DeathLoopVaccine):
+    """
+    DeathLoopVaccine child class which never kills anything, and signals an event,
+    with a timestamp, whenever the kill would have fired
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.lines_processed = 0
+        self.all_processed = threading.Event()
+        self.lines_expected = None
+        self.fired = threading.Event()
+        self.fired_time = None
+
+    def process_lines(self, lines: list[str]) -> None:
+        super().process_lines(lines)
+        self.lines_processed += len(lines)
+        if self.lines_expected is not None and self.lines_processed >= self.lines_expected:
+            self.all_processed.set()
+
+    def deathloop_response(self) -> None:
+        if self.is_deathlooping():
+            self.fired_time = time.perf_counter()
+            self.reset()
+            self.fired.set()
+
+
+@contextlib.contextmanager
+def quiet():
+    """
+    context manager to turn console output down to QUIET while a benchmark runs
+    """
+    verbosity = ConsoleWriter.set_verbosity(ConsoleWriter.QUIET)
+    try:
+        yield
+    finally:
+        ConsoleWriter.set_verbosity(verbosity)
+
+
+def rate(count: int, elapsed: float) -> dict:
+    """
+    :return: result dictionary for a throughput benchmark
+    """
+    return {'lines': count, 'seconds': elapsed, 'lines_per_sec': count / elapsed if elapsed > 0 else None}
+
+
+def bench_classify(lines: list[str]) -> dict:
+    dlv = QuietVaccine()
+    dlv.char_name = CHAR_NAME
+    dlv.bytes_mode = False
+    classify = dlv.classify
+    start = time.perf_counter()
+    for line in lines:
+        classify(line)
+    return rate(len(lines), time.perf_counter() - start)
+
+
+def bench_timestamp(lines: list[str]) -> dict:
+    parse = EverquestLogFile.TimestampParser().parse
+    start = time.perf_counter()
+    for line in lines:
+        parse(line)
+    return rate(len(lines), time.perf_counter() - start)
+
+
+def bench_process_line(lines: list[str] or list[bytes], bytes_mode: bool = False) -> dict:
+    dlv = QuietVaccine()
+    dlv.char_name = CHAR_NAME
+    dlv.bytes_mode = bytes_mode
+    with quiet():
+        start = time.perf_counter()
+        dlv.process_lines(lines)
+        elapsed = time.perf_counter() - start
+    return rate(len(lines), elapsed)
+
+
+def bench_tail(lines: list[str], directory: str) -> dict:
+    filename = os.path.join(directory, f'eqlog_{CHAR_NAME}_tail.txt')
+    with open(filename, 'w') as f:
+        for line in lines:
+            f.write(line + '\n')
+
+    dlv = QuietVaccine()
+    dlv.lines_expected = len(lines)
+    with quiet():
+        start = time.perf_counter()
+        dlv.open(CHAR_NAME, filename, seek_end=False)
+        dlv.start()
+        dlv.all_processed.wait()
+        elapsed = time.perf_counter() - start
+        dlv.shutdown()
+        dlv.join()
+    return rate(len(lines), elapsed)
+
+
+def bench_latency(trials: int, directory: str) -> dict:
+    filename = os.path.join(directory, f'eqlog_{CHAR_NAME}_latency.txt')
+    open(filename, 'w').close()
+    generator = SyntheticLog.SyntheticLog(CHAR_NAME, seed=1)
+
+    dlv = QuietVaccine()
+    latencies = list()
+    with quiet():
+        dlv.open(CHAR_NAME, filename)
+        dlv.start()
+        with open(filename, 'a') as f:
+            for _ in range(trials):
+                dlv.fired.clear()
+
+                # all but the last of the deaths, then let the parser go idle
+                for _ in range(dlv.deathloop_deaths - 1):
+                    f.write(generator.line('death') + '\n')
+                f.flush()
+                time.sleep(0.2)
+
+                # the final death, which should trigger the response
+                last = generator.line('death') + '\n'
+                start = time.perf_counter()
+                f.write(last)
+                f.flush()
+                if dlv.fired.wait(5.0):
+                    latencies.append(dlv.fired_time - start)
+        dlv.shutdown()
+        dlv.join()
+
+    if not latencies:
+        return {'trials': trials, 'fired': 0}
+
+    latencies.sort()
+    return {
+        'trials': trials,
+        'fired': len(latencies),
+        'waiter': type(dlv.waiter).__name__,
+        'min_sec': latencies[0],
+        'median_sec': statistics.median(latencies),
+        'p95_sec': latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+        'max_sec': latencies[-1],
+    }
+
+
+def bench_analytics(lines: list[str], directory: str) -> dict:
+    if LogAnalytics is None:
+        return {'skipped': 'requires numpy'}
+    filename = os.path.join(directory, f'eqlog_{CHAR_NAME}_analytics.txt')
+    with open(filename, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    analyzer = LogAnalytics.LogAnalyzer(CHAR_NAME)
+    analyzer.analyze_file(filename)
+    rv = rate(len(lines), analyzer.elapsed)
+    rv['mb_per_sec'] = analyzer.bytes / analyzer.elapsed / 1e6 if analyzer.elapsed > 0 else None
+    return rv
+
+
+BENCHMARKS = ['classify', 'timestamp', 'process_line', 'process_bytes', 'tail', 'latency', 'analytics']
+
+
+def run(count: int = 200000, trials: int = 20, only: list[str] = None, seed: int = 1) -> dict:
+    """
+    run the benchmark suite
+
+    :param count: number of synthetic lines for the throughput benchmarks
+    :param trials: number of trials for the latency benchmark
+    :param only: list of benchmark names to run, None for all
+    :param seed: random seed for the synthetic log
+    :return: dictionary of results, suitable for JSON
+    """
+    names = only or BENCHMARKS
+    lines = list(SyntheticLog.SyntheticLog(CHAR_NAME, seed=seed).lines(count))
+
+    results = dict()
+    with tempfile.TemporaryDirectory() as directory:
+        for name in names:
+            if name == 'classify':
+                results[name] = bench_classify(lines)
+            elif name == 'timestamp':
+                results[name] = bench_timestamp(lines)
+            elif name == 'process_line':
+                results[name] = bench_process_line(lines)
+            elif name == 'process_bytes':
+                results[name] = bench_process_line([line.encode() for line in lines], bytes_mode=True)
+            elif name == 'tail':
+                results[name] = bench_tail(lines, directory)
+            elif name == 'latency':
+                results[name] = bench_latency(trials, directory)
+            elif name == 'analytics':
+                results[name] = bench_analytics(lines, directory)
+            else:
+                raise ValueError(f'Unknown benchmark [{name}], choose from {BENCHMARKS}')
+
+    return {
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'deathloop_deaths': myconfig.DEATHLOOP_DEATHS,
+        'deathloop_seconds': myconfig.DEATHLOOP_SECONDS,
+        'results': results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='DeathLoopVaccine benchmark suite')
+    parser.add_argument('--lines', type=int, default=200000, help='number of synthetic lines for throughput benchmarks')
+    parser.add_argument('--trials', type=int, default=20, help='number of trials for the latency benchmark')
+    parser.add_argument('--only', type=lambda text: text.split(','), default=None,
+                        help=f'comma separated list of benchmarks to run, from {BENCHMARKS}')
+    parser.add_argument('--output', default=None, help='write the JSON results to this file, rather than stdout')
+    args = parser.parse_args()
+
+    results = run(args.lines, args.trials, args.only)
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
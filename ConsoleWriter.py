@@ -0,0 +1,262 @@
+import atexit
+import queue
+import sys
+import threading
+import time
+
+
+#
+# buffered, non-blocking console output.
+#
+# Console writes (notoriously slow on Windows) are handed to a background writer thread through
+# a bounded queue, so the parsing and kill paths never wait on the console.  If the console cannot
+# keep up and the queue fills, messages are dropped (and counted) rather than blocking the caller.
+#
+# Each message has a level, and is only queued if the level is no higher than the current verbosity:
+#
+#   QUIET:      errors and anything else which must always be shown
+#   NORMAL:     status messages, e.g. starprint()
+#   VERBOSE:    every log line, as echoed by EverquestLogFile.process_line()
+#
+# VERBOSE messages are also rate limited, and may only use half the queue, so a flood of log lines
+# can never crowd out the status messages.  Runs of repeated messages (for log lines, ignoring the
+# date-time stamp) are coalesced into a single "repeated N times" note.
+#
+
+QUIET = 0
+NORMAL = 1
+VERBOSE = 2
+
+
+class ConsoleWriter(threading.Thread):
+    """
+    class to write console messages from a background thread
+    """
+
+    # marker queued by flush()
+    _FLUSH = object()
+
+    def __init__(self, stream=None, maxsize: int = 10000, verbosity: int = VERBOSE,
+                 max_lines_per_second: int = 500, coalesce: bool = True) -> None:
+        """
+        ctor
+
+        :param stream: output stream, None for whatever sys.stdout is at the time of writing
+        :param maxsize: maximum number of queued messages
+        :param verbosity: maximum level of message to be written
+        :param max_lines_per_second: maximum number of VERBOSE messages written per second
+        :param coalesce: True to coalesce runs of repeated messages
+        """
+        # parent ctor
+        # the daemon=True parameter causes this child thread object to terminate
+        # when the parent thread terminates
+        super().__init__(daemon=True)
+
+        self.stream = stream
+        self.maxsize = maxsize
+        self.verbosity = verbosity
+        self.max_lines_per_second = max_lines_per_second
+        self.coalesce = coalesce
+
+        self._queue = queue.Queue(maxsize)
+        self._verbose_limit = maxsize // 2
+
+        # count of messages dropped because the queue was full, and how many of those have been reported
+        self.dropped = 0
+        self._dropped_reported = 0
+
+        # offset of the message text in a log line, so log lines are coalesced ignoring their date-time stamps.
+        # EverquestLogFile imports this module, so it can only be imported once this module has loaded
+        import EverquestLogFile
+        self._message_offset = EverquestLogFile.MESSAGE_OFFSET
+
+        # writer thread state, for rate limiting and coalescing
+        self._second = 0
+        self._second_count = 0
+        self._suppressed = 0
+        self._last_key = None
+        self._repeats = 0
+
+    def write(self, text: str, level: int = NORMAL) -> bool:
+        """
+        queue a message to be written.  never blocks
+
+        :param text: message, without line terminator
+        :param level: message level, QUIET, NORMAL or VERBOSE
+        :return: True if the message was queued
+        """
+        if level > self.verbosity:
+            return False
+        if level >= VERBOSE and self._queue.qsize() >= self._verbose_limit:
+            self.dropped += 1
+            return False
+        try:
+            self._queue.put_nowait((level, text))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def flush(self, timeout: float = 2.0) -> bool:
+        """
+        wait for everything queued so far to be written
+
+        :param timeout: maximum number of seconds to wait
+        :return: True if everything was written
+        """
+        if not self.is_alive():
+            return self._queue.empty()
+        done = threading.Event()
+        try:
+            self._queue.put((self._FLUSH, done), timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+    def _format(self, level: int, text: str, out: list[str]) -> None:
+        """
+        rate limit and coalesce one message, and add whatever is to be written to out
+        """
+        if level >= VERBOSE:
+            second = int(time.monotonic())
+            if second != self._second:
+                self._second = second
+                self._second_count = 0
+                self._report_suppressed(out)
+            if self._second_count >= self.max_lines_per_second:
+                self._suppressed += 1
+                return
+            self._second_count += 1
+            key = text[self._message_offset:]
+        else:
+            key = text
+
+        if self.coalesce and key == self._last_key:
+            self._repeats += 1
+            return
+
+        self._report_repeats(out)
+        self._last_key = key
+        out.append(text)
+        out.append('\n')
+
+    def _report_repeats(self, out: list[str]) -> None:
+        if self._repeats:
+            out.append(f'    (previous message repeated {self._repeats} more times)\n')
+            self._repeats = 0
+
+    def _report_suppressed(self, out: list[str]) -> None:
+        if self._suppressed:
+            out.append(f'    ({self._suppressed} log lines not shown, over {self.max_lines_per_second} per second)\n')
+            self._suppressed = 0
+
+    def _report_dropped(self, out: list[str]) -> None:
+        dropped = self.dropped
+        if dropped != self._dropped_reported:
+            out.append(f'    ({dropped - self._dropped_reported} messages dropped, console could not keep up)\n')
+            self._dropped_reported = dropped
+
+    def run(self) -> None:
+        """
+        override the thread.run() method
+        this method will execute in its own thread
+        """
+        while True:
+            item = self._queue.get()
+            out = list()
+            flushes = list()
+
+            # take everything else already queued as well, and write it all at once
+            while True:
+                level, text = item
+                if level is self._FLUSH:
+                    flushes.append(text)
+                else:
+                    self._format(level, text, out)
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+
+            # the queue is empty, so report anything pending
+            self._report_repeats(out)
+            self._report_suppressed(out)
+            self._report_dropped(out)
+            self._last_key = None
+
+            if out:
+                stream = self.stream or sys.stdout
+                try:
+                    stream.write(''.join(out))
+                    stream.flush()
+                except (OSError, ValueError):
+                    pass
+
+            for done in flushes:
+                done.set()
+
+
+#################################################################################################
+#
+# standalone functions, using one shared writer
+#
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer() -> ConsoleWriter:
+    """
+    :return: the shared ConsoleWriter, which is created and started on first use
+    """
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                writer = ConsoleWriter()
+                writer.start()
+                atexit.register(writer.flush)
+                _writer = writer
+    return _writer
+
+
+def write(text: str, level: int = NORMAL) -> bool:
+    """
+    queue a message on the shared writer.  never blocks
+
+    :param text: message, without line terminator
+    :param level: message level, QUIET, NORMAL or VERBOSE
+    :return: True if the message was queued
+    """
+    return get_writer().write(text, level)
+
+
+def is_enabled(level: int) -> bool:
+    """
+    :param level: message level
+    :return: True if messages at this level are currently being written, so callers can skip formatting them
+    """
+    return level <= get_writer().verbosity
+
+
+def set_verbosity(level: int) -> int:
+    """
+    set the verbosity of the shared writer
+
+    :param level: QUIET, NORMAL or VERBOSE
+    :return: the previous verbosity
+    """
+    writer = get_writer()
+    rv = writer.verbosity
+    writer.verbosity = level
+    return rv
+
+
+def flush(timeout: float = 2.0) -> bool:
+    """
+    wait for everything queued so far on the shared writer to be written
+
+    :param timeout: maximum number of seconds to wait
+    :return: True if everything was written
+    """
+    return get_writer().flush(timeout)
@@ -1,19 +1,123 @@
+import contextlib
 import re
-import os
-import signal
-import subprocess
-from datetime import datetime
+import sys
+import time
 
 import myconfig
+import ConsoleWriter
+import DetectorRegistry
+import EventPublisher
 import EverquestLogFile
+import KillExecutor
+import Metrics
+import MultiLogFile
+import ProcessFinder
+import Profiler
+import SlidingWindow
+
+
+#
+# line categories, as tagged by the LineClassifier
+#
+DEATH = 'death'
+TEST_DEATH = 'test-death'
+CASTING = 'casting'
+COMMUNICATION = 'communication'
+MELEE = 'melee'
+OTHER = 'other'
+
+# categories which are "proof of life", i.e. indicate the player is not actually AFK
+AFK_BREAKERS = frozenset((CASTING, COMMUNICATION, MELEE))
+
+# categories counted as deaths
+DEATHS = frozenset((DEATH, TEST_DEATH))
+
+# message prefixes for the communication category, besides '<charname> ->'
+COMMUNICATION_PREFIXES = ('You told', 'You say', 'You tell', 'You auction', 'You shout')
+
+# melee verbs, i.e. 'You <verb>' or 'You try to <verb>'
+MELEE_VERBS = ('hit', 'slash', 'pierce', 'crush', 'claw', 'bite', 'sting', 'maul', 'gore', 'punch', 'kick',
+               'backstab', 'bash')
+
+# classification hit counters, one per category
+_CLASSIFIED_METRICS = {category: Metrics.CLASSIFIED.labels(category)
+                       for category in (DEATH, TEST_DEATH, CASTING, COMMUNICATION, MELEE, OTHER)}
+
+
+class LineClassifier:
+    """
+    single-pass line classifier.
+
+    All of the message patterns of interest are compiled into one alternation regex with
+    one named group per category, which is matched once against the message text following
+    the leading date-time stamp.  The name of the group that matched tells us the category.
+
+    In bytes mode the regex is compiled to a bytes pattern, and classifies raw, undecoded lines.
+    """
+
+    # map of regex group names to line categories
+    _GROUP_CATEGORIES = {
+        'death': DEATH,
+        'test_death': TEST_DEATH,
+        'casting': CASTING,
+        'communication': COMMUNICATION,
+        'melee': MELEE,
+    }
+
+    def __init__(self, char_name: str, bytes_mode: bool = False, encoding: str = 'utf-8') -> None:
+        """
+        ctor
+
+        :param char_name: character name, used in the communication pattern
+        :param bytes_mode: True to classify raw bytes lines, rather than strings
+        :param encoding: encoding of the raw lines, in bytes mode
+        """
+        self.char_name = char_name
+        self.bytes_mode = bytes_mode
+        regexp = (r'(?P<death>You have been slain)'
+                  r'|(?P<test_death>death_loop)'
+                  r'|(?P<casting>You begin casting)'
+                  rf'|(?P<communication>{"|".join(COMMUNICATION_PREFIXES)}|{re.escape(char_name)} ->)'
+                  rf'|(?P<melee>You(?: try to)? (?:{"|".join(MELEE_VERBS)}))')
+        if bytes_mode:
+            regexp = regexp.encode(encoding)
+        self._match = re.compile(regexp).match
+
+    @staticmethod
+    def prefixes(char_name: str) -> list[tuple[str, str]]:
+        """
+        the same classification rules as the regex, spelled out as plain message prefixes,
+        e.g. for matching without regular expressions
+
+        :param char_name: character name, used in the communication pattern
+        :return: list of (category, prefix) tuples, in order of precedence
+        """
+        rv = [(DEATH, 'You have been slain'), (TEST_DEATH, 'death_loop'), (CASTING, 'You begin casting')]
+        rv.extend((COMMUNICATION, prefix) for prefix in COMMUNICATION_PREFIXES + (f'{char_name} ->',))
+        rv.extend((MELEE, f'You {verb}') for verb in MELEE_VERBS)
+        rv.extend((MELEE, f'You try to {verb}') for verb in MELEE_VERBS)
+        return rv
+
+    def classify(self, line: str or bytes) -> str:
+        """
+        tag the line with its category
+
+        :param line: string with a single line from the logfile, or bytes in bytes mode
+        :return: one of the line category constants, OTHER if nothing matched
+        """
+        m = self._match(line, EverquestLogFile.MESSAGE_OFFSET)
+        if m:
+            return self._GROUP_CATEGORIES[m.lastgroup]
+        return OTHER
 
 
 #
 # simple utility to prevent Everquest Death Loop
 #
 # The utility functions by parsing the current (most recent) Everquest log file, and if it detects
-# Death Loop symptoms, it will respond by initiating a system process kill of all "eqgame.exe"
-# processes (there should usually only be one).
+# Death Loop symptoms, it will respond by initiating a system process kill of the "eqgame.exe"
+# process which is writing that log file, or, where that can't be found out, of all "eqgame.exe"
+# processes (there should usually only be one).  See myconfig.KILL_SCOPE.
 #
 # We will define a death loop as any time a player experiences X deaths in Y seconds, and no player
 # activity during that time.  The values for X and Y are configurable, via the myconfig.py file.
@@ -47,176 +151,275 @@ class DeathLoopVaccine(EverquestLogFile.EverquestLogFile):
         # parent ctor
         super().__init__()
 
-        # list of death messages
-        # this will function as a scrolling queue, with the oldest message at position 0,
-        # newest appended to the other end.  Older messages scroll off the list when more
-        # than myconfig.DEATHLOOP_SECONDS have elapsed.  The list is also flushed any time
-        # player activity is detected (i.e. player is not AFK).
-        #
-        # if/when the length of this list meets or exceeds myconfig.DEATHLOOP_DEATHS, then
-        # the deathloop response is triggered
-        self._death_list = list()
+        # death loop definition, i.e. X deaths in Y seconds, with no player activity in the interim.
+        # defaults come from myconfig, but may be overridden per object, e.g. for backtesting
+        self.deathloop_deaths = myconfig.DEATHLOOP_DEATHS
+        self.deathloop_seconds = myconfig.DEATHLOOP_SECONDS
+        self.afk_breakers = AFK_BREAKERS
+
+        # sliding window rules over the death messages, see build_rules()
+        self.rules = None
+        self.deathloop_rule = None
+        self.build_rules()
 
         # flag indicating whether the "process killer" gun is armed
         self._kill_armed = True
 
+        # lines are classified as raw bytes, and only decoded if they are printed or offered to a detector,
+        # which is the same path the shared LogEventBus reader and the backtests take
+        self.bytes_mode = True
+
+        # fast log timestamp parser
+        self._timestamp_parser = EverquestLogFile.TimestampParser()
+
+        # precompiled line classifier, rebuilt whenever the character name changes
+        self._classifier = LineClassifier(self.char_name)
+
+        # additional detector plugins, each offered only the lines which could match it
+        self.detectors = DetectorRegistry.DetectorRegistry.from_registered()
+
+    def build_rules(self) -> None:
+        """
+        (re)build the death loop rules from self.deathloop_deaths, self.deathloop_seconds and self.afk_breakers.
+        call this anytime those attributes change
+
+        the main rule keeps a sliding window of (epoch, line) tuples for each death message, so the
+        timestamps are only parsed once.  Older messages scroll off the window when more than
+        self.deathloop_seconds have elapsed, and the window is flushed any time player activity is
+        detected (i.e. player is not AFK).  if/when the window holds self.deathloop_deaths deaths,
+        then the deathloop response is triggered.
+
+        further rules, e.g. deaths with no spell casting in some other window, may be added to
+        self.rules, and fire the same response
+        """
+        self.deathloop_rule = SlidingWindow.WindowRule('deathloop', self.deathloop_deaths, self.deathloop_seconds,
+                                                       DEATHS, self.afk_breakers,
+                                                       f'{self.deathloop_deaths} deaths in less than '
+                                                       f'{self.deathloop_seconds} seconds, with no player activity')
+        self.rules = SlidingWindow.RuleEngine([self.deathloop_rule])
+
     def reset(self) -> None:
         """
-        Utility function to clear the death_list and reset the armed flag
+        Utility function to clear the death windows and reset the armed flag
         """
-        self._death_list.clear()
+        self.rules.reset()
         self._kill_armed = True
 
+    def death_count(self) -> int:
+        """
+        :return: number of deaths in the main death loop window
+        """
+        return len(self.deathloop_rule.window)
+
+    def backfill(self) -> None:
+        """
+        rebuild the death list, and the AFK state, from the end of the log file, so any deaths
+        just before the vaccine was started (or restarted) are counted.
+
+        The file is read backwards, only as far back as self.deathloop_seconds ago by log timestamp,
+        or the start of the current Everquest session, so the cost does not depend on the log size.
+        The lines found are then run through the usual death and AFK checks, oldest first.
+        """
+        now = time.time()
+        cutoff = now + time.localtime(now).tm_gmtoff - self.deathloop_seconds
+
+        marker = b'Welcome to EverQuest!' if self.bytes_mode else 'Welcome to EverQuest!'
+        recent = list()
+        with contextlib.closing(self.read_lines_reverse(self.file.tell())) as lines:
+            for line in lines:
+                try:
+                    if self._timestamp_parser.parse(line) < cutoff:
+                        break
+                except ValueError:
+                    continue
+                recent.append(line)
+
+                # deaths before the client was (re)started don't count
+                if line.startswith(marker, EverquestLogFile.MESSAGE_OFFSET):
+                    break
+
+        for line in reversed(recent):
+            category = self.classify(line)
+            self.check_for_death(line, category)
+            self.check_not_afk(line, category)
+
+        if self.death_count():
+            EverquestLogFile.starprint(f'DeathLoopVaccine:  Backfill found {self.death_count()} recent death(s)')
+
     def process_line(self, line):
         """
         This method gets called by the base class parsing thread once for each parsed line.
         We overload it here to perform our special case parsing tasks.
 
-        :param line: string with a single line from the logfile
+        :param line: string with a single line from the logfile, or bytes in bytes mode
         """
         # start with base class behavior, i.e. print the line to screen
+        # tag the line once, then hand the tag to the individual checks
         # check for death messages
         # check for indications the player is really not AFK
+        # offer the line to any detector plugins
         # are we death looping?  if so, kill the process
         super().process_line(line)
-        self.check_for_death(line)
-        self.check_not_afk(line)
+        category = self.classify(line)
+        self.check_for_death(line, category)
+        self.check_not_afk(line, category)
+        if self.bytes_mode:
+            self.detectors.dispatch_bytes(self, line)
+        else:
+            self.detectors.dispatch(self, line)
         self.deathloop_response()
 
-    def check_for_death(self, line: str) -> None:
+    def process_event(self, epoch: int or None, category: str, line: str or bytes) -> None:
+        """
+        as process_line(), for a line which has already been classified and time-stamped,
+        e.g. by a shared LogEventBus reader, so it is not done twice
+
+        :param epoch: line date-time stamp, as from TimestampParser, or None if the line has no valid stamp
+        :param category: line category, as from LineClassifier
+        :param line: string with a single line from the logfile, or bytes in bytes mode
+        """
+        super().process_line(line)
+        _CLASSIFIED_METRICS[category].inc()
+        self.check_for_death(line, category, epoch)
+        self.check_not_afk(line, category, epoch)
+        if self.bytes_mode:
+            self.detectors.dispatch_bytes(self, line)
+        else:
+            self.detectors.dispatch(self, line)
+        self.deathloop_response()
+
+    def classify(self, line: str or bytes) -> str:
+        """
+        tag the line with its category, using the precompiled classifier.
+        the classifier is rebuilt only when the character name, or bytes mode, changes
+
+        :param line: string with a single line from the logfile, or bytes in bytes mode
+        :return: one of the line category constants, e.g. DEATH, CASTING, OTHER
+        """
+        classifier = self._classifier
+        if classifier.char_name != self.char_name or classifier.bytes_mode != self.bytes_mode:
+            self._classifier = LineClassifier(self.char_name, self.bytes_mode, self.encoding)
+        category = self._classifier.classify(line)
+        _CLASSIFIED_METRICS[category].inc()
+        return category
+
+    def check_for_death(self, line: str, category: str, epoch: int = None) -> None:
         """
         check for indications the player just died, and if we find it,
         save the message for later processing
 
         :param line: string with a single line from the logfile
+        :param category: line category, as returned by classify()
+        :param epoch: line date-time stamp, if already parsed, else None to parse it only if needed
         """
 
-        # cut off the leading date-time stamp info
-        trunc_line = line[27:]
-
         # does this line contain a death message
-        slain_regexp = r'^You have been slain'
-        m = re.match(slain_regexp, trunc_line)
-        if m:
-            # add this message to the list of death messages
-            self._death_list.append(line)
-            EverquestLogFile.starprint(f'DeathLoopVaccine:  Death count = {len(self._death_list)}')
-
-        # a way to test - send a tell to death_loop
-        slain_regexp = r'^death_loop'
-        m = re.match(slain_regexp, trunc_line)
-        if m:
-            # add this message to the list of death messages
+        if category in self.rules.event_categories:
+            # a way to test - send a tell to death_loop
             # since this is just for testing, disarm the kill-gun
-            self._death_list.append(line)
-            EverquestLogFile.starprint(f'DeathLoopVaccine:  Death count = {len(self._death_list)}')
-            self._kill_armed = False
-
-        # only do the list-purging if there are already some death messages in the list, else skip this
-        if len(self._death_list) > 0:
-
-            # create a datetime object for this line, using the very capable datetime.strptime()
-            now = datetime.strptime(line[0:26], '[%a %b %d %H:%M:%S %Y]')
-
-            # now purge any death messages that are too old
-            done = False
-            while not done:
-                # if the list is empty, we're done
-                if len(self._death_list) == 0:
+            if category == TEST_DEATH:
+                self._kill_armed = False
+
+            # add this message to the death windows, and purge any death messages that are too old
+            # a line without a valid stamp can't be placed in the windows, so skip it
+            if epoch is None:
+                try:
+                    epoch = self._timestamp_parser.parse(line)
+                except ValueError:
+                    return
+            self.rules.observe(epoch, category, line)
+            EverquestLogFile.starprint(f'DeathLoopVaccine:  Death count = {self.death_count()}')
+            EventPublisher.publish(EventPublisher.DEATH, epoch, int(category == TEST_DEATH), line)
+            EventPublisher.publish(EventPublisher.DEATH_COUNT, epoch, self.death_count())
+
+        # only do the purging if there are already some death messages in the windows, else skip this
+        elif self.rules.pending:
+            if epoch is None:
+                try:
+                    epoch = self._timestamp_parser.parse(line)
+                except ValueError:
+                    return
+            if self.rules.expire(epoch):
+                EverquestLogFile.starprint(f'DeathLoopVaccine:  Death count = {self.death_count()}')
+                EventPublisher.publish(EventPublisher.DEATH_COUNT, epoch, self.death_count())
+
+                # all the death messages have scrolled off
+                if not self.rules.pending:
                     self.reset()
-                    done = True
-                # if the list is not empty, check if we need to purge some old entries
-                else:
-                    oldest_line = self._death_list[0]
-                    oldest_time = datetime.strptime(oldest_line[0:26], '[%a %b %d %H:%M:%S %Y]')
-                    elapsed_seconds = now - oldest_time
-
-                    if elapsed_seconds.total_seconds() > myconfig.DEATHLOOP_SECONDS:
-                        # that death message is too old, purge it
-                        self._death_list.pop(0)
-                        EverquestLogFile.starprint(f'DeathLoopVaccine:  Death count = {len(self._death_list)}')
-                    else:
-                        # the oldest death message is inside the window, so we're done purging
-                        done = True
-
-    def check_not_afk(self, line: str) -> None:
+
+    def check_not_afk(self, line: str, category: str, epoch: int = None) -> None:
         """
         check for "proof of life" indications the player is really not AFK
 
         :param line: string with a single line from the logfile
+        :param category: line category, as returned by classify()
+        :param epoch: line date-time stamp, if already parsed, else None to parse it only if needed
         """
 
-        # only do the proof of life checks if there are already some death messages in the list, else skip this
-        if len(self._death_list) > 0:
-
-            # check for proof of life, things that indicate the player is not actually AFK
-            # begin by assuming the player is AFK
-            afk = True
-
-            # cut off the leading date-time stamp info
-            trunc_line = line[27:]
-
-            # does this line contain a proof of life - casting
-            regexp = r'^You begin casting'
-            m = re.match(regexp, trunc_line)
-            if m:
-                # player is not AFK
-                afk = False
-                EverquestLogFile.starprint(f'DeathLoopVaccine:  Player Not AFK: {line}')
-
-            # does this line contain a proof of life - communication
-            regexp = f'^(You told|You say|You tell|You auction|You shout|{self.char_name} ->)'
-            m = re.match(regexp, trunc_line)
-            if m:
-                # player is not AFK
-                afk = False
-                EverquestLogFile.starprint(f'DeathLoopVaccine:  Player Not AFK: {line}')
-
-            # does this line contain a proof of life - melee
-            regexp = r'^You( try to)? (hit|slash|pierce|crush|claw|bite|sting|maul|gore|punch|kick|backstab|bash)'
-            m = re.match(regexp, trunc_line)
-            if m:
-                # player is not AFK
-                afk = False
-                EverquestLogFile.starprint(f'DeathLoopVaccine:  Player Not AFK: {line}')
-
-            # if they are not AFK, then go ahead and purge any death messages from the list
-            if not afk:
-                self.reset()
+        # check for proof of life, things that indicate the player is not actually AFK,
+        # e.g. casting, communication, or melee, and if so purge the death messages
+        if category in self.rules.breaker_categories:
+            # a line without a valid stamp can't be published, but it is still proof of life
+            if EventPublisher.is_enabled():
+                if epoch is None:
+                    try:
+                        epoch = self._timestamp_parser.parse(line)
+                    except ValueError:
+                        pass
+                if epoch is not None:
+                    EventPublisher.publish(EventPublisher.AFK_BREAKER, epoch, 0, line)
+
+            if self.rules.interrupt(category):
+                EverquestLogFile.starprint(f'DeathLoopVaccine:  Player Not AFK: {self.decode(line)}')
+                if epoch is not None:
+                    EventPublisher.publish(EventPublisher.DEATH_COUNT, epoch, self.death_count())
+                if not self.rules.pending:
+                    self.reset()
+
+    def triggered_rule(self) -> SlidingWindow.WindowRule or None:
+        """
+        :return: the first death loop rule which has fired, or None
+        """
+        return self.rules.triggered()
+
+    def is_deathlooping(self) -> bool:
+        """
+        :return: True if the death windows show death loop symptoms
+        """
+        return self.rules.triggered() is not None
 
     def deathloop_response(self) -> None:
         """
         are we death looping?  if so, kill the process
         """
 
-        # if the death_list contains more deaths than the limit, then trigger the process kill
-        if len(self._death_list) >= myconfig.DEATHLOOP_DEATHS:
+        # if any death window contains more deaths than the limit, then trigger the process kill
+        rule = self.triggered_rule()
+        if rule:
+            # for testing the actual kill process using simulated player deaths, uncomment the following line
+            # self._kill_armed = True
+
+            # kill the eqgame.exe process which owns this log (or, if that's not known, all of them)
+            # first, and only then report on it
+            executor = get_kill_executor()
+            executor.fire(self._kill_armed, rule.description, self.filename)
+
+            epoch = rule.window.newest()[0]
+            EventPublisher.publish(EventPublisher.KILL, epoch, int(self._kill_armed), rule.description)
 
             EverquestLogFile.starprint('---------------------------------------------------')
-            EverquestLogFile.starprint('DeathLoopVaccine - Killing all eqgame.exe processes')
+            EverquestLogFile.starprint(f'DeathLoopVaccine - Killing eqgame.exe for {self.char_name}')
             EverquestLogFile.starprint('---------------------------------------------------')
             EverquestLogFile.starprint('DeathLoopVaccine has detected deathloop symptoms:')
-            EverquestLogFile.starprint(f'    {myconfig.DEATHLOOP_DEATHS} deaths in less than '
-                                       f'{myconfig.DEATHLOOP_SECONDS} seconds, with no player activity')
-
-            # get the list of eqgame.exe process ID's
-            pid_list = get_eqgame_pid_list()
+            EverquestLogFile.starprint(f'    {rule.description}')
             EverquestLogFile.starprint('Death Messages:')
-            for line in self._death_list:
-                EverquestLogFile.starprint('    ' + line)
-            EverquestLogFile.starprint(f'eqgame.exe process id list = {pid_list}')
-
-            # kill the eqgame.exe process / processes
-            for pid in pid_list:
-                EverquestLogFile.starprint(f'Killing process [{pid}]')
-
-                # for testing the actual kill process using simulated player deaths, uncomment the following line
-                # self._kill_armed = True
-                if self._kill_armed:
-                    os.kill(pid, signal.SIGTERM)
+            for epoch, line in rule.window:
+                EverquestLogFile.starprint('    ' + self.decode(line))
+            EverquestLogFile.starprint(f'eqgame.exe process id list = {list(executor.owner_of(self.filename) or executor.targets)}')
 
-            # purge any death messages from the list
+            # purge any death messages from the windows
             self.reset()
+            EventPublisher.publish(EventPublisher.DEATH_COUNT, epoch, self.death_count())
 
 
 #################################################################################################
@@ -224,45 +427,55 @@ class DeathLoopVaccine(EverquestLogFile.EverquestLogFile):
 # standalone functions
 #
 
+# shared, background-refreshed cache of eqgame.exe process ID's, and the shared kill executor, created on first use
+_eqgame_finder = None
+_kill_executor = None
+
+
 def get_eqgame_pid_list() -> list[int]:
     """
     get list of process ID's for eqgame.exe.
     returns a list of process ID's (in case multiple versions of eqgame.exe are somehow running)
 
+    the list comes from a cache which is refreshed in the background, and each process is
+    checked to still be running before the list is returned
+
     :return: list of process ID integers
     """
-    pid_list = list()
-
-    # use wmic utility to get list of processes
-    # data comes back in a binary block, with individual lines separated by b'\r\r\n'
-    # the output of this can be seen by entering 'wmic process list brief' at the command line
-    lines = subprocess.check_output(['wmic', 'process', 'list', 'brief'])
-
-    # split the block into individual lines
-    line_list = lines.split(b'\r\r\n')
-
-    # get each line, and then split it into components
-    # 0: HandleCount
-    # 1: Name
-    # 2: Priority
-    # 3: ProcessId
-    # 4: ThreadCount
-    # 5: WorkingSetSize
-    for line in line_list:
-        # now split each line into fields
-        field_list = line.split()
-        if len(field_list) == 6:
-            if field_list[1] == b'eqgame.exe':
-                # print(f'{str(field_list[1], "utf-8)")}, {int(field_list[3])}')
-                pid_list.append(int(field_list[3]))
-
-    return pid_list
+    global _eqgame_finder
+    if _eqgame_finder is None:
+        _eqgame_finder = ProcessFinder.CachedProcessFinder(ProcessFinder.create_finder('eqgame.exe'))
+        _eqgame_finder.start()
+    return _eqgame_finder.pid_list()
+
+
+def get_kill_executor() -> KillExecutor.KillExecutor:
+    """
+    get the shared kill executor, pre-armed with the eqgame.exe process ID's.
+    it is created and started on first use
+
+    :return: the running KillExecutor
+    """
+    global _kill_executor
+    if _kill_executor is None:
+        get_eqgame_pid_list()
+        _kill_executor = KillExecutor.KillExecutor(_eqgame_finder)
+        _kill_executor.start()
+    return _kill_executor
 
 
 #################################################################################################
 
 
 def main():
+    # how much goes to the console, e.g. not every log line
+    level = getattr(ConsoleWriter, str(myconfig.CONSOLE_VERBOSITY).upper(), None)
+    if level in (ConsoleWriter.QUIET, ConsoleWriter.NORMAL, ConsoleWriter.VERBOSE):
+        ConsoleWriter.set_verbosity(level)
+    else:
+        EverquestLogFile.starprint(f'Unknown CONSOLE_VERBOSITY [{myconfig.CONSOLE_VERBOSITY}], '
+                                   f'choose from QUIET, NORMAL or VERBOSE')
+
     EverquestLogFile.starprint('-------------------------------------------------')
     EverquestLogFile.starprint('DeathLoopVaccine - Help prevent DeathLoop disease')
     EverquestLogFile.starprint('-------------------------------------------------')
@@ -271,13 +484,50 @@ def main():
                                f'{myconfig.DEATHLOOP_SECONDS} seconds, '
                                f'with no player activity in the interim (AFK)')
 
-    # create and start the DLV parser
-    dlv = DeathLoopVaccine()
-    dlv.go()
-
-    # note that as soon as the main thread ends, so will the child threads
-    while True:
-        pass
+    # start the metrics endpoint, if configured
+    try:
+        Metrics.start_server(myconfig.METRICS_PORT)
+    except OSError as err:
+        EverquestLogFile.starprint(f'Unable to start metrics endpoint on port {myconfig.METRICS_PORT}: {err}')
+
+    # start the event stream for external tools, if configured
+    try:
+        if EventPublisher.start_publisher(myconfig.EVENT_PORT, myconfig.EVENT_SOCKET):
+            EverquestLogFile.starprint('Streaming events on [{}]'.format(EventPublisher.get_publisher().address))
+    except OSError as err:
+        EverquestLogFile.starprint(f'Unable to start event publisher: {err}')
+
+    # start the background eqgame.exe process list cache, and the kill executor, so they are ready before they are needed
+    get_kill_executor()
+
+    # on-demand profiling, started by SIGUSR1 or the control file in the logs directory
+    profiler = Profiler.Profiler()
+    profiler.add_stage('classify', DeathLoopVaccine, 'classify')
+    profiler.install_signal_handler()
+    profiler.start()
+
+    # create and start the DLV parser, either for the latest log file, or for every active log file
+    if myconfig.MONITOR_ALL_LOGS:
+        dlv = MultiLogFile.MultiLogFile(DeathLoopVaccine)
+    else:
+        dlv = DeathLoopVaccine()
+
+    # block, without using any CPU, until Ctrl-C or SIGTERM, then shut down cleanly
+    # a MultiLogFile keeps looking for active logs, but a single log parser with no log has nothing to do
+    supervisor = EverquestLogFile.Supervisor(dlv)
+    supervisor.install_signal_handlers()
+    started = supervisor.start() or dlv.is_alive()
+    if started:
+        supervisor.join()
+
+    # write out any profile in progress
+    profiler.shutdown()
+    profiler.join()
+    if not started:
+        EverquestLogFile.starprint('DeathLoopVaccine - unable to start parsing, exiting')
+        ConsoleWriter.flush()
+        sys.exit(1)
+    EverquestLogFile.starprint('DeathLoopVaccine - shut down')
 
 
 if __name__ == '__main__':
@@ -0,0 +1,266 @@
+import locale
+import re
+
+import EverquestLogFile
+
+
+#
+# detector plugins, with prefix-indexed dispatch.
+#
+# A detector declares the message prefixes it cares about (the text just past the leading
+# date-time stamp), and optionally a regular expression to be matched at the same position.
+# The registry indexes every prefix by its first word, so each line costs one dictionary
+# lookup on its own first word, and is only offered to the detectors which could match it,
+# however many detectors are registered.
+#
+# Only prefixes which contain a space can be indexed by their first word, since that word is then known
+# to be complete.  Any other prefix, e.g. 'Yo', or a name which may be followed by punctuation, as in
+# "Soandso's corpse", is checked against every line instead, with a plain startswith().
+#
+# Detectors which declare a pattern but no prefixes cannot be indexed, and are offered every line.
+#
+# Lines read in bytes mode are dispatched with dispatch_bytes(), which looks up the raw first word
+# in a parallel index of encoded prefixes, and only decodes the line when some detector could match it.
+# Detectors themselves always see decoded lines.
+#
+# New detector classes are made available to every DetectorRegistry.from_registered() call with
+# the @register_detector class decorator.
+#
+
+# list of detector classes registered with @register_detector
+_registered_classes = list()
+
+
+class Detector:
+    """
+    base class for the detector plugins
+    """
+
+    # message prefixes this detector cares about
+    prefixes = ()
+
+    # optional regular expression, matched against the message text.  if prefixes are also given,
+    # the pattern is only tried on lines which begin with one of them
+    pattern = None
+
+    def __init__(self) -> None:
+        """
+        ctor
+        """
+        self._match = re.compile(self.pattern).match if self.pattern else None
+
+    def offer(self, elf: EverquestLogFile.EverquestLogFile, line: str) -> bool:
+        """
+        called by the registry for each line which begins with one of the prefixes.
+        checks the pattern, if there is one, and calls detect() on a match
+
+        :param elf: EverquestLogFile object which read the line
+        :param line: string with a single line from the logfile
+        :return: True if the line was detected
+        """
+        m = None
+        if self._match:
+            m = self._match(line, EverquestLogFile.MESSAGE_OFFSET)
+            if not m:
+                return False
+        self.detect(elf, line, m)
+        return True
+
+    def detect(self, elf: EverquestLogFile.EverquestLogFile, line: str, m: re.Match or None) -> None:
+        """
+        virtual method, to be overridden in derived classes to act on a detected line
+
+        :param elf: EverquestLogFile object which read the line
+        :param line: string with a single line from the logfile
+        :param m: regular expression match object, or None if the detector has no pattern
+        """
+        raise NotImplementedError
+
+
+class DetectorRegistry:
+    """
+    class to hold a set of detectors, and dispatch each line to only those detectors
+    which could match it
+    """
+
+    def __init__(self) -> None:
+        """
+        ctor
+        """
+        self._detectors = list()
+
+        # dictionary of first word: list of (prefix, detector) tuples
+        self._index = dict()
+
+        # the same, with the first words and prefixes encoded, for bytes mode
+        self.encoding = locale.getpreferredencoding(False)
+        self._bytes_index = dict()
+
+        # list of (prefix, detector) tuples, for the prefixes which can't be indexed, and the same encoded
+        self._scanned = list()
+        self._bytes_scanned = list()
+
+        # detectors with no prefixes, which are offered every line
+        self._unindexed = list()
+
+    @classmethod
+    def from_registered(cls):
+        """
+        :return: a DetectorRegistry holding one instance of every class registered with @register_detector
+        """
+        rv = cls()
+        for detector_class in _registered_classes:
+            rv.register(detector_class())
+        return rv
+
+    def register(self, detector: Detector) -> Detector:
+        """
+        add a detector
+
+        :param detector: Detector object
+        :return: the detector
+        """
+        self._detectors.append(detector)
+        self._rebuild()
+        return detector
+
+    def unregister(self, detector: Detector) -> None:
+        """
+        remove a detector
+
+        :param detector: Detector object
+        """
+        self._detectors.remove(detector)
+        self._rebuild()
+
+    def _rebuild(self) -> None:
+        """
+        rebuild the first word index
+        """
+        index = dict()
+        bytes_index = dict()
+        scanned = list()
+        bytes_scanned = list()
+        unindexed = list()
+        for detector in self._detectors:
+            if detector.prefixes:
+                for prefix in detector.prefixes:
+                    first_word, space, rest = prefix.partition(' ')
+                    if first_word and space:
+                        index.setdefault(first_word, list()).append((prefix, detector))
+                        bytes_index.setdefault(first_word.encode(self.encoding), list()).append(
+                            (prefix.encode(self.encoding), detector))
+                    else:
+                        scanned.append((prefix, detector))
+                        bytes_scanned.append((prefix.encode(self.encoding), detector))
+            else:
+                unindexed.append(detector)
+        self._index = index
+        self._bytes_index = bytes_index
+        self._scanned = scanned
+        self._bytes_scanned = bytes_scanned
+        self._unindexed = unindexed
+
+    def __len__(self) -> int:
+        return len(self._detectors)
+
+    def dispatch(self, elf: EverquestLogFile.EverquestLogFile, line: str) -> int:
+        """
+        offer the line to the detectors which could match it
+
+        :param elf: EverquestLogFile object which read the line
+        :param line: string with a single line from the logfile
+        :return: number of detectors which detected the line
+        """
+        rv = 0
+        offset = EverquestLogFile.MESSAGE_OFFSET
+
+        end = line.find(' ', offset)
+        candidates = self._index.get(line[offset:end] if end >= 0 else line[offset:])
+        if candidates:
+            for prefix, detector in candidates:
+                if line.startswith(prefix, offset) and detector.offer(elf, line):
+                    rv += 1
+
+        for prefix, detector in self._scanned:
+            if line.startswith(prefix, offset) and detector.offer(elf, line):
+                rv += 1
+
+        for detector in self._unindexed:
+            if detector.offer(elf, line):
+                rv += 1
+
+        return rv
+
+    def dispatch_bytes(self, elf: EverquestLogFile.EverquestLogFile, line: bytes) -> int:
+        """
+        offer a raw line, read in bytes mode, to the detectors which could match it.
+        the line is only decoded if there are any such detectors
+
+        :param elf: EverquestLogFile object which read the line
+        :param line: bytes with a single line from the logfile
+        :return: number of detectors which detected the line
+        """
+        rv = 0
+        text = None
+        offset = EverquestLogFile.MESSAGE_OFFSET
+
+        end = line.find(b' ', offset)
+        candidates = self._bytes_index.get(line[offset:end] if end >= 0 else line[offset:])
+        if candidates:
+            for prefix, detector in candidates:
+                if line.startswith(prefix, offset):
+                    if text is None:
+                        text = elf.decode(line)
+                    if detector.offer(elf, text):
+                        rv += 1
+
+        for prefix, detector in self._bytes_scanned:
+            if line.startswith(prefix, offset):
+                if text is None:
+                    text = elf.decode(line)
+                if detector.offer(elf, text):
+                    rv += 1
+
+        if self._unindexed:
+            if text is None:
+                text = elf.decode(line)
+            for detector in self._unindexed:
+                if detector.offer(elf, text):
+                    rv += 1
+
+        return rv
+
+
+#################################################################################################
+#
+# standalone functions
+#
+
+def register_detector(detector_class):
+    """
+    class decorator, which makes the detector class available to DetectorRegistry.from_registered()
+
+    :param detector_class: Detector child class
+    :return: the detector class
+    """
+    _registered_classes.append(detector_class)
+    return detector_class
+
+
+#################################################################################################
+#
+# built-in detectors
+#
+
+@register_detector
+class SummonedDetector(Detector):
+    """
+    the player has been summoned, e.g. by a mob.  often the first step towards a death loop
+    """
+
+    prefixes = ('You have been summoned',)
+
+    def detect(self, elf, line, m) -> None:
+        EverquestLogFile.starprint(f'[{elf.char_name}] Summoned: {line}')
+
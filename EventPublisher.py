@@ -0,0 +1,485 @@
+import argparse
+import collections
+import errno
+import locale
+import os
+import selectors
+import socket
+import stat
+import struct
+import sys
+import threading
+import time
+
+import myconfig
+import ConsoleWriter
+import Metrics
+
+
+#
+# local event stream, for external tools (overlays, timers, chat bridges) which want to know what the
+# vaccine knows, without tailing and pattern matching the log themselves.
+#
+# The parser thread hands each event to publish(), which only appends it to a bounded in-memory queue,
+# so the parser never waits on a socket.  A background publisher thread takes everything queued since it
+# last woke, up to MAX_FRAME_EVENTS, encodes it as one frame, and writes the frame to every connected
+# client with non-blocking sends.  Under bursty load many events therefore share one frame, and one send
+# per client.
+#
+# When a client has more than CLIENT_BUFFER_BYTES unsent, the publisher gives it CATCH_UP_SECONDS to catch
+# up, which is plenty for a client which is reading, before carrying on without it.  From then on, until it
+# does catch up, it misses the frames published (they are counted as dropped), while every other client
+# carries on receiving them, and a client which stays that far behind for SLOW_CLIENT_SECONDS is
+# disconnected.  If the publisher thread itself can't keep up, the oldest events in the queue are dropped
+# (and counted).
+#
+# The listening socket is a Unix-domain socket, if a path is configured and the platform supports it,
+# else a TCP socket on the loopback interface.  An existing socket at the path, e.g. left behind by a
+# crash, is replaced, but any other kind of file is left alone, and the publisher fails to start.
+# Clients only ever read.
+#
+# Wire format, all integers big-endian:
+#
+#   frame:  uint32 payload length, then the payload, which is one or more events back to back
+#   event:  uint8 kind, int64 epoch, int32 value, uint16 text length, then the text, UTF-8
+#
+# The epoch is the log line date-time stamp, in the same convention as TimestampParser, i.e. local
+# time treated as UTC.  The meaning of the value and the text depends on the kind:
+#
+#   DEATH:              value 1 for a test death, else 0.  text is the log line
+#   AFK_BREAKER:        value unused.  text is the log line
+#   DEATH_COUNT:        value is the new number of deaths in the death loop window.  text unused
+#   KILL:               value 1 if the kill was armed, else 0.  text is the rule description
+#   HEARTBEAT_ROLLOVER: value 1 if a log went inactive and was dropped (multi-log mode only), else 0.
+#                       text is the character name of the newly opened, or dropped, log
+#
+# usage:
+#
+#   python EventPublisher.py [--port PORT | --socket PATH]
+#
+# connects to a running publisher, and prints the events as they arrive
+#
+
+# event kinds
+DEATH = 1
+AFK_BREAKER = 2
+DEATH_COUNT = 3
+KILL = 4
+HEARTBEAT_ROLLOVER = 5
+KIND_NAMES = {DEATH: 'death', AFK_BREAKER: 'afk-breaker', DEATH_COUNT: 'death-count', KILL: 'kill',
+              HEARTBEAT_ROLLOVER: 'heartbeat-rollover'}
+
+_FRAME_HEADER = struct.Struct('!I')
+_EVENT_HEADER = struct.Struct('!BqiH')
+MAX_TEXT_BYTES = 0xFFFF
+
+# maximum number of events queued by the parser thread, before the oldest are dropped
+MAX_PENDING_EVENTS = 65536
+
+# maximum number of events per frame
+MAX_FRAME_EVENTS = 4096
+
+# number of unsent bytes held for a client, beyond which it misses further frames until it catches up
+CLIENT_BUFFER_BYTES = 256 * 1024
+
+# number of seconds the publisher waits for a client which is that far behind, before carrying on without it
+CATCH_UP_SECONDS = 0.25
+
+# number of seconds a client may stay that far behind, before it is disconnected
+SLOW_CLIENT_SECONDS = 5.0
+
+
+class EventPublisher(threading.Thread):
+    """
+    class to stream events to the connected clients, from a background thread
+    """
+
+    def __init__(self, port: int = 0, path: str = None) -> None:
+        """
+        ctor
+
+        :param port: TCP port on the loopback interface, used if there is no path
+        :param path: Unix-domain socket path, None or empty to use the TCP port.
+                     ignored on platforms without Unix-domain sockets
+        :raises OSError: if the socket can't be created, e.g. if the path exists, and is not a socket
+        """
+        # parent ctor
+        # the daemon=True parameter causes this child thread object to terminate
+        # when the parent thread terminates
+        super().__init__(daemon=True)
+
+        self.encoding = locale.getpreferredencoding(False)
+        self.path = path if path and hasattr(socket, 'AF_UNIX') else None
+        if self.path:
+            try:
+                mode = os.lstat(self.path).st_mode
+            except FileNotFoundError:
+                pass
+            else:
+                if not stat.S_ISSOCK(mode):
+                    raise FileExistsError(errno.EEXIST, 'File exists, and is not a socket', self.path)
+                os.unlink(self.path)
+            self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.listener.bind(self.path)
+        else:
+            self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.listener.bind(('127.0.0.1', port))
+        self.listener.listen()
+        self.listener.setblocking(False)
+        self.address = self.listener.getsockname()
+
+        # events queued by the parser thread.  deque appends and pops are thread safe
+        self._pending = collections.deque(maxlen=MAX_PENDING_EVENTS)
+
+        # socket pair used to wake the publisher thread, and a flag so the parser thread only
+        # sends one wake byte per batch, rather than one per event
+        self._wake_recv, self._wake_send = socket.socketpair()
+        self._wake_recv.setblocking(False)
+        self._wake_send.setblocking(False)
+        self._signalled = False
+
+        # dictionary of client socket: unsent bytes, and of client socket: time it fell behind, for slow clients.
+        # dropped counts the events dropped from the queue, and those missed by clients which fell behind
+        self._clients = dict()
+        self._stalled = dict()
+        self.dropped = 0
+        self._selector = selectors.DefaultSelector()
+        self._shutdown = threading.Event()
+
+    def publish(self, kind: int, epoch: int, value: int = 0, text: str or bytes = '') -> None:
+        """
+        queue an event for the clients.  never blocks, and safe to call from any thread
+
+        :param kind: event kind, e.g. DEATH
+        :param epoch: event time, epoch seconds
+        :param value: integer value, depending on the kind
+        :param text: text, depending on the kind.  raw bytes are decoded by the publisher thread
+        """
+        pending = self._pending
+        if len(pending) == MAX_PENDING_EVENTS:
+            self.dropped += 1
+            Metrics.PUBLISHER_DROPPED_EVENTS.inc()
+        pending.append((kind, epoch, value, text))
+        if not self._signalled:
+            self._signalled = True
+            try:
+                self._wake_send.send(b'\0')
+            except OSError:
+                pass
+
+    def shutdown(self) -> None:
+        """
+        end the publisher thread, and disconnect the clients.  safe to call from any thread
+        """
+        self._shutdown.set()
+        try:
+            self._wake_send.send(b'\0')
+        except OSError:
+            pass
+
+    def client_count(self) -> int:
+        return len(self._clients)
+
+    def encode(self, events: list[tuple]) -> bytes:
+        """
+        encode a batch of events as one frame
+
+        :param events: list of (kind, epoch, value, text) tuples
+        :return: frame bytes
+        """
+        parts = list()
+        for kind, epoch, value, text in events:
+            if isinstance(text, bytes):
+                text = text.decode(self.encoding, errors='ignore')
+            data = text.encode('utf-8')[:MAX_TEXT_BYTES]
+            parts.append(_EVENT_HEADER.pack(kind, epoch, value, len(data)))
+            parts.append(data)
+        payload = b''.join(parts)
+        return _FRAME_HEADER.pack(len(payload)) + payload
+
+    def _accept(self) -> None:
+        """
+        accept any waiting client connections
+        """
+        while True:
+            try:
+                client, address = self.listener.accept()
+            except OSError:
+                # includes BlockingIOError, once there are no more waiting
+                return
+            client.setblocking(False)
+            self._clients[client] = bytearray()
+            self._selector.register(client, selectors.EVENT_READ)
+            Metrics.PUBLISHER_CLIENTS.set(len(self._clients))
+
+    def _disconnect(self, client: socket.socket) -> None:
+        """
+        drop a client connection
+        """
+        self._clients.pop(client, None)
+        self._stalled.pop(client, None)
+        try:
+            self._selector.unregister(client)
+        except (KeyError, ValueError):
+            pass
+        client.close()
+        Metrics.PUBLISHER_CLIENTS.set(len(self._clients))
+
+    def _send(self, client: socket.socket) -> None:
+        """
+        send as much of a client's buffered output as it will take without blocking
+        """
+        buffer = self._clients[client]
+        try:
+            sent = client.send(buffer)
+        except (BlockingIOError, InterruptedError):
+            sent = 0
+        except OSError:
+            self._disconnect(client)
+            return
+        del buffer[:sent]
+
+        # note when the client falls behind, and when it catches up
+        if len(buffer) < CLIENT_BUFFER_BYTES:
+            self._stalled.pop(client, None)
+        elif client not in self._stalled:
+            self._stalled[client] = time.monotonic()
+
+        # only ask to be told when the client can take more, if there is more to send
+        self._selector.modify(client, selectors.EVENT_READ | selectors.EVENT_WRITE if buffer else selectors.EVENT_READ)
+
+    def _drop_slow_clients(self) -> None:
+        """
+        disconnect the clients which have been too far behind for too long
+        """
+        now = time.monotonic()
+        for client, since in list(self._stalled.items()):
+            if now - since > SLOW_CLIENT_SECONDS:
+                Metrics.PUBLISHER_SLOW_DISCONNECTS.inc()
+                self._disconnect(client)
+
+    def _catch_up_seconds(self) -> float:
+        """
+        :return: number of seconds left to wait for the clients which have just fallen behind, 0 if none have
+        """
+        if not self._stalled:
+            return 0.0
+        return max(0.0, max(self._stalled.values()) + CATCH_UP_SECONDS - time.monotonic())
+
+    def _drain(self) -> None:
+        """
+        take the events queued by the parser thread, up to MAX_FRAME_EVENTS, and buffer them as one frame for every
+        client, except those which are still too far behind after CATCH_UP_SECONDS
+        """
+        pending = self._pending
+        events = list()
+        while pending and len(events) < MAX_FRAME_EVENTS:
+            events.append(pending.popleft())
+        if not events or not self._clients:
+            return
+
+        frame = self.encode(events)
+        Metrics.PUBLISHED_EVENTS.inc(len(events))
+        for client, buffer in list(self._clients.items()):
+            if len(buffer) >= CLIENT_BUFFER_BYTES:
+                self.dropped += len(events)
+                Metrics.PUBLISHER_DROPPED_EVENTS.inc(len(events))
+                continue
+            buffer += frame
+            self._send(client)
+
+    def run(self) -> None:
+        """
+        override the thread.run() method
+        this method will execute in its own thread
+        """
+        self._selector.register(self.listener, selectors.EVENT_READ)
+        self._selector.register(self._wake_recv, selectors.EVENT_READ)
+
+        # run until shutdown
+        try:
+            while not self._shutdown.is_set():
+
+                # take the next batch of events, unless some client has only just fallen behind.  a client
+                # which stays behind only holds up itself
+                catch_up_seconds = 0.0
+                if self._stalled:
+                    self._drop_slow_clients()
+                    catch_up_seconds = self._catch_up_seconds()
+                if self._pending and not catch_up_seconds:
+                    self._drain()
+
+                # if there are more events waiting, only check the sockets, or wait for the client catching up.
+                # if some client is behind, wake up in time to see whether it has been too slow
+                timeout = None
+                if self._pending:
+                    timeout = catch_up_seconds
+                elif self._stalled:
+                    timeout = SLOW_CLIENT_SECONDS / 4
+
+                for key, mask in self._selector.select(timeout):
+                    sock = key.fileobj
+                    if sock is self.listener:
+                        self._accept()
+                    elif sock is self._wake_recv:
+                        # clear the flag before the events are taken, so anything queued after this sends a fresh wake byte
+                        self._signalled = False
+                        try:
+                            self._wake_recv.recv(4096)
+                        except (BlockingIOError, InterruptedError):
+                            pass
+                    elif sock in self._clients:
+                        if mask & selectors.EVENT_READ:
+                            # clients are not expected to send anything, so this is usually the connection closing
+                            try:
+                                if not sock.recv(4096):
+                                    self._disconnect(sock)
+                                    continue
+                            except (BlockingIOError, InterruptedError):
+                                pass
+                            except OSError:
+                                self._disconnect(sock)
+                                continue
+                        if mask & selectors.EVENT_WRITE:
+                            self._send(sock)
+
+        # all done
+        finally:
+            for client in list(self._clients):
+                self._disconnect(client)
+            self._selector.close()
+            self.listener.close()
+            self._wake_recv.close()
+            self._wake_send.close()
+            if self.path:
+                try:
+                    os.unlink(self.path)
+                except OSError:
+                    pass
+
+
+#################################################################################################
+#
+# standalone functions
+#
+
+# the shared publisher, if one has been started
+_publisher = None
+
+
+def start_publisher(port: int, path: str = None) -> EventPublisher or None:
+    """
+    start the shared event publisher, which publish() then hands events to
+
+    :param port: TCP port on the loopback interface, or 0 / None to not start the publisher, unless there is a path
+    :param path: Unix-domain socket path, used instead of the port if given, and supported
+    :return: the running EventPublisher, or None
+    """
+    global _publisher
+    if not port and not path:
+        return None
+    publisher = EventPublisher(port or 0, path)
+    publisher.start()
+    _publisher = publisher
+    return publisher
+
+
+def get_publisher() -> EventPublisher or None:
+    """
+    :return: the shared publisher, or None if none has been started
+    """
+    return _publisher
+
+
+def publish(kind: int, epoch: int, value: int = 0, text: str or bytes = '') -> None:
+    """
+    queue an event on the shared publisher.  never blocks, and costs next to nothing if there is no publisher
+
+    :param kind: event kind, e.g. DEATH
+    :param epoch: event time, epoch seconds
+    :param value: integer value, depending on the kind
+    :param text: text, depending on the kind
+    """
+    publisher = _publisher
+    if publisher is not None:
+        publisher.publish(kind, epoch, value, text)
+
+
+def is_enabled() -> bool:
+    """
+    :return: True if there is a shared publisher, so callers can skip working out events nobody will see
+    """
+    return _publisher is not None
+
+
+def decode_frame(payload: bytes) -> list[tuple[int, int, int, str]]:
+    """
+    decode the payload of one frame
+
+    :param payload: frame payload, without the length prefix
+    :return: list of (kind, epoch, value, text) tuples
+    """
+    rv = list()
+    pos = 0
+    while pos < len(payload):
+        kind, epoch, value, length = _EVENT_HEADER.unpack_from(payload, pos)
+        pos += _EVENT_HEADER.size
+        rv.append((kind, epoch, value, payload[pos:pos + length].decode('utf-8', errors='replace')))
+        pos += length
+    return rv
+
+
+def read_events(sock: socket.socket):
+    """
+    read the events from a connection to a publisher, until it closes
+
+    :param sock: connected socket
+    :return: generator of (kind, epoch, value, text) tuples
+    """
+    buffer = bytearray()
+    while True:
+        data = sock.recv(65536)
+        if not data:
+            return
+        buffer += data
+        while len(buffer) >= _FRAME_HEADER.size:
+            (length,) = _FRAME_HEADER.unpack_from(buffer)
+            end = _FRAME_HEADER.size + length
+            if len(buffer) < end:
+                break
+            yield from decode_frame(bytes(buffer[_FRAME_HEADER.size:end]))
+            del buffer[:end]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Print the events streamed by a running DeathLoopVaccine')
+    parser.add_argument('--port', type=int, default=None, help='TCP port on the loopback interface')
+    parser.add_argument('--socket', default=None, help='Unix-domain socket path')
+    args = parser.parse_args()
+
+    # default to the configured address
+    port, path = args.port, args.socket
+    if port is None and path is None:
+        port, path = myconfig.EVENT_PORT, myconfig.EVENT_SOCKET
+
+    try:
+        if path and hasattr(socket, 'AF_UNIX'):
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(path)
+        else:
+            sock = socket.create_connection(('127.0.0.1', port))
+        with sock:
+            for kind, epoch, value, text in read_events(sock):
+                stamp = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(epoch))
+                print(f'{stamp}  {KIND_NAMES.get(kind, kind):<20} {value:>4}  {text}', flush=True)
+
+    except KeyboardInterrupt:
+        pass
+    except OSError as err:
+        ConsoleWriter.write(f'ERROR: {err}', ConsoleWriter.QUIET)
+        ConsoleWriter.flush()
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,16 +1,28 @@
-import glob
+import datetime
+import locale
 import os
-import re
+import signal
 import threading
 import time
 
 import myconfig
+import ConsoleWriter
+import EventPublisher
+import LogFileWaiter
+import LogDirectoryIndex
+import Metrics
 
 
 # allow for testing, by forcing the bot to read an old log file
 TEST_ELF = False
 # TEST_ELF = True
 
+# length of the '[Ddd Mmm dd HH:MM:SS YYYY]' date-time stamp at the start of every line
+STAMP_LENGTH = 26
+
+# offset of the message text, just past the date-time stamp and the space after it
+MESSAGE_OFFSET = STAMP_LENGTH + 1
+
 
 class EverquestLogFile(threading.Thread):
     """
@@ -19,7 +31,8 @@ class EverquestLogFile(threading.Thread):
     child class that needs log parsing abilities.
 
     The custom log parsing logic in the child class is accomplished by
-    overloading the process_line() method
+    overloading the process_line() method, or the process_lines() method to
+    handle each batch of lines in one call
     """
 
     # type-hint reference to base class data member _started, to quiet PEP warning
@@ -43,12 +56,48 @@ class EverquestLogFile(threading.Thread):
         self.filename = self.build_filename(self.char_name)
         self.file = None
 
+        # the file is read in binary mode, in large blocks, and only complete lines are
+        # decoded and handed out.  any trailing partial line is carried over to the next read
+        self.encoding = locale.getpreferredencoding(False)
+        self.read_size = 64 * 1024
+        self._partial = b''
+
+        # in bytes mode, lines are handed out as raw bytes, without decoding, and it is up to
+        # process_line() to decode only the few lines which need it, e.g. with decode().
+        # this only pays off when the lines are not all echoed to the console
+        self.bytes_mode = False
+
+        # maximum number of bytes read backwards from the end of the file by a backfill
+        self.backfill_max_bytes = 16 * 1024 * 1024
+
         self._parsing = threading.Event()
         self._parsing.clear()
 
+        # set by shutdown() to end the parsing thread, and an event to wake the thread
+        # while it is idle, i.e. not parsing
+        self._shutdown = threading.Event()
+        self._wakeup = threading.Event()
+
         self.prevtime = time.time()
         self.heartbeat = myconfig.HEARTBEAT
 
+        # cached index of the log files in the logs directory
+        self.directory_index = LogDirectoryIndex.LogDirectoryIndex(self.base_directory + self.logs_directory,
+                                                                   self.server_name)
+
+        # parsing metrics for the current character, set up in open()
+        self._lines_metric = None
+        self._lines_per_second_metric = None
+        self._lag_bytes_metric = None
+        self._lag_seconds_metric = None
+        self._metrics_parser = TimestampParser()
+        self._rate_start = time.time()
+        self._rate_count = 0
+
+        # strategy used to block until the log file grows, created when the first file is opened,
+        # unless one has been assigned already (e.g. shared by several log files)
+        self.waiter = None
+
     def build_filename(self, charname: str) -> str:
         """
         build the file name.
@@ -60,11 +109,21 @@ class EverquestLogFile(threading.Thread):
         rv = self.base_directory + self.logs_directory + 'eqlog_' + charname + '_' + self.server_name + '.txt'
         return rv
 
+    def parse_charname(self, filename: str) -> str or None:
+        """
+        extract the character name from a log filename
+
+        :param filename: full log filename
+        :return: character name, or None if the filename is not a log file for this server
+        """
+        return self.directory_index.parse_charname(os.path.basename(filename))
+
     def set_parsing(self) -> None:
         """
         called when parsing is active
         """
         self._parsing.set()
+        self._wakeup.set()
 
     def clear_parsing(self) -> None:
         """
@@ -87,22 +146,16 @@ class EverquestLogFile(threading.Thread):
         :param seek_end:  True if parsing is to begin at the end of the file, False if at the beginning
         :return: True if a new file was opened, False otherwise
         """
-        # get a list of all log files, and sort on mod time, latest at top
-        mask = self.base_directory + self.logs_directory + 'eqlog_*_' + self.server_name + '.txt'
-        files = glob.glob(mask)
-        files.sort(key=os.path.getmtime, reverse=True)
+        # find the log file with the latest mod time, and the character name from the filename.  this is
+        # only called at startup, or once the heartbeat has expired with the followed log idle, i.e. just when
+        # a previously played character may have logged in, so every log file is checked, not just this one
+        latest = self.directory_index.latest(full=True)
 
-        # todo foo - what if there are no files in the list?
-        latest_file = files[0]
+        # no log files at all, so nothing to open
+        if latest is None:
+            return False
 
-        # extract the character name from the filename
-        # note that windows pathnames must use double-backslashes in the pathname
-        # note that backslashes in regular expressions are double-double-backslashes
-        # this expression replaces double \\ with quadruple \\\\, as well as the filename mask asterisk to a
-        # named regular expression
-        charname_regexp = mask.replace('\\', '\\\\').replace('eqlog_*_', 'eqlog_(?P<charname>[\\w ]+)_')
-        m = re.match(charname_regexp, latest_file)
-        char_name = m.group('charname')
+        latest_file, char_name = latest
 
         rv = False
 
@@ -127,7 +180,8 @@ class EverquestLogFile(threading.Thread):
     def open(self, charname: str, filename: str, seek_end=True) -> bool:
         """
         open the file.
-        seek file position to end of file if passed parameter 'seek_end' is true
+        seek file position to end of file if passed parameter 'seek_end' is true,
+        and in that case give the child class a chance to backfill its state from the recent log
 
         :param charname: character name whose log file is to be opened
         :param filename: full log filename
@@ -135,12 +189,29 @@ class EverquestLogFile(threading.Thread):
         :return: True if a new file was opened, False otherwise
         """
         try:
-            self.file = open(filename, 'r', errors='ignore')
+            if self.waiter is None:
+                self.waiter = LogFileWaiter.create_waiter()
+            self.file = open(filename, 'rb')
+            self._partial = b''
             if seek_end:
-                self.file.seek(0, os.SEEK_END)
+                # any unterminated last line is still being written, so keep it for the first read
+                self._partial = self.read_partial_tail(self.file.seek(0, os.SEEK_END))
+            self.waiter.watch(filename)
 
             self.char_name = charname
             self.filename = filename
+            self._lines_metric = Metrics.LINES.labels(charname)
+            self._lines_per_second_metric = Metrics.LINES_PER_SECOND.labels(charname)
+            self._lag_bytes_metric = Metrics.TAIL_LAG_BYTES.labels(charname)
+            self._lag_seconds_metric = Metrics.TAIL_LAG_SECONDS.labels(charname)
+
+            # backfill before parsing is flagged as active, so the parsing thread is not yet reading
+            if seek_end:
+                try:
+                    self.backfill()
+                except OSError as err:
+                    starprint('Unable to backfill from log file: {0}'.format(err))
+
             self.set_parsing()
             return True
         except OSError as err:
@@ -152,19 +223,161 @@ class EverquestLogFile(threading.Thread):
         """
         close the file
         """
+        self.waiter.unwatch(self.filename)
         self.file.close()
         self.clear_parsing()
 
+        # the per-character metrics, so they do not pile up as characters come and go
+        for metric in (Metrics.LINES, Metrics.LINES_PER_SECOND, Metrics.TAIL_LAG_BYTES, Metrics.TAIL_LAG_SECONDS):
+            metric.remove(self.char_name)
+
     def readline(self) -> str or None:
         """
         get the next line
         :return: a string containing the next line, or None if no new lines to be read
         """
         if self.is_parsing():
-            return self.file.readline()
+            data = self.file.readline()
+            if not data.endswith(b'\n'):
+                # partial line, save it for later
+                self._partial += data
+                return ''
+            data = self._partial + data
+            self._partial = b''
+            return data.decode(self.encoding, errors='ignore').replace('\r\n', '\n')
         else:
             return None
 
+    def read_lines(self) -> list[str] or list[bytes]:
+        """
+        get all complete lines available in the next block of the file.
+        the lines are returned without their line terminators, and as bytes in bytes mode
+
+        :return: list of lines, empty if no new complete lines to be read
+        """
+        if not self.is_parsing():
+            return []
+
+        # keep reading blocks until we have at least one complete line, or run out of data
+        end = 0
+        while end == 0:
+            data = self.file.read(self.read_size)
+            if not data:
+                return []
+
+            # split off any trailing partial line, and save it for the next read
+            data = self._partial + data
+            end = data.rfind(b'\n') + 1
+            self._partial = data[end:]
+
+        if self.bytes_mode:
+            lines = data[:end].split(b'\n')
+            lines.pop()
+            if b'\r' in data:
+                lines = [line.rstrip(b'\r') for line in lines]
+            return lines
+
+        # a newline byte is always a character boundary, so decode all complete lines at once
+        text = data[:end].decode(self.encoding, errors='ignore')
+        if '\r' in text:
+            text = text.replace('\r\n', '\n')
+        lines = text.split('\n')
+        lines.pop()
+        return lines
+
+    def read_lines_reverse(self, end: int, block_size: int = 64 * 1024):
+        """
+        read the complete lines before a file offset, newest first, reading the file backwards in blocks.
+        at most self.backfill_max_bytes are read, and the file position is restored to 'end' afterwards,
+        when the generator is exhausted or closed
+
+        :param end: file offset, typically the end of the file.  any partial line just before it is skipped
+        :param block_size: number of bytes per read
+        :return: generator of lines, without line terminators, and as bytes in bytes mode
+        """
+        pos = end
+        tail = None
+        try:
+            while pos > 0 and end - pos < self.backfill_max_bytes:
+                size = min(block_size, pos)
+                pos -= size
+                self.file.seek(pos)
+                block = self.file.read(size)
+                pieces = block.split(b'\n')
+                if tail is None:
+                    # the piece after the last newline is a partial line, or empty
+                    if len(pieces) == 1:
+                        continue
+                    pieces.pop()
+                else:
+                    pieces[-1] += tail
+
+                # the first piece may be the end of an earlier line, so hold it until the next block
+                tail = pieces[0]
+                for piece in reversed(pieces[1:]):
+                    if piece:
+                        yield self.convert_line(piece)
+
+            # the very first line in the file
+            if pos == 0 and tail:
+                yield self.convert_line(tail)
+        finally:
+            self.file.seek(end)
+
+    def read_partial_tail(self, end: int, block_size: int = 64 * 1024) -> bytes:
+        """
+        read the unterminated partial line, if any, just before a file offset, i.e. everything after the
+        last newline.  at most self.backfill_max_bytes are read, and the file position is left at 'end'
+
+        :param end: file offset, typically the end of the file
+        :param block_size: number of bytes per read
+        :return: bytes of the partial line, empty if the file ends with a newline
+        """
+        pos = end
+        tail = b''
+        while pos > 0 and end - pos < self.backfill_max_bytes:
+            size = min(block_size, pos)
+            pos -= size
+            self.file.seek(pos)
+            block = self.file.read(size)
+            newline = block.rfind(b'\n')
+            if newline >= 0:
+                tail = block[newline + 1:] + tail
+                break
+            tail = block + tail
+        self.file.seek(end)
+        return tail
+
+    def convert_line(self, raw: bytes) -> str or bytes:
+        """
+        convert one raw line, without its newline, to the form handed to process_line(),
+        i.e. decoded, unless in bytes mode
+
+        :param raw: bytes of one line
+        :return: line, without line terminator
+        """
+        if self.bytes_mode:
+            return raw.rstrip(b'\r')
+        return raw.decode(self.encoding, errors='ignore').rstrip('\r')
+
+    def decode(self, line: str or bytes) -> str:
+        """
+        :param line: line from logfile, as bytes in bytes mode
+        :return: the line as a string
+        """
+        if isinstance(line, bytes):
+            return line.decode(self.encoding, errors='ignore')
+        return line
+
+    def backfill(self) -> None:
+        """
+        virtual method, to be overridden in derived classes which need to rebuild their state from the
+        recent contents of the log when a file is opened at its end, e.g. using read_lines_reverse().
+
+        Default behavior is to do nothing
+        """
+        pass
+
     def go(self) -> bool:
         """
         call this method to kick off the parsing thread
@@ -217,28 +430,50 @@ class EverquestLogFile(threading.Thread):
         """
         self.close()
 
+    def shutdown(self) -> None:
+        """
+        call this function to end the parsing thread for good, and close the file.
+        safe to call from any thread.  use join() to wait for the thread to finish
+        """
+        self._shutdown.set()
+        self._wakeup.set()
+        if self.waiter:
+            self.waiter.wake()
+
+        # if the thread never started, then there is no one else to close the file
+        if not self._started.is_set() and self.is_parsing():
+            self.close()
+
     def run(self) -> None:
         """
         override the thread.run() method
         this method will execute in its own thread
         """
-        # run forever
-        while True:
+        # run until shutdown
+        while not self._shutdown.is_set():
+
+            # not parsing, so sleep until go() or shutdown()
+            if not self.is_parsing():
+                self._wakeup.wait()
+                self._wakeup.clear()
 
             # process the log file lines here
-            if self.is_parsing():
+            else:
 
-                # read a line
-                line = self.readline()
+                # read a block of lines
+                lines = self.read_lines()
                 now = time.time()
-                if line:
+                if lines:
                     self.prevtime = now
 
-                    # process this line
-                    self.process_line(line)
+                    # process this batch of lines
+                    self.dispatch_lines(lines)
 
                 else:
 
+                    # how long to wait for the file to grow
+                    timeout = self.heartbeat
+
                     # don't check the heartbeat if we are just testing
                     if not TEST_ELF:
 
@@ -251,21 +486,169 @@ class EverquestLogFile(threading.Thread):
 
                             # attempt to open latest log file - returns True if a new logfile is opened
                             if self.open_latest():
+                                Metrics.HEARTBEAT_ROLLOVERS.inc()
+                                EventPublisher.publish(EventPublisher.HEARTBEAT_ROLLOVER,
+                                                       int(now + time.localtime(now).tm_gmtoff), 0, self.char_name)
                                 starprint('Now parsing character log for: [{}]'.format(self.char_name))
 
-                    # if we didn't read a line, pause just for a 100 msec blink
-                    time.sleep(0.1)
+                        # don't sleep past the next heartbeat check
+                        else:
+                            timeout = self.heartbeat - elapsed_seconds
+
+                    # if we didn't read a line, block until the file grows, or the heartbeat is due
+                    self.waiter.wait(timeout)
+
+        # all done
+        if self.is_parsing():
+            self.close()
+
+    def dispatch_lines(self, lines: list[str]) -> None:
+        """
+        hand a batch of lines to process_lines(), and update the parsing metrics.
+        the metrics are updated once per batch, so the cost per line is negligible
+
+        :param lines: list of lines from logfile to be processed
+        """
+        start = time.perf_counter()
+        self.process_lines(lines)
+        now = time.time()
+        count = len(lines)
+        Metrics.PROCESS_LINE_SECONDS.observe((time.perf_counter() - start) / count, count)
+        self._lines_metric.inc(count)
+
+        # lines per second, over the last second or so
+        self._rate_count += count
+        elapsed_seconds = now - self._rate_start
+        if elapsed_seconds >= 1.0:
+            self._lines_per_second_metric.set(self._rate_count / elapsed_seconds)
+            self._rate_start = now
+            self._rate_count = 0
+
+        # how far behind are we, in bytes and in log time.  log times are local, so compare to local wall clock
+        try:
+            self._lag_bytes_metric.set(os.fstat(self.file.fileno()).st_size - self.file.tell())
+            local_now = now + time.localtime(now).tm_gmtoff
+            self._lag_seconds_metric.set(local_now - self._metrics_parser.parse(lines[-1]))
+        except (OSError, ValueError):
+            pass
+
+    def process_lines(self, lines: list[str]) -> None:
+        """
+        virtual method, to be overridden in derived classes that want to handle
+        each batch of lines in one call.
+
+        Default behavior is to call process_line() for each line in the batch
+
+        :param lines: list of lines from logfile to be processed
+        """
+        process_line = self.process_line
+        for line in lines:
+            process_line(line)
 
     def process_line(self, line: str) -> None:
         """
         virtual method, to be overridden in derived classes to do whatever specialized
         parsing is required for that application.
 
-        Default behavior is to simply print() the line
+        Default behavior is to simply print the line, at VERBOSE level
+
+        :param line: line from logfile to be processed, as bytes in bytes mode
+        """
+        if self.bytes_mode:
+            # only decode the line if it is actually going to be printed
+            if ConsoleWriter.is_enabled(ConsoleWriter.VERBOSE):
+                ConsoleWriter.write(self.decode(line).rstrip(), ConsoleWriter.VERBOSE)
+        else:
+            ConsoleWriter.write(line.rstrip(), ConsoleWriter.VERBOSE)
+
+    def process_event(self, epoch: int or None, category: str, line: str) -> None:
+        """
+        virtual method, to be overridden in derived classes which can make use of a line which has
+        already been classified and time-stamped, e.g. by a shared LogEventBus reader.
+
+        Default behavior is to call process_line()
+
+        :param epoch: line date-time stamp, as from TimestampParser, or None if the line has no valid stamp
+        :param category: line category, as from DeathLoopVaccine.LineClassifier
+        :param line: line from logfile to be processed, as bytes in bytes mode
+        """
+        self.process_line(line)
+
+
+class Supervisor:
+    """
+    class to run a log parser (e.g. an EverquestLogFile child class, or a MultiLogFile) in the
+    background, while blocking the calling thread without using any CPU, until asked to stop.
+
+    A stop may be requested by calling stop() from any thread, or, once install_signal_handlers()
+    has been called, by SIGINT (Ctrl-C) or SIGTERM.  The parser thread is then shut down, and the
+    log files closed.
+    """
+
+    def __init__(self, parser) -> None:
+        """
+        ctor
+
+        :param parser: log parser object, with go(), shutdown() and join() methods
+        """
+        self.parser = parser
+        self._stop_requested = threading.Event()
+
+    def install_signal_handlers(self) -> None:
+        """
+        request a stop on SIGINT, SIGTERM (and SIGBREAK, on Windows).
+        must be called from the main thread
+        """
+        for name in ('SIGINT', 'SIGTERM', 'SIGBREAK'):
+            signum = getattr(signal, name, None)
+            if signum is not None:
+                signal.signal(signum, self._signal_handler)
+
+    def _signal_handler(self, signum, frame) -> None:
+        """
+        signal handler, which just requests a stop
+        """
+        self.stop()
+
+    def start(self) -> bool:
+        """
+        kick off the parser
+
+        :return: return value from the parser go() method
+        """
+        return self.parser.go()
+
+    def stop(self) -> None:
+        """
+        request a stop.  safe to call from any thread, or from a signal handler
+        """
+        self._stop_requested.set()
+
+    def is_stopped(self) -> bool:
+        """
+        :return: True if a stop has been requested
+        """
+        return self._stop_requested.is_set()
+
+    def join(self, timeout: float = None) -> bool:
+        """
+        block until a stop is requested, then shut down the parser thread and wait for it to end
 
-        :param line: line from logfile to be processed
+        :param timeout: maximum number of seconds to wait for the stop request, None to wait forever
+        :return: True if the parser has been shut down, False if the timeout expired first
         """
-        print(line.rstrip())
+        if timeout is None and os.name == 'nt':
+            # on Windows, Ctrl-C cannot interrupt a blocking wait, so wake up once a second to let it through
+            while not self._stop_requested.wait(1.0):
+                pass
+        elif not self._stop_requested.wait(timeout):
+            return False
+
+        self.parser.shutdown()
+        if self.parser.is_alive():
+            self.parser.join()
+        ConsoleWriter.flush()
+        return True
 
 
 #################################################################################################
@@ -273,13 +656,86 @@ class EverquestLogFile(threading.Thread):
 # standalone functions
 #
 
-def starprint(line: str) -> None:
+def starprint(line: str, level: int = ConsoleWriter.NORMAL) -> None:
     """
-    utility function to print with leading and trailing ** indicators
+    utility function to print with leading and trailing ** indicators.
+    the output is queued to the background console writer, so this never blocks
 
     :param line: line to be printed
+    :param level: message level, see ConsoleWriter
+    """
+    ConsoleWriter.write(f'** {line.rstrip():<100} **', level)
+
+
+class TimestampParser:
+    """
+    fast parser for the fixed-format Everquest log line date-time stamp, i.e.
+
+        [Ddd Mmm dd HH:MM:SS YYYY]
+
+    which returns an integer epoch, i.e. seconds since 1970-01-01 00:00:00, with the
+    log (local) time treated as if it were UTC.  Since the log stamps are all in the
+    same local time, differences between two parsed values are true elapsed seconds.
+
+    The fields are always at fixed positions, so no format string interpretation is
+    needed.  Bursts of log lines usually share the same second, so the last stamp
+    seen is cached, as is the epoch for the start of the last day seen.
+
+    Lines may be either strings or raw bytes, e.g. from a file read in bytes mode.
     """
-    print(f'** {line.rstrip():<100} **')
+
+    _MONTHS = {'Jan': 1, 'Feb': 2, 'Mar': 3, 'Apr': 4, 'May': 5, 'Jun': 6,
+               'Jul': 7, 'Aug': 8, 'Sep': 9, 'Oct': 10, 'Nov': 11, 'Dec': 12}
+    _MONTHS.update({month.encode(): number for month, number in _MONTHS.items()})
+
+    # the stamp brackets, as a string character or as a byte value
+    _OPEN = ('[', ord('['))
+    _CLOSE = (']', ord(']'))
+
+    _EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+
+    def __init__(self) -> None:
+        """
+        ctor
+        """
+        self._last_stamp = None
+        self._last_epoch = 0
+        self._last_date = None
+        self._last_date_epoch = 0
+
+    def parse(self, line: str or bytes) -> int:
+        """
+        parse the leading date-time stamp from a log line
+
+        :param line: string, or bytes, with a single line from the logfile
+        :return: integer epoch seconds
+        :raises ValueError: if the line does not begin with a valid date-time stamp
+        """
+        stamp = line[0:STAMP_LENGTH]
+        if stamp == self._last_stamp:
+            return self._last_epoch
+
+        if len(stamp) != STAMP_LENGTH or stamp[0] not in self._OPEN or stamp[STAMP_LENGTH - 1] not in self._CLOSE:
+            raise ValueError(f'Invalid log date-time stamp: [{stamp}]')
+
+        try:
+            # 'Mmm dd' plus 'YYYY' identifies the day
+            date = stamp[5:11] + stamp[21:25]
+            if date != self._last_date:
+                day = datetime.date(int(stamp[21:25]), self._MONTHS[stamp[5:8]], int(stamp[9:11]))
+                self._last_date_epoch = (day.toordinal() - self._EPOCH_ORDINAL) * 86400
+                self._last_date = date
+
+            epoch = (self._last_date_epoch
+                     + int(stamp[12:14]) * 3600
+                     + int(stamp[15:17]) * 60
+                     + int(stamp[18:20]))
+        except (KeyError, ValueError):
+            raise ValueError(f'Invalid log date-time stamp: [{stamp}]') from None
+
+        self._last_stamp = stamp
+        self._last_epoch = epoch
+        return epoch
 
 
 #
@@ -0,0 +1,291 @@
+import collections
+import heapq
+import os
+import signal
+import subprocess
+import threading
+import time
+
+import myconfig
+import EverquestLogFile
+import Metrics
+import ProcessFinder
+
+
+#
+# dedicated, pre-armed kill path.
+#
+# The detector must not make the kill wait behind console output or process enumeration, so the kill
+# is carried out by a KillExecutor thread of its own.  While idle, the executor keeps a precomputed
+# list of target process ID's up to date, from a CachedProcessFinder.  When the detector calls fire(),
+# the executor signals those targets straight away, and only then does anything else: refreshing the
+# targets, reporting what it did, and scheduling the escalation to the next signal in the policy, for
+# any process which outlives the grace period.  Escalations are deadlines kept by the executor thread,
+# rather than waited out, so the executor is always ready for the next kill, and kills requested while
+# it is busy are queued rather than lost.
+#
+# fire() waits for the first signals to be sent, for at most the latency budget, so the executor
+# thread gets the interpreter right away rather than at the next thread switch, while the detector
+# is never held up for longer than the budget.
+#
+# The time from detection to the first signals is measured every time, recorded in the
+# deathloop_detection_to_kill_seconds metric, and checked against myconfig.KILL_BUDGET_SECONDS.
+#
+# The escalation policy is the list of signal names in myconfig.KILL_SIGNALS, e.g. SIGTERM then
+# SIGKILL, with myconfig.KILL_ESCALATE_SECONDS between them.  Signals this platform does not have,
+# e.g. SIGKILL on Windows, where SIGTERM already terminates the process outright, are skipped.
+#
+# The kill scope, myconfig.KILL_SCOPE, decides which of the targets are killed when the detector names
+# the log file it was reading.  With 'owner', only the eqgame.exe process which has that log file open
+# is killed, so a death loop on one character does not take down every other client too.  Which client
+# owns which log is found out along with the targets, where the platform lets us list a process's open
+# files (i.e. /proc on Linux, including Everquest under Wine).  If the owner is not known, e.g. on
+# Windows, every target is killed, and the report says so.  With 'all', every target is always killed.
+#
+# usage:
+#
+#   python KillExecutor.py
+#
+# reports the current targets, and the latency of a disarmed kill, i.e. one which signals nothing
+#
+
+class KillExecutor(threading.Thread):
+    """
+    class to kill the target processes, from a thread of its own, as soon as it is told to
+    """
+
+    def __init__(self, finder: ProcessFinder.CachedProcessFinder, signal_names: tuple = None,
+                 escalate_seconds: float = None, budget_seconds: float = None, refresh_seconds: float = 1.0,
+                 scope: str = None) -> None:
+        """
+        ctor
+
+        :param finder: CachedProcessFinder for the target processes
+        :param signal_names: signal names, in order of escalation, None for myconfig.KILL_SIGNALS
+        :param escalate_seconds: seconds to wait before escalating to the next signal, None for the configured value
+        :param budget_seconds: target time from detection to the first signals, None for the configured value
+        :param refresh_seconds: number of seconds between refreshes of the target list
+        :param scope: 'owner' to kill only the owner of the log file named in fire(), if known, or 'all'.
+                      None for myconfig.KILL_SCOPE
+        """
+        # parent ctor
+        # the daemon=True parameter causes this child thread object to terminate
+        # when the parent thread terminates
+        super().__init__(daemon=True)
+
+        self.finder = finder
+        signal_names = signal_names or myconfig.KILL_SIGNALS
+        self.signals = [(name, getattr(signal, name)) for name in signal_names if hasattr(signal, name)]
+        self.escalate_seconds = escalate_seconds if escalate_seconds is not None else myconfig.KILL_ESCALATE_SECONDS
+        self.budget_seconds = budget_seconds if budget_seconds is not None else myconfig.KILL_BUDGET_SECONDS
+        self.refresh_seconds = refresh_seconds
+        self.scope = scope or myconfig.KILL_SCOPE
+
+        # precomputed target process ID's, and dictionary of log file base name (casefolded): tuple of
+        # the target process ID's which have it open, both replaced rather than modified
+        self.targets = tuple()
+        self.owners = dict()
+
+        # queue of pending requests, as (detection perf_counter, armed, reason, filename, event set once the
+        # first signals have been sent) tuples, and the event which wakes the thread for them
+        self._requests = collections.deque()
+        self._fire = threading.Event()
+        self._shutdown = threading.Event()
+
+        # heap of scheduled escalations, as (perf_counter deadline, sequence number, process ID's, index
+        # of the signal to send) tuples, only ever used by the executor thread
+        self._escalations = list()
+        self._sequence = 0
+
+        # latency of the most recent kill
+        self.last_latency = None
+
+    def refresh_targets(self) -> tuple[int, ...]:
+        """
+        bring the target list up to date
+
+        :return: tuple of target process ID's
+        """
+        try:
+            targets = tuple(self.finder.pid_list())
+        except (OSError, subprocess.SubprocessError):
+            return self.targets
+
+        if self.scope == 'owner':
+            owners = dict()
+            for pid in targets:
+                for path in self.finder.finder.open_files(pid):
+                    name = os.path.basename(path).casefold()
+                    if name.startswith('eqlog_'):
+                        owners[name] = owners.get(name, tuple()) + (pid,)
+            self.owners = owners
+        self.targets = targets
+        return targets
+
+    def owner_of(self, filename: str or None) -> tuple[int, ...]:
+        """
+        :param filename: log file name, or None
+        :return: tuple of the target process ID's which have the log file open, empty if not known,
+                 or if the scope is 'all'
+        """
+        if not filename or self.scope != 'owner':
+            return tuple()
+        return self.owners.get(os.path.basename(filename).casefold(), tuple())
+
+    def fire(self, armed: bool = True, reason: str = '', filename: str = None) -> bool:
+        """
+        kill the targets.  called by the detector, and returns once the first signals have been sent,
+        or the latency budget has run out, whichever comes first
+
+        :param armed: False to go through the motions without signalling anything, e.g. for test deaths
+        :param reason: what triggered the kill, for the report
+        :param filename: log file the trigger was read from, so only its owner is killed, see myconfig.KILL_SCOPE
+        :return: True if the first signals were sent within the budget
+        """
+        signalled = threading.Event()
+        self._requests.append((time.perf_counter(), armed, reason, filename, signalled))
+        self._fire.set()
+        return signalled.wait(self.budget_seconds)
+
+    def shutdown(self) -> None:
+        """
+        end the executor thread.  safe to call from any thread
+        """
+        self._shutdown.set()
+        self._fire.set()
+
+    def _signal(self, pids: tuple, signum: int) -> list[int]:
+        """
+        :return: list of the process ID's actually signalled
+        """
+        rv = list()
+        for pid in pids:
+            try:
+                os.kill(pid, signum)
+                rv.append(pid)
+            except OSError:
+                # already gone, or not ours to kill
+                pass
+        return rv
+
+    def _execute(self, detected: float, armed: bool, reason: str, filename: str or None,
+                 signalled_event: threading.Event) -> None:
+        """
+        carry out one kill, then report on it
+        """
+        # no targets known, e.g. the game was only just started, so there is nothing for it but to look now
+        if not self.targets:
+            self.refresh_targets()
+
+        # only the client which owns the log file, if known, else every client
+        targets = self.owner_of(filename)
+        owned = len(targets) > 0
+        if not owned:
+            targets = self.targets
+        signalled = list()
+        if armed and self.signals:
+            signalled = self._signal(targets, self.signals[0][1])
+
+            # none of the targets could be signalled, e.g. the game was restarted since they were found,
+            # so look again, and have one more go
+            if targets and not signalled:
+                self.refresh_targets()
+                targets = self.owner_of(filename) or self.targets
+                signalled = self._signal(targets, self.signals[0][1])
+        latency = time.perf_counter() - detected
+        signalled_event.set()
+
+        # the critical part is done, now for the bookkeeping
+        self.last_latency = latency
+        Metrics.DETECTION_TO_KILL_SECONDS.observe(latency)
+        Metrics.KILLS.labels(str(armed)).inc()
+        if latency > self.budget_seconds:
+            Metrics.KILL_BUDGET_EXCEEDED.inc()
+
+        EverquestLogFile.starprint(f'KillExecutor:  {reason}')
+        if self.scope == 'owner' and filename and not owned:
+            EverquestLogFile.starprint(f'KillExecutor:  Client owning [{filename}] not known, so targeting every client')
+        if not armed:
+            EverquestLogFile.starprint(f'KillExecutor:  Disarmed, so not signalling target(s) {list(targets)}')
+        elif self.signals:
+            EverquestLogFile.starprint(f'KillExecutor:  Sent {self.signals[0][0]} to {signalled}, of target(s) {list(targets)}')
+        over = '' if latency <= self.budget_seconds else ', OVER BUDGET'
+        EverquestLogFile.starprint(f'KillExecutor:  {latency * 1000:.3f} ms from detection to signal '
+                                   f'(budget {self.budget_seconds * 1000:.3f} ms{over})')
+
+        self._schedule_escalation(signalled, 1)
+        self.refresh_targets()
+
+    def _schedule_escalation(self, pids: list[int], index: int) -> None:
+        """
+        escalate to the signal at the given index in the policy, for any of the processes still running
+        after the grace period
+        """
+        if pids and index < len(self.signals):
+            self._sequence += 1
+            deadline = time.perf_counter() + self.escalate_seconds
+            heapq.heappush(self._escalations, (deadline, self._sequence, pids, index))
+
+    def _escalate(self, pids: list[int], index: int) -> None:
+        """
+        carry out one scheduled escalation
+        """
+        remaining = [pid for pid in pids if self.finder.finder.matches(pid)]
+        if remaining:
+            name, signum = self.signals[index]
+            EverquestLogFile.starprint(f'KillExecutor:  {remaining} still running, escalating to {name}')
+            self._schedule_escalation(self._signal(tuple(remaining), signum), index + 1)
+
+    def run(self) -> None:
+        """
+        override the thread.run() method
+        this method will execute in its own thread
+        """
+        self.refresh_targets()
+        next_refresh = time.perf_counter() + self.refresh_seconds
+
+        # run until shutdown
+        while not self._shutdown.is_set():
+
+            # wait to be fired, or for the next escalation or refresh, whichever comes first
+            deadline = min(next_refresh, self._escalations[0][0]) if self._escalations else next_refresh
+            if self._fire.wait(max(0.0, deadline - time.perf_counter())):
+                self._fire.clear()
+
+            # kills first, every one of them, then any escalations which are due
+            while self._requests and not self._shutdown.is_set():
+                self._execute(*self._requests.popleft())
+            now = time.perf_counter()
+            while self._escalations and self._escalations[0][0] <= now and not self._shutdown.is_set():
+                deadline, sequence, pids, index = heapq.heappop(self._escalations)
+                self._escalate(pids, index)
+
+            if now >= next_refresh:
+                self.refresh_targets()
+                next_refresh = now + self.refresh_seconds
+
+
+#################################################################################################
+#
+# standalone functions
+#
+
+def main():
+    finder = ProcessFinder.CachedProcessFinder(ProcessFinder.create_finder('eqgame.exe'))
+    finder.start()
+    executor = KillExecutor(finder)
+    executor.start()
+
+    # give the executor a chance to precompute its targets
+    time.sleep(0.5)
+    EverquestLogFile.starprint(f'Targets = {list(executor.targets)}')
+    EverquestLogFile.starprint(f'Policy = {[name for name, signum in executor.signals]}, '
+                               f'{executor.escalate_seconds} seconds apart')
+    executor.fire(armed=False, reason='Test kill')
+    time.sleep(0.5)
+    executor.shutdown()
+    finder.shutdown()
+
+
+if __name__ == '__main__':
+    main()
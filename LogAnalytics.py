@@ -0,0 +1,539 @@
+import argparse
+import collections
+import json
+import mmap
+import os
+import sys
+import time
+
+import numpy as np
+
+import myconfig
+import ConsoleWriter
+import DeathLoopVaccine
+import EverquestLogFile
+import SlidingWindow
+
+
+#
+# vectorized bulk analytics over historical logs.
+#
+# Rather than looping over the lines in python, the log is memory mapped and treated as one big
+# numpy byte array.  The line boundaries are found with a single comparison against the newline
+# byte, the fixed-width date-time stamps are decoded all at once with integer arithmetic, and only
+# where a stamp differs from the one on the line before, since bursts of lines share the same second,
+# and the message categories are found by comparing the bytes at the message offset against the
+# same prefixes DeathLoopVaccine.LineClassifier uses.  The lines are grouped by the first word of the
+# message, with one sort, so each prefix is only checked against the lines which begin like it does.
+#
+# The file is processed in large chunks, so memory use does not depend on the file size, and only
+# the interesting lines (deaths, proof of life, session starts) are kept from each chunk.
+#
+# Reports:
+#
+#   deaths per hour:    number of deaths in each hour, by log (local) time
+#   sessions:           start, duration, lines and deaths of each session, i.e. each 'Welcome to EverQuest!'
+#   near misses:        points where the death count reached one short of a death loop, and went no further
+#   death loops:        points where the death count reached a death loop
+#
+# Deaths are few and far between compared to the other lines, so the death loop windows are then replayed
+# over just the deaths, with the same sliding window rule as DeathLoopVaccine.
+#
+# requires numpy.
+#
+# usage:
+#
+#   python LogAnalytics.py LOGFILE [LOGFILE...] [--deaths 4] [--seconds 120] [--json]
+#
+
+# number of bytes processed at a time
+CHUNK_BYTES = 64 * 1024 * 1024
+
+# the bytes are also viewed as overlapping little-endian 8 byte words, one starting at every byte, so
+# 8 bytes of a prefix are checked at a time, with one gather and one comparison
+WORD_BYTES = 8
+
+# number of leading bytes by which the prefixes are grouped.  no prefix is shorter than this
+GROUP_BYTES = 4
+
+# integer codes for the line categories, plus one for the session starts
+OTHER_CODE = 0
+CATEGORY_CODES = {
+    DeathLoopVaccine.DEATH: 1,
+    DeathLoopVaccine.TEST_DEATH: 2,
+    DeathLoopVaccine.CASTING: 3,
+    DeathLoopVaccine.COMMUNICATION: 4,
+    DeathLoopVaccine.MELEE: 5,
+}
+WELCOME_CODE = 6
+SESSION_MARKER = 'Welcome to EverQuest!'
+
+# deaths, and proof of life, exactly as DeathLoopVaccine counts them.  session starts are only used to
+# divide the log into sessions, since a restart doesn't clear DeathLoopVaccine's death windows either
+DEATH_CODES = np.array([CATEGORY_CODES[category] for category in DeathLoopVaccine.DEATHS])
+BREAKER_CODES = np.array([CATEGORY_CODES[category] for category in DeathLoopVaccine.AFK_BREAKERS])
+
+# month abbreviations, packed into 24 bit integers, sorted, and the month numbers in the same order
+_MONTH_NAMES = [b'Jan', b'Feb', b'Mar', b'Apr', b'May', b'Jun', b'Jul', b'Aug', b'Sep', b'Oct', b'Nov', b'Dec']
+_MONTH_KEYS = np.array([(name[0] << 16) | (name[1] << 8) | name[2] for name in _MONTH_NAMES])
+_MONTH_ORDER = np.argsort(_MONTH_KEYS)
+_MONTH_KEYS = _MONTH_KEYS[_MONTH_ORDER]
+_MONTH_NUMBERS = _MONTH_ORDER + 1
+
+# offsets within the stamp of the digits, i.e. '[Ddd Mmm dd HH:MM:SS YYYY]'
+_DIGIT_OFFSETS = np.array([10, 12, 13, 15, 16, 18, 19, 21, 22, 23, 24])
+
+
+class LogAnalyzer:
+    """
+    class to accumulate the analytics over one or more log files, a chunk at a time
+    """
+
+    def __init__(self, charname: str, deaths: int = None, seconds: int = None) -> None:
+        """
+        ctor
+
+        :param charname: Everquest character, used in the communication prefix
+        :param deaths: number of deaths which define a death loop, None for the configured value
+        :param seconds: number of seconds which define a death loop, None for the configured value
+        """
+        self.charname = charname
+        self.deaths = deaths or myconfig.DEATHLOOP_DEATHS
+        self.seconds = seconds or myconfig.DEATHLOOP_SECONDS
+        self.chunk_bytes = CHUNK_BYTES
+
+        # dictionary of group: list of (category code, prefix length, word checks) in reverse order of precedence,
+        # so higher precedence is applied last.  the checks are (offset, word, mask) tuples covering the prefix a
+        # word at a time, the last one masked to the bytes left
+        prefixes = [(CATEGORY_CODES[category], prefix) for category, prefix
+                    in DeathLoopVaccine.LineClassifier.prefixes(charname)]
+        prefixes.insert(0, (WELCOME_CODE, SESSION_MARKER))
+        self._groups = dict()
+        for code, prefix in reversed(prefixes):
+            prefix = prefix.encode()
+            checks = list()
+            for offset in range(0, len(prefix), WORD_BYTES):
+                word = prefix[offset:offset + WORD_BYTES]
+                checks.append((offset, np.uint64(int.from_bytes(word, 'little')), np.uint64((1 << (8 * len(word))) - 1)))
+
+            # prefixes are grouped by their first few bytes, e.g. 'You ', so each group is found with one
+            # pass over every line, and each prefix in the group is then only checked against the group
+            group = np.uint32(int.from_bytes(prefix[:GROUP_BYTES], 'little'))
+            self._groups.setdefault(group, list()).append((code, len(prefix), checks))
+
+        # dictionary of group: dictionary of first word mask: sorted array of the distinct first words of the
+        # prefixes in the group with that mask, i.e. of that length.  within a group, the lines are sorted by
+        # which of these first words they begin with, so each prefix is only checked against those lines
+        self._first_words = dict()
+        for group, group_prefixes in self._groups.items():
+            words = dict()
+            for code, length, checks in group_prefixes:
+                offset, word, mask = checks[0]
+                words.setdefault(mask, set()).add(word)
+            self._first_words[group] = {mask: np.array(sorted(words), dtype=np.uint64) for mask, words in words.items()}
+
+        # totals
+        self.bytes = 0
+        self.lines = 0
+        self.elapsed = 0.0
+
+        # deaths per hour, keyed by epoch // 3600
+        self.deaths_per_hour = collections.Counter()
+
+        # death epochs, and the count of breakers before each death, one array per chunk
+        self._death_epochs = list()
+        self._death_breakers = list()
+        self._breakers = 0
+
+        # sessions, as [start epoch, end epoch, lines, deaths], and the state carried between chunks
+        self.sessions = list()
+        self._last_epoch = None
+
+    def analyze_file(self, filename: str) -> None:
+        """
+        add one log file to the analytics
+
+        :param filename: full log filename
+        """
+        start = time.perf_counter()
+        with open(filename, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size == 0:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                buf = np.frombuffer(mm, dtype=np.uint8)
+                pos = 0
+                while pos < size:
+                    # end each chunk on a line boundary, and include the following bytes of the file,
+                    # or padding at the end, so a word can be read starting at any byte of the chunk
+                    end = mm.find(b'\n', min(pos + self.chunk_bytes, size) - 1) + 1 or size
+                    if end + WORD_BYTES <= size:
+                        chunk = buf[pos:end + WORD_BYTES]
+                    else:
+                        chunk = np.concatenate((buf[pos:end], np.zeros(WORD_BYTES, dtype=np.uint8)))
+                    self._analyze_chunk(chunk, end - pos)
+                    pos = end
+                    del chunk
+
+                # the array must be released before the map is closed
+                del buf
+        self.bytes += size
+        self.elapsed += time.perf_counter() - start
+
+    def _analyze_chunk(self, buf: np.ndarray, length: int) -> None:
+        """
+        add one chunk of complete lines to the analytics
+
+        :param buf: array of bytes, with at least WORD_BYTES more bytes after the chunk
+        :param length: length of the chunk
+        """
+        # line boundaries
+        newlines = np.flatnonzero(buf[:length] == 10)
+        starts = np.concatenate(([0], newlines + 1))
+        ends = np.concatenate((newlines, [length]))
+        if starts[-1] == length:
+            starts = starts[:-1]
+            ends = ends[:-1]
+        self.lines += len(starts)
+
+        # only the lines with some message text, so with room for a date-time stamp
+        lengths = ends - starts
+        starts = starts[lengths > EverquestLogFile.MESSAGE_OFFSET]
+        lengths = lengths[lengths > EverquestLogFile.MESSAGE_OFFSET]
+        if len(starts) == 0:
+            return
+
+        # the overlapping words.  a stamp is covered by the words at its offsets 0, 8, 16 and 18, so a run of
+        # lines with the same stamp is found by comparing those with the line before, and only the first line
+        # of each run is decoded
+        words = np.ndarray(shape=(len(buf) - WORD_BYTES + 1,), dtype='<u8', buffer=buf, strides=(1,))
+        changed = np.zeros(len(starts), dtype=bool)
+        changed[0] = True
+        for offset in (0, 8, 16, EverquestLogFile.STAMP_LENGTH - WORD_BYTES):
+            stamp_words = words[starts + offset]
+            changed[1:] |= stamp_words[1:] != stamp_words[:-1]
+        runs = np.cumsum(changed) - 1
+        stamped, epochs = self._decode_stamps(buf, starts[changed])
+        stamped = stamped[runs]
+
+        starts = starts[stamped]
+        if len(starts) == 0:
+            return
+        lengths = lengths[stamped]
+        epochs = epochs[runs[stamped]]
+
+        codes = self._classify(words, starts, lengths)
+        self._tally(epochs, codes)
+
+    def _decode_stamps(self, buf: np.ndarray, starts: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        decode the date-time stamps at the start of some lines
+
+        :param buf: array of bytes
+        :param starts: array of the offsets of the lines
+        :return: (array of True where the line has a valid stamp, array of epoch seconds) tuple
+        """
+        stamped = (buf[starts] == ord('[')) & (buf[starts + EverquestLogFile.STAMP_LENGTH - 1] == ord(']'))
+        # digit values, as unsigned bytes, so anything below '0' wraps around to above 9
+        digits = list()
+        for offset in _DIGIT_OFFSETS:
+            digit = buf[starts + offset] - np.uint8(ord('0'))
+            stamped &= digit <= 9
+            digits.append(digit)
+
+        # the first digit of the day may be a space
+        day_tens = buf[starts + 9]
+        day_tens = np.where(day_tens == ord(' '), np.uint8(0), day_tens - np.uint8(ord('0')))
+        stamped &= day_tens <= 9
+        digits.insert(0, day_tens)
+
+        # month abbreviations
+        packed = ((buf[starts + 5].astype(np.int64) << 16) | (buf[starts + 6].astype(np.int64) << 8)
+                  | buf[starts + 7].astype(np.int64))
+        month_index = np.searchsorted(_MONTH_KEYS, packed).clip(0, len(_MONTH_KEYS) - 1)
+        stamped &= _MONTH_KEYS[month_index] == packed
+        month = _MONTH_NUMBERS[month_index]
+
+        return stamped, self._epochs(month, digits)
+
+    @staticmethod
+    def _epochs(month: np.ndarray, digits: list[np.ndarray]) -> np.ndarray:
+        """
+        decode the date-time stamps, in the same convention as TimestampParser,
+        i.e. local time treated as UTC
+
+        :param month: array of month numbers
+        :param digits: list of arrays of the stamp digit values, day tens first
+        :return: array of epoch seconds
+        """
+        digits = [digit.astype(np.int64) for digit in digits]
+        day = digits[0] * 10 + digits[1]
+        hour = digits[2] * 10 + digits[3]
+        minute = digits[4] * 10 + digits[5]
+        second = digits[6] * 10 + digits[7]
+        year = digits[8] * 1000 + digits[9] * 100 + digits[10] * 10 + digits[11]
+
+        # days since 1970-01-01, from the civil date
+        y = year - (month <= 2)
+        era = y // 400
+        yoe = y - era * 400
+        doy = (153 * np.where(month > 2, month - 3, month + 9) + 2) // 5 + day - 1
+        doe = yoe * 365 + yoe // 4 - yoe // 100 + doy
+        days = era * 146097 + doe - 719468
+
+        return days * 86400 + hour * 3600 + minute * 60 + second
+
+    def _classify(self, words: np.ndarray, starts: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+        """
+        classify the lines by message prefix
+
+        :param words: the chunk viewed as overlapping words, one starting at every byte
+        :param starts: array of the offsets of the lines
+        :param lengths: array of the lengths of the lines
+        :return: array of category codes
+        """
+        codes = np.zeros(len(starts), dtype=np.int8)
+        messages = starts + EverquestLogFile.MESSAGE_OFFSET
+        message_lengths = lengths - EverquestLogFile.MESSAGE_OFFSET
+
+        # the first word of every message.  bytes past the end of a short message are junk, but those
+        # messages are excluded by the length check
+        heads = words[messages]
+        groups = heads.astype(np.uint32)
+
+        # the groups are disjoint, so only the order within each group matters
+        for group, prefixes in self._groups.items():
+            members = np.flatnonzero(groups == group)
+            if len(members) == 0:
+                continue
+            member_heads = heads[members]
+
+            # for each first word length, the members sorted by which first word they begin with, if any,
+            # and where the members beginning with each first word start and end in that order
+            runs = dict()
+            for mask, first_words in self._first_words[group].items():
+                masked = member_heads & mask
+                index = np.searchsorted(first_words, masked).clip(0, len(first_words) - 1)
+                index[first_words[index] != masked] = len(first_words)
+                index = index.astype(np.int16)
+                order = members[np.argsort(index, kind='stable')]
+                bounds = np.searchsorted(np.sort(index), np.arange(len(first_words) + 1))
+                runs[mask] = (first_words, order, bounds)
+
+            # the second word of the members beginning with each first word, gathered once, and shared by all the
+            # prefixes with that first word, e.g. 'You try to hit', 'You try to slash' and so on.  only prefixes
+            # longer than a word have a second word, and their first word is a whole word, so the members which
+            # begin with it have a message of at least a word, and their second word is within the chunk padding
+            second_words = dict()
+
+            for code, length, checks in prefixes:
+                offset, word, mask = checks[0]
+                first_words, order, bounds = runs[mask]
+                i = np.searchsorted(first_words, word)
+                candidates = order[bounds[i]:bounds[i + 1]]
+                keep = message_lengths[candidates] >= length
+                if len(checks) > 1:
+                    second = second_words.get((mask, i))
+                    if second is None:
+                        second = second_words[(mask, i)] = words[messages[candidates] + WORD_BYTES]
+                    offset, word, mask = checks[1]
+                    keep &= (second & mask) == word
+                candidates = candidates[keep]
+                for offset, word, mask in checks[2:]:
+                    if len(candidates) == 0:
+                        break
+                    candidates = candidates[(words[messages[candidates] + offset] & mask) == word]
+                codes[candidates] = code
+        return codes
+
+    def _tally(self, epochs: np.ndarray, codes: np.ndarray) -> None:
+        """
+        add the classified lines from one chunk to the totals
+        """
+        # deaths, and how many breakers came before each of them
+        is_death = np.isin(codes, DEATH_CODES)
+        breakers = self._breakers + np.cumsum(np.isin(codes, BREAKER_CODES))
+        death_epochs = epochs[is_death]
+        self._death_epochs.append(death_epochs)
+        self._death_breakers.append(breakers[is_death])
+        self._breakers = int(breakers[-1])
+
+        hours, counts = np.unique(death_epochs // 3600, return_counts=True)
+        self.deaths_per_hour.update(dict(zip(hours.tolist(), counts.tolist())))
+
+        # sessions.  the first part of the chunk belongs to the session carried over from the previous chunk
+        welcomes = np.flatnonzero(codes == WELCOME_CODE)
+        bounds = np.concatenate(([0], welcomes, [len(codes)]))
+        lines = np.diff(bounds).tolist()
+        deaths = np.diff(np.searchsorted(np.flatnonzero(is_death), bounds)).tolist()
+        starts = epochs[welcomes].tolist()
+        ends = epochs[welcomes - 1].tolist()
+        if len(welcomes) and welcomes[0] == 0:
+            ends[0] = self._last_epoch
+
+        if self.sessions:
+            self.sessions[-1][2] += lines[0]
+            self.sessions[-1][3] += deaths[0]
+        elif lines[0]:
+            # lines before the first session start in the first file
+            self.sessions.append([None, None, lines[0], deaths[0]])
+        for i, start in enumerate(starts):
+            if self.sessions:
+                self.sessions[-1][1] = ends[i]
+            self.sessions.append([start, None, lines[i + 1], deaths[i + 1]])
+        self._last_epoch = int(epochs[-1])
+
+    def finish(self) -> dict:
+        """
+        :return: dictionary of the aggregated tables, suitable for JSON
+        """
+        if self.sessions and self.sessions[-1][1] is None:
+            self.sessions[-1][1] = self._last_epoch
+
+        death_epochs = np.concatenate(self._death_epochs) if self._death_epochs else np.zeros(0, dtype=np.int64)
+        death_breakers = np.concatenate(self._death_breakers) if self._death_breakers else np.zeros(0, dtype=np.int64)
+
+        # split the deaths into episodes, wherever the window would have emptied between two deaths,
+        # and only replay the episodes with enough deaths to matter
+        breaks = (np.diff(death_epochs) > self.seconds) | (np.diff(death_breakers) != 0)
+        episodes = np.concatenate(([0], np.cumsum(breaks)))[:len(death_epochs)]
+        sizes = np.bincount(episodes) if len(episodes) else np.zeros(0, dtype=np.int64)
+        keep = sizes[episodes] >= self.deaths - 1
+        near_misses, death_loops = self._replay_deaths(death_epochs[keep].tolist(), death_breakers[keep].tolist(),
+                                                       episodes[keep].tolist())
+
+        return {
+            'bytes': self.bytes,
+            'lines': self.lines,
+            'seconds': self.elapsed,
+            'mb_per_sec': self.bytes / self.elapsed / 1e6 if self.elapsed > 0 else None,
+            'deathloop_deaths': self.deaths,
+            'deathloop_seconds': self.seconds,
+            'deaths': len(death_epochs),
+            'deaths_per_hour': [[format_epoch(hour * 3600), count] for hour, count in sorted(self.deaths_per_hour.items())],
+            'sessions': [[format_epoch(start), None if start is None or end is None else end - start, lines, deaths]
+                         for start, end, lines, deaths in self.sessions],
+            'near_misses': [[format_epoch(epoch), count] for epoch, count in near_misses],
+            'death_loops': [[format_epoch(epoch), count] for epoch, count in death_loops],
+        }
+
+    def _replay_deaths(self, death_epochs: list[int], death_breakers: list[int],
+                       episodes: list[int]) -> tuple[list, list]:
+        """
+        replay the deaths through a death loop window, which is cleared by any breaker,
+        and reset whenever it fires, just as DeathLoopVaccine does
+
+        :param death_epochs: list of death epochs
+        :param death_breakers: list of the count of breakers before each death
+        :param episodes: list of the episode number of each death
+        :return: (near misses, death loops) tuple, each a list of (epoch, deaths) tuples
+        """
+        near_misses = list()
+        death_loops = list()
+        window = SlidingWindow.SlidingWindow(self.seconds, maxlen=self.deaths)
+        peak = None
+        segment = None
+
+        for epoch, breakers, episode in zip(death_epochs, death_breakers, episodes):
+            # proof of life since the last death, a new episode, or the old deaths have scrolled off
+            if (breakers, episode) != segment:
+                window.clear()
+            window.expire(epoch)
+            if not window and peak:
+                near_misses.append(peak)
+            if not window:
+                peak = None
+
+            segment = (breakers, episode)
+            window.append(epoch)
+            if len(window) >= self.deaths:
+                death_loops.append((epoch, len(window)))
+                window.clear()
+                peak = None
+            elif len(window) == self.deaths - 1:
+                peak = (epoch, len(window))
+
+        if peak:
+            near_misses.append(peak)
+        return near_misses, death_loops
+
+
+#################################################################################################
+#
+# standalone functions
+#
+
+def format_epoch(epoch: int or None) -> str or None:
+    """
+    :param epoch: epoch in the TimestampParser convention, i.e. local time treated as UTC
+    :return: the local date-time, e.g. '2026-10-01 20:15:00'
+    """
+    if epoch is None:
+        return None
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(epoch))
+
+
+def report(results: dict) -> None:
+    """
+    print the aggregated tables
+
+    :param results: dictionary returned by LogAnalyzer.finish()
+    """
+    starprint = EverquestLogFile.starprint
+    starprint(f'{results["bytes"]:,} bytes, {results["lines"]:,} lines, {results["deaths"]:,} deaths, '
+              f'in {results["seconds"]:.2f} seconds ({results["mb_per_sec"] or 0:,.0f} MB/sec)')
+
+    starprint('Deaths per hour:')
+    for hour, count in results['deaths_per_hour']:
+        starprint(f'    {hour[:13]}:00    {count:>6}')
+
+    starprint('Sessions (start, seconds, lines, deaths):')
+    for start, seconds, lines, deaths in results['sessions']:
+        starprint(f'    {start or "(before first session)":<24} {seconds if seconds is not None else "":>8} '
+                  f'{lines:>10} {deaths:>6}')
+
+    deaths = results['deathloop_deaths']
+    seconds = results['deathloop_seconds']
+    starprint(f'Near misses ({deaths - 1} deaths in {seconds} seconds, with no player activity):')
+    for when, count in results['near_misses']:
+        starprint(f'    {when}')
+
+    starprint(f'Death loops ({deaths} or more deaths in {seconds} seconds, with no player activity):')
+    for when, count in results['death_loops']:
+        starprint(f'    {when}    {count} deaths')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Aggregate statistics from Everquest logs, e.g. deaths per hour, '
+                                                 'session lengths and death loop near misses')
+    parser.add_argument('logfiles', nargs='+', help='Everquest log files, for one character, oldest first')
+    parser.add_argument('--charname', default=None, help='character name, by default parsed from the log filename')
+    parser.add_argument('--deaths', type=int, default=None, help='number of deaths which define a death loop')
+    parser.add_argument('--seconds', type=int, default=None, help='number of seconds which define a death loop')
+    parser.add_argument('--json', action='store_true', help='write the tables as JSON, rather than text')
+    args = parser.parse_args()
+
+    charname = args.charname
+    if charname is None:
+        charname = EverquestLogFile.EverquestLogFile().parse_charname(args.logfiles[0]) or 'Unknown'
+
+    try:
+        analyzer = LogAnalyzer(charname, args.deaths, args.seconds)
+        for filename in args.logfiles:
+            analyzer.analyze_file(filename)
+        results = analyzer.finish()
+
+    except (OSError, ValueError) as err:
+        EverquestLogFile.starprint(f'ERROR: {err}', ConsoleWriter.QUIET)
+        ConsoleWriter.flush()
+        sys.exit(1)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        report(results)
+        ConsoleWriter.flush()
+
+
+if __name__ == '__main__':
+    main()
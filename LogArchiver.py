@@ -0,0 +1,516 @@
+import argparse
+import bisect
+import contextlib
+import gzip
+import json
+import os
+import time
+
+import myconfig
+import ConsoleWriter
+import EverquestLogFile
+
+
+#
+# archival of completed sessions from the live character logs.
+#
+# Everquest only ever appends to eqlog_<charname>_<server>.txt, so the files grow forever.  Each
+# time a character logs in, Everquest writes a 'Welcome to EverQuest!' line, which marks the start
+# of a new session.  Every session before the last one is complete, and is rolled off the live log
+# into its own compressed segment in the archive subdirectory of the logs directory:
+#
+#   archive/eqlog_<charname>_<server>.<YYYYMMDD-HHMMSS>.txt.gz
+#
+# where the date-time is the stamp of the first line of the session.  The extra '.<date-time>' keeps
+# the segment names out of the server mask, so they are never mistaken for live logs.
+#
+# Each segment is written as a series of independent gzip members, one per ~64 KB block of log text,
+# and has a JSON sidecar index (the segment filename plus '.idx') with one entry per block:
+#
+#   [epoch of the first line in the block, uncompressed offset, compressed offset]
+#
+# where a block whose first line has no date-time stamp takes the latest epoch seen before it, so the
+# epochs only ever go up, and only the blocks before the first stamped line have no epoch (None).  So
+# a reader can binary search the index for a time, seek straight to that block in the compressed
+# file, and decompress from there on, without decompressing anything before it.
+#
+# The live log is then rewritten to hold only the last (current) session.  This is only ever done to
+# a log which has been idle for a while, and never to the most recently modified log, which is the
+# one the running EverquestLogFile tail is following.  Only the log as it was when the archival
+# started is archived, and the rewrite goes to a temporary file which replaces the live log.  Anything
+# written to the live log in the meantime is copied across to the temporary file before the swap, and
+# anything written to the old file by a writer which still has it open, after the swap, is copied
+# across to the new live log, so no lines are ever lost.
+#
+# usage:
+#
+#   python LogArchiver.py [--idle-seconds 3600] [--dry-run]
+#
+
+# archive subdirectory of the logs directory
+ARCHIVE_DIRECTORY = 'archive'
+
+# marks the start of each session, at the message offset of the line
+SESSION_MARKER = b'Welcome to EverQuest!'
+
+# approximate number of uncompressed bytes in each indexed block
+INDEX_INTERVAL = 64 * 1024
+
+
+class SegmentWriter:
+    """
+    class to write one compressed segment and its sidecar index
+    """
+
+    def __init__(self, filename: str, source: str, index_interval: int = INDEX_INTERVAL) -> None:
+        """
+        ctor
+
+        :param filename: full segment filename
+        :param source: filename of the live log the segment was cut from, recorded in the index
+        :param index_interval: approximate number of uncompressed bytes in each indexed block
+        """
+        self.filename = filename
+        self.source = source
+        self.index_interval = index_interval
+
+        self._file = open(filename, 'xb')
+        self._parser = EverquestLogFile.TimestampParser()
+
+        # the block being accumulated, and the epoch of its first line
+        self._block = list()
+        self._block_size = 0
+        self._block_epoch = None
+
+        # running totals, and the index entries
+        self.uncompressed_offset = 0
+        self.compressed_offset = 0
+        self.lines = 0
+        self.first_epoch = None
+        self.last_epoch = None
+        self.blocks = list()
+
+    def _epoch(self, line: bytes) -> int or None:
+        """
+        :return: epoch of the line's date-time stamp, or None if it does not have one
+        """
+        try:
+            return self._parser.parse(line)
+        except ValueError:
+            return None
+
+    def write_line(self, line: bytes) -> None:
+        """
+        add one line to the segment
+
+        :param line: one complete line, including its line terminator
+        """
+        if not self._block:
+            epoch = self._epoch(line)
+            if epoch is None:
+                # no stamp, so the block carries on from the latest epoch seen, if any, to keep the index sorted
+                epoch = self._latest_epoch()
+            self._block_epoch = epoch
+            if self.first_epoch is None:
+                self.first_epoch = self._block_epoch
+
+        self._block.append(line)
+        self._block_size += len(line)
+        self.lines += 1
+
+        if self._block_size >= self.index_interval:
+            self._write_block(line)
+
+    def _latest_epoch(self) -> int or None:
+        """
+        :return: the latest epoch seen so far, of the last stamped line of a block or of the latest block,
+                 or None if there has been no stamped line
+        """
+        epochs = [epoch for epoch in (self.last_epoch, self.blocks[-1][0] if self.blocks else None)
+                  if epoch is not None]
+        return max(epochs) if epochs else None
+
+    def _write_block(self, last_line: bytes) -> None:
+        """
+        compress the accumulated block as one gzip member, and index it
+        """
+        epoch = self._epoch(last_line)
+        if epoch is not None:
+            self.last_epoch = epoch
+
+        data = gzip.compress(b''.join(self._block), mtime=0)
+        self._file.write(data)
+        self.blocks.append([self._block_epoch, self.uncompressed_offset, self.compressed_offset])
+
+        self.uncompressed_offset += self._block_size
+        self.compressed_offset += len(data)
+        self._block = list()
+        self._block_size = 0
+        self._block_epoch = None
+
+    def close(self) -> None:
+        """
+        write the last block, make the segment durable, then write the index
+        """
+        if self._block:
+            self._write_block(self._block[-1])
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+
+        index = {
+            'source': os.path.basename(self.source),
+            'first_epoch': self.first_epoch,
+            'last_epoch': self.last_epoch,
+            'lines': self.lines,
+            'bytes': self.uncompressed_offset,
+            'compressed_bytes': self.compressed_offset,
+            'blocks': self.blocks,
+        }
+        with open(index_filename(self.filename), 'w') as f:
+            json.dump(index, f, separators=(',', ':'))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def abort(self) -> None:
+        """
+        throw away a partially written segment
+        """
+        self._file.close()
+        for filename in (self.filename, index_filename(self.filename)):
+            try:
+                os.remove(filename)
+            except OSError:
+                pass
+
+
+class LogArchiver:
+    """
+    class to roll the completed sessions off the idle character logs, into compressed segments
+    """
+
+    def __init__(self, idle_seconds: float = None, index_interval: int = INDEX_INTERVAL) -> None:
+        """
+        ctor
+
+        :param idle_seconds: only logs not modified for this many seconds are archived, None for the configured value
+        :param index_interval: approximate number of uncompressed bytes in each indexed block
+        """
+        # use an EverquestLogFile for the filename conventions and the log directory index
+        self.elf = EverquestLogFile.EverquestLogFile()
+        self.directory_index = self.elf.directory_index
+        self.archive_directory = self.elf.base_directory + self.elf.logs_directory + ARCHIVE_DIRECTORY + os.sep
+
+        if idle_seconds is None:
+            idle_seconds = myconfig.ARCHIVE_IDLE_SECONDS
+        self.idle_seconds = idle_seconds
+        self.index_interval = index_interval
+        self.read_size = 1024 * 1024
+
+    def build_segment_filename(self, charname: str, epoch: int or None) -> str:
+        """
+        build a segment file name, which is not already in use
+
+        :param charname: Everquest character the log belongs to
+        :param epoch: epoch of the first line of the session, None if unknown
+        :return: complete segment filename
+        """
+        base = os.path.basename(self.elf.build_filename(charname))
+        stem = base[:-len('.txt')]
+        stamp = time.strftime('%Y%m%d-%H%M%S', time.gmtime(epoch)) if epoch is not None else 'undated'
+
+        rv = self.archive_directory + f'{stem}.{stamp}.txt.gz'
+        count = 1
+        while os.path.exists(rv):
+            count += 1
+            rv = self.archive_directory + f'{stem}.{stamp}-{count}.txt.gz'
+        return rv
+
+    def candidates(self, exclude: tuple = ()) -> list[tuple[str, str]]:
+        """
+        find the log files which are safe to archive, i.e. idle, and not the one being followed
+
+        :param exclude: filenames to never touch, e.g. those being followed by running tails
+        :return: list of (filename, charname) tuples
+        """
+        files = self.directory_index.files()
+        if not files:
+            return list()
+
+        # the most recently modified log is the one the running tail follows, so never touch it
+        latest = max(files, key=lambda entry: entry[2])[0]
+        excluded = {os.path.normcase(os.path.abspath(filename)) for filename in exclude}
+        now = time.time()
+
+        rv = list()
+        for filename, charname, mtime in files:
+            if filename == latest or os.path.normcase(os.path.abspath(filename)) in excluded:
+                continue
+            if now - mtime < self.idle_seconds:
+                continue
+            rv.append((filename, charname))
+        return rv
+
+    def find_sessions(self, filename: str, end: int = None) -> list[int]:
+        """
+        find the start of each session in a log file
+
+        :param filename: full log filename
+        :param end: only look at the file up to this byte offset, None for all of it
+        :return: list of byte offsets of the session starts, always starting with 0 for a non-empty file
+        """
+        rv = list()
+        offset = 0
+        with open(filename, 'rb', buffering=self.read_size) as f:
+            for line in f:
+                if end is not None and offset >= end:
+                    break
+                if not rv or line.startswith(SESSION_MARKER, EverquestLogFile.MESSAGE_OFFSET):
+                    rv.append(offset)
+                offset += len(line)
+        return rv
+
+    def archive_file(self, filename: str, charname: str, dry_run: bool = False) -> list[str]:
+        """
+        roll the completed sessions off one log file into segments, and rewrite the log
+        to hold only the last session
+
+        :param filename: full log filename
+        :param charname: Everquest character the log belongs to
+        :param dry_run: True to only report what would be archived
+        :return: list of segment filenames written
+        """
+        # only the log as it is now is archived, anything written after this is carried over to the new log
+        before = os.stat(filename)
+        sessions = self.find_sessions(filename, before.st_size)
+
+        # the last session is the current one, so there must be at least two
+        if len(sessions) < 2:
+            return list()
+        cutoff = sessions[-1]
+        if dry_run:
+            EverquestLogFile.starprint(f'Would archive {len(sessions) - 1} session(s), {cutoff:,} bytes, from {filename}')
+            return list()
+
+        os.makedirs(self.archive_directory, exist_ok=True)
+        temp_filename = filename + '.archiving'
+        segments = list()
+        writer = None
+        replaced = False
+        try:
+            with open(filename, 'rb', buffering=self.read_size) as f:
+
+                # write each completed session to its own segment
+                boundaries = set(sessions)
+                offset = 0
+                for line in f:
+                    if offset in boundaries:
+                        if writer:
+                            writer.close()
+                        if offset == cutoff:
+                            writer = None
+                            break
+                        epoch = self._session_epoch(line)
+                        writer = SegmentWriter(self.build_segment_filename(charname, epoch), filename, self.index_interval)
+                        segments.append(writer)
+                    writer.write_line(line)
+                    offset += len(line)
+
+                # copy the current session to the replacement live log, then anything written since
+                f.seek(cutoff)
+                with open(temp_filename, 'xb') as out:
+                    self._copy(f, out, before.st_size - cutoff)
+                    after = os.stat(filename)
+                    if after.st_size < before.st_size:
+                        raise OSError(f'{filename} was truncated while being archived')
+                    self._copy(f, out)
+                    out.flush()
+                    os.fsync(out.fileno())
+
+                # Windows will not replace a file which is open, ours included, so there no writer can
+                # still have the old log open after the swap either
+                if os.name == 'nt':
+                    f.close()
+
+                # keep the mod time, so the archived log does not suddenly look like the latest one
+                os.utime(temp_filename, ns=(after.st_atime_ns, after.st_mtime_ns))
+                os.replace(temp_filename, filename)
+                replaced = True
+
+                # a writer which still had the old log open may have added to it since, so carry that over too
+                if not f.closed:
+                    with open(filename, 'ab') as out:
+                        self._copy(f, out)
+
+        except OSError:
+            # once the live log has been replaced, the segments are the only copy of the archived sessions
+            if not replaced:
+                if writer:
+                    writer.abort()
+                for segment in segments:
+                    segment.abort()
+                try:
+                    os.remove(temp_filename)
+                except OSError:
+                    pass
+            raise
+
+        return [segment.filename for segment in segments]
+
+    def _copy(self, source, destination, size: int = None) -> int:
+        """
+        copy from one open file to another, from the current position of each
+
+        :param source: binary file object to copy from
+        :param destination: binary file object to copy to
+        :param size: number of bytes to copy, None for everything up to the end of source
+        :return: number of bytes copied
+        """
+        rv = 0
+        while size is None or rv < size:
+            data = source.read(self.read_size if size is None else min(self.read_size, size - rv))
+            if not data:
+                break
+            destination.write(data)
+            rv += len(data)
+        return rv
+
+    @staticmethod
+    def _session_epoch(line: bytes) -> int or None:
+        """
+        :return: epoch of the first line of a session, or None if it does not have a date-time stamp
+        """
+        try:
+            return EverquestLogFile.TimestampParser().parse(line)
+        except ValueError:
+            return None
+
+    def archive(self, exclude: tuple = (), dry_run: bool = False) -> list[str]:
+        """
+        archive every log file which is safe to archive
+
+        :param exclude: filenames to never touch, e.g. those being followed by running tails
+        :param dry_run: True to only report what would be archived
+        :return: list of segment filenames written
+        """
+        rv = list()
+        for filename, charname in self.candidates(exclude):
+            try:
+                segments = self.archive_file(filename, charname, dry_run)
+            except OSError as err:
+                EverquestLogFile.starprint(f'Unable to archive {filename}: {err}')
+                continue
+            if segments:
+                EverquestLogFile.starprint(f'Archived {len(segments)} session(s) from {filename}')
+            rv.extend(segments)
+        return rv
+
+
+#################################################################################################
+#
+# standalone functions
+#
+
+def index_filename(segment_filename: str) -> str:
+    """
+    :param segment_filename: full segment filename
+    :return: full filename of the segment's sidecar index
+    """
+    return segment_filename + '.idx'
+
+
+def read_index(segment_filename: str) -> dict:
+    """
+    :param segment_filename: full segment filename
+    :return: the segment's sidecar index
+    """
+    with open(index_filename(segment_filename)) as f:
+        return json.load(f)
+
+
+def find_block(index: dict, epoch: int) -> list:
+    """
+    find the indexed block to start reading from for epoch, i.e. the last block starting before epoch,
+    since the lines stamped epoch may begin part way through it
+
+    :param index: a segment's sidecar index
+    :param epoch: epoch to seek to
+    :return: [epoch, uncompressed offset, compressed offset] index entry, or None if the segment is empty
+    """
+    blocks = index['blocks']
+    if not blocks:
+        return None
+    i = bisect.bisect_left(blocks, epoch, _first_stamped(blocks), key=_block_epoch)
+    return blocks[max(i - 1, 0)]
+
+
+def find_block_after(index: dict, epoch: int) -> list or None:
+    """
+    find the first indexed block stamped after epoch, i.e. the first which can only hold later lines
+
+    :param index: a segment's sidecar index
+    :param epoch: epoch to search for
+    :return: [epoch, uncompressed offset, compressed offset] index entry, or None if there is no such block
+    """
+    blocks = index['blocks']
+    i = bisect.bisect_right(blocks, epoch, _first_stamped(blocks), key=_block_epoch)
+    return blocks[i] if i < len(blocks) else None
+
+
+def _first_stamped(blocks: list) -> int:
+    """
+    :return: index of the first block with an epoch, i.e. skipping those before the first stamped line
+    """
+    rv = 0
+    while rv < len(blocks) and blocks[rv][0] is None:
+        rv += 1
+    return rv
+
+
+def _block_epoch(block: list) -> int:
+    return block[0]
+
+
+@contextlib.contextmanager
+def open_segment(segment_filename: str, epoch: int = None,
+                 index: dict = None) -> contextlib.AbstractContextManager[gzip.GzipFile]:
+    """
+    open a segment for reading, positioned at the start of the indexed block containing epoch,
+    i.e. at or shortly before the first line stamped epoch or later
+
+    :param segment_filename: full segment filename
+    :param epoch: epoch to seek to, None for the start of the segment
+    :param index: the segment's sidecar index, None to read it
+    :return: context manager for a binary file object of uncompressed log text
+    """
+    offset = 0
+    if epoch is not None:
+        if index is None:
+            index = read_index(segment_filename)
+        block = find_block(index, epoch)
+        if block:
+            offset = block[2]
+
+    with open(segment_filename, 'rb') as raw:
+        raw.seek(offset)
+        with gzip.GzipFile(fileobj=raw, mode='rb') as rv:
+            yield rv
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Roll completed sessions off the idle Everquest logs '
+                                                 'into compressed, indexed segments')
+    parser.add_argument('--idle-seconds', type=float, default=None,
+                        help='only archive logs not modified for this many seconds')
+    parser.add_argument('--dry-run', action='store_true', help='only report what would be archived')
+    args = parser.parse_args()
+
+    archiver = LogArchiver(args.idle_seconds)
+    segments = archiver.archive(dry_run=args.dry_run)
+    if not args.dry_run:
+        EverquestLogFile.starprint(f'{len(segments)} segment(s) written to {archiver.archive_directory}')
+    ConsoleWriter.flush()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+import os
+import re
+import time
+
+
+# number of seconds between refreshes of the mod times of every indexed file, as opposed to just those
+# being followed
+RESTAT_SECONDS = 60.0
+
+
+class LogDirectoryIndex:
+    """
+    cached index of the character log files in the logs directory, i.e. all files
+    named eqlog_<charname>_<server>.txt
+
+    The directory listing, and the character name parsed from each filename, are only
+    rebuilt (with a single os.scandir() pass) when the mod time of the directory itself
+    changes, i.e. when log files are created, deleted or renamed.
+
+    Note that appending to a file does not change the directory mod time, and Everquest
+    appends to an existing log file whenever a previously played character logs in.  So
+    between rescans the mod times of the files being followed, which the caller names, are
+    refreshed with one stat() each, every time.  The rest, which may be hundreds of old
+    character logs, are only refreshed when the caller asks for a full refresh, e.g. once
+    the heartbeat has expired with the followed log idle, which is when a switch to a
+    previously played character shows up, or else every restat_seconds.
+    """
+
+    def __init__(self, directory: str, server_name: str, restat_seconds: float = RESTAT_SECONDS) -> None:
+        """
+        ctor
+
+        :param directory: logs directory, including the trailing path separator
+        :param server_name: server name, as it appears in the log filenames
+        :param restat_seconds: number of seconds between refreshes of the mod times of every indexed file
+        """
+        self.directory = directory
+        self.server_name = server_name
+        self.restat_seconds = restat_seconds
+        self._filename_regexp = re.compile(r'eqlog_(?P<charname>[\w ]+)_' + re.escape(server_name) + r'\.txt')
+
+        # mod time of the directory as of the last scan
+        self._dir_mtime = None
+
+        # dictionary of filename: [charname, mod time]
+        self._entries = dict()
+
+        # time.monotonic() of the last refresh of the mod times of every indexed file
+        self._restat_time = None
+
+    def parse_charname(self, name: str) -> str or None:
+        """
+        extract the character name from a log filename
+
+        :param name: log filename, without the directory
+        :return: character name, or None if this is not a log file for this server
+        """
+        m = self._filename_regexp.fullmatch(name)
+        if m:
+            return m.group('charname')
+        return None
+
+    def _scan(self) -> None:
+        """
+        rebuild the index from a fresh directory listing
+        """
+        entries = dict()
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                charname = self.parse_charname(entry.name)
+                if charname:
+                    try:
+                        entries[self.directory + entry.name] = [charname, entry.stat().st_mtime]
+                    except OSError:
+                        pass
+        self._entries = entries
+        self._restat_time = time.monotonic()
+
+    def _restat(self, filenames) -> None:
+        """
+        refresh the mod times of some of the already indexed files
+
+        :param filenames: filenames to be refreshed, those not in the index are ignored
+        """
+        for filename in list(filenames):
+            if filename not in self._entries:
+                continue
+            try:
+                self._entries[filename][1] = os.stat(filename).st_mtime
+            except OSError:
+                del self._entries[filename]
+
+    def refresh(self, followed: tuple = (), full: bool = False) -> None:
+        """
+        bring the index up to date
+
+        :param followed: filenames of the log files being followed, whose mod times are always refreshed
+        :param full: True to refresh the mod times of every indexed file, not just the followed ones
+        """
+        try:
+            dir_mtime = os.stat(self.directory).st_mtime_ns
+        except OSError:
+            # no logs directory, so no log files
+            self._dir_mtime = None
+            self._entries.clear()
+            return
+
+        if dir_mtime != self._dir_mtime:
+            self._scan()
+            self._dir_mtime = dir_mtime
+        elif full or time.monotonic() - self._restat_time >= self.restat_seconds:
+            self._restat(self._entries)
+            self._restat_time = time.monotonic()
+        else:
+            self._restat(followed)
+
+    def files(self, followed: tuple = (), full: bool = False) -> list[tuple[str, str, float]]:
+        """
+        list all the log files
+
+        :param followed: filenames of the log files being followed, see refresh()
+        :param full: True to refresh every indexed file, see refresh()
+        :return: list of (filename, charname, mod time) tuples
+        """
+        self.refresh(followed, full)
+        return [(filename, charname, mtime) for filename, (charname, mtime) in self._entries.items()]
+
+    def latest(self, followed: tuple = (), full: bool = False) -> tuple[str, str] or None:
+        """
+        find the log file with the most recent mod time (i.e. latest)
+
+        :param followed: filenames of the log files being followed, see refresh()
+        :param full: True to refresh every indexed file, see refresh()
+        :return: (filename, charname) tuple, or None if there are no log files
+        """
+        self.refresh(followed, full)
+
+        rv = None
+        latest_mtime = None
+        for filename, (charname, mtime) in self._entries.items():
+            if latest_mtime is None or mtime > latest_mtime:
+                latest_mtime = mtime
+                rv = (filename, charname)
+        return rv
+
+    def active(self, now: float, seconds: float, followed: tuple = (), full: bool = False) -> list[tuple[str, str]]:
+        """
+        find the log files modified recently
+
+        :param now: current time, epoch seconds
+        :param seconds: files modified within this many seconds of now are considered active
+        :param followed: filenames of the log files being followed, see refresh()
+        :param full: True to refresh every indexed file, see refresh()
+        :return: list of (filename, charname) tuples
+        """
+        self.refresh(followed, full)
+        return [(filename, charname) for filename, (charname, mtime) in self._entries.items()
+                if now - mtime <= seconds]
@@ -0,0 +1,543 @@
+import collections
+import sys
+import threading
+import time
+
+import myconfig
+import ConsoleWriter
+import DeathLoopVaccine
+import EverquestLogFile
+import Metrics
+
+
+#
+# one shared reader per log file, fanning parsed events out to any number of consumers.
+#
+# Without the bus, every tool following a character log (e.g. DeathLoopVaccine, plus whatever else is
+# watching the same character) opens its own file handle, runs its own thread, waits on its own timer,
+# and re-reads and re-parses every line.  A LogEventBus reads the log once, in bytes mode, parses each
+# line once into a small slotted LogEvent (epoch, category, file offset of the line, the raw line, and the
+# LogSource it was read from), and hands each batch of events to every Subscriber.  A new LogSource is made
+# every time the bus opens a log, so a consumer can tell exactly where in its queue the bus rolled over to
+# another log, even with events from the old log still queued.
+#
+# Each Subscriber has its own bounded queue, and its own backpressure policy for when that queue is full:
+#
+#   BLOCK:          the reader waits for room, for at most block_timeout seconds, then drops the rest.  after
+#                   a timeout, the reader no longer waits for that subscriber, until its consumer takes some events
+#   DROP_NEWEST:    the events which don't fit are dropped
+#   DROP_OLDEST:    the oldest queued events are dropped to make room
+#
+# so a slow consumer either slows the reader down (explicitly, and boundedly), or loses events, and the
+# choice is made per consumer.  Dropped events are counted, in the Subscriber and in the metrics.
+#
+# A Subscriber may also ask for only some categories of event, e.g. deaths, so lines it does not care
+# about cost it nothing.  Events are queued and taken a batch at a time, with one lock round trip per
+# batch rather than per event, so each extra consumer costs little more than a list per batch.
+#
+# EventConsumer is a thread which drains one Subscriber, and hands each batch to process_events().
+# LogFileConsumer adapts an existing EverquestLogFile child class (e.g. DeathLoopVaccine) into such a
+# consumer, so its process_event() / process_line() logic runs off the shared reader, in bytes mode, using
+# the category and date-time stamp already parsed by the reader.  Its thread is never started, and it never
+# follows the file itself, though it does read back through it once for each file, from just before the
+# first event it is handed from each LogSource, so its backfill() rebuilds its state just as its own open()
+# would.
+#
+# usage:
+#
+#   python LogEventBus.py
+#
+# runs a DeathLoopVaccine and a death counter against the latest log, from one shared reader
+#
+
+# subscriber backpressure policies
+BLOCK = 'block'
+DROP_NEWEST = 'drop-newest'
+DROP_OLDEST = 'drop-oldest'
+POLICIES = (BLOCK, DROP_NEWEST, DROP_OLDEST)
+
+# default maximum number of seconds the reader waits for room in a BLOCK subscriber's queue, so one stuck
+# consumer can't stall the reader, and every other consumer, for good
+BLOCK_TIMEOUT_SECONDS = 2.0
+
+# the log file a LogEvent was read from, one per open() of the bus, so compared by identity
+LogSource = collections.namedtuple('LogSource', ['filename', 'char_name'])
+
+
+class LogEvent:
+    """
+    class for one parsed log line
+    """
+
+    __slots__ = ('epoch', 'category', 'offset', 'line', 'source')
+
+    def __init__(self, epoch: int or None, category: str, offset: int, line: bytes, source: LogSource = None) -> None:
+        """
+        ctor
+
+        :param epoch: line date-time stamp, as from TimestampParser, or None if the line has no valid stamp
+        :param category: line category, as from DeathLoopVaccine.LineClassifier
+        :param offset: file offset of the start of the line
+        :param line: the raw line, without line terminator, still undecoded
+        :param source: the log file the line was read from
+        """
+        self.epoch = epoch
+        self.category = category
+        self.offset = offset
+        self.line = line
+        self.source = source
+
+    def __repr__(self) -> str:
+        return f'LogEvent({self.epoch}, {self.category!r}, {self.offset}, {self.line!r})'
+
+
+class Subscriber:
+    """
+    class for one consumer's bounded queue of events
+    """
+
+    def __init__(self, name: str, maxsize: int = None, policy: str = BLOCK,
+                 categories: frozenset = None, block_timeout: float = BLOCK_TIMEOUT_SECONDS) -> None:
+        """
+        ctor
+
+        :param name: subscriber name, for the metrics and status messages
+        :param maxsize: maximum number of queued events, None for myconfig.EVENT_QUEUE_SIZE
+        :param policy: what to do when the queue is full, one of POLICIES
+        :param categories: set of event categories wanted, None for every event
+        :param block_timeout: BLOCK policy only, maximum number of seconds the reader waits for room
+                              on each batch, None to wait as long as it takes
+        """
+        if policy not in POLICIES:
+            raise ValueError(f'Unknown backpressure policy [{policy}], choose from {POLICIES}')
+        self.name = name
+        self.maxsize = maxsize or myconfig.EVENT_QUEUE_SIZE
+        self.policy = policy
+        self.categories = frozenset(categories) if categories is not None else None
+        self.block_timeout = block_timeout
+
+        # the deque bounds itself for DROP_OLDEST, and is bounded by hand for the other policies
+        self._queue = collections.deque(maxlen=self.maxsize if policy == DROP_OLDEST else None)
+        self._condition = threading.Condition()
+        self._closed = False
+
+        # BLOCK policy only, set once the reader has timed out waiting for room, and cleared by get()
+        self._stalled = False
+
+        self.dropped = 0
+        self._dropped_metric = Metrics.BUS_DROPPED_EVENTS.labels(name)
+        self._depth_metric = Metrics.BUS_QUEUE_DEPTH.labels(name)
+
+    def __len__(self) -> int:
+        return len(self._queue)
+
+    def is_closed(self) -> bool:
+        return self._closed
+
+    def put(self, events: list[LogEvent]) -> int:
+        """
+        queue a batch of events, applying the backpressure policy if the queue is full.
+        called from the reader thread
+
+        :param events: list of LogEvents
+        :return: number of events queued
+        """
+        queue = self._queue
+        with self._condition:
+            if self._closed:
+                return 0
+
+            if self.policy == DROP_OLDEST:
+                dropped = max(0, len(queue) + len(events) - self.maxsize)
+                queue.extend(events)
+                rv = len(events)
+
+            elif self.policy == DROP_NEWEST:
+                rv = min(len(events), self.maxsize - len(queue))
+                queue.extend(events[:rv])
+                dropped = len(events) - rv
+
+            # BLOCK, so wait for room, a batch at a time, unless the consumer is already known to be stuck
+            else:
+                timeout = 0.0 if self._stalled else self.block_timeout
+                deadline = None if timeout is None else time.monotonic() + timeout
+                rv = 0
+                while True:
+                    room = self.maxsize - len(queue)
+                    if room > 0:
+                        queue.extend(events[rv:rv + room])
+                        rv = min(len(events), rv + room)
+                        self._condition.notify_all()
+                    if rv == len(events) or self._closed:
+                        break
+                    timeout = None if deadline is None else deadline - time.monotonic()
+                    if timeout is not None and timeout <= 0:
+                        self._stalled = True
+                        break
+                    self._condition.wait(timeout)
+                dropped = len(events) - rv
+
+            self._condition.notify_all()
+            depth = len(queue)
+
+        if dropped:
+            self.dropped += dropped
+            self._dropped_metric.inc(dropped)
+        self._depth_metric.set(depth)
+        return rv
+
+    def get(self, timeout: float = None, max_events: int = None) -> list[LogEvent] or None:
+        """
+        take the queued events, waiting for some if there are none.
+        called from the consumer thread
+
+        :param timeout: maximum number of seconds to wait, None to wait as long as it takes
+        :param max_events: maximum number of events to take, None for all of them
+        :return: list of LogEvents, oldest first, empty if the timeout expired, or None once closed and drained
+        """
+        queue = self._queue
+        with self._condition:
+            if not queue and not self._closed:
+                self._condition.wait_for(lambda: queue or self._closed, timeout)
+            if not queue:
+                return None if self._closed else []
+
+            if max_events is None or max_events >= len(queue):
+                rv = list(queue)
+                queue.clear()
+            else:
+                rv = [queue.popleft() for _ in range(max_events)]
+            self._stalled = False
+
+            # wake the reader, if it is blocked waiting for room
+            self._condition.notify_all()
+        return rv
+
+    def close(self) -> None:
+        """
+        stop accepting events.  the consumer may still take those already queued
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+
+class LogEventBus(EverquestLogFile.EverquestLogFile):
+    """
+    class to read a log file once, and fan the parsed events out to any number of subscribers.
+
+    the class derives from the EverquestLogFile class for the file handling, i.e. opening the
+    latest log, chunked reads, and heartbeat rollover, and overloads process_lines() to parse
+    each batch of lines into LogEvents and publish them
+    """
+
+    def __init__(self) -> None:
+        """
+        ctor
+        """
+        # parent ctor
+        super().__init__()
+
+        # lines are classified, and passed on to the subscribers, as raw bytes
+        self.bytes_mode = True
+
+        # tuple of Subscribers, replaced rather than modified, so the reader thread never needs a lock
+        self._subscribers = tuple()
+
+        self._classifier = DeathLoopVaccine.LineClassifier(self.char_name, True, self.encoding)
+        self._timestamp_parser = EverquestLogFile.TimestampParser()
+
+        # file offset of the first line in the next batch, and of the first line in the current batch
+        self._offset = 0
+        self._batch_offset = 0
+        self._terminator_bytes = 1
+
+        # the log file currently open, as stamped on every event read from it
+        self._source = None
+
+    def subscribe(self, name: str, maxsize: int = None, policy: str = BLOCK,
+                  categories: frozenset = None, block_timeout: float = BLOCK_TIMEOUT_SECONDS) -> Subscriber:
+        """
+        add a subscriber.  safe to call from any thread, and at any time
+
+        :param name: subscriber name
+        :param maxsize: see Subscriber
+        :param policy: see Subscriber
+        :param categories: see Subscriber
+        :param block_timeout: see Subscriber
+        :return: the new Subscriber
+        """
+        rv = Subscriber(name, maxsize, policy, categories, block_timeout)
+        self._subscribers = self._subscribers + (rv,)
+        return rv
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        """
+        remove a subscriber, and close its queue
+
+        :param subscriber: Subscriber returned by subscribe()
+        """
+        self._subscribers = tuple(s for s in self._subscribers if s is not subscriber)
+        subscriber.close()
+
+    def open(self, charname: str, filename: str, seek_end=True) -> bool:
+        """
+        open the file, as the base class, and rebuild the classifier for the new character
+
+        :param charname: character name whose log file is to be opened
+        :param filename: full log filename
+        :param seek_end:  True if parsing is to begin at the end of the file, False if at the beginning
+        :return: True if a new file was opened, False otherwise
+        """
+        self._classifier = DeathLoopVaccine.LineClassifier(charname, True, self.encoding)
+        rv = super().open(charname, filename, seek_end)
+        if rv:
+            self._offset = self.file.tell() - len(self._partial)
+            self._source = LogSource(filename, charname)
+        return rv
+
+    def read_lines(self) -> list[bytes]:
+        """
+        get all complete lines available in the next block of the file, as the base class, and
+        note the file offset the batch starts at
+
+        :return: list of lines, empty if no new complete lines to be read
+        """
+        lines = super().read_lines()
+        if lines:
+            self._batch_offset = self._offset
+            self._offset = self.file.tell() - len(self._partial)
+
+            # the carriage returns have been stripped, so work out whether they were there
+            terminators = self._offset - self._batch_offset - sum(map(len, lines))
+            self._terminator_bytes = 2 if terminators == 2 * len(lines) else 1
+        return lines
+
+    def process_lines(self, lines: list[bytes]) -> None:
+        """
+        parse a batch of lines into LogEvents, and publish them
+
+        :param lines: list of lines from logfile to be processed, as bytes
+        """
+        classify = self._classifier.classify
+        parse = self._timestamp_parser.parse
+        terminator_bytes = self._terminator_bytes
+        offset = self._batch_offset
+        source = self._source
+
+        events = list()
+        for line in lines:
+            try:
+                epoch = parse(line)
+            except ValueError:
+                epoch = None
+            events.append(LogEvent(epoch, classify(line), offset, line, source))
+            offset += len(line) + terminator_bytes
+
+        self.publish(events)
+
+    def publish(self, events: list[LogEvent]) -> None:
+        """
+        hand a batch of events to every subscriber, filtered by the categories each one wants
+
+        :param events: list of LogEvents
+        """
+        by_category = None
+        for subscriber in self._subscribers:
+            if subscriber.categories is None:
+                subscriber.put(events)
+                continue
+
+            # sort the batch by category once, and only if some subscriber is choosy
+            if by_category is None:
+                by_category = dict()
+                for event in events:
+                    by_category.setdefault(event.category, list()).append(event)
+            categories = subscriber.categories
+            if len(categories) == 1:
+                selected = by_category.get(next(iter(categories)))
+            else:
+                selected = [event for event in events if event.category in categories]
+            if selected:
+                subscriber.put(selected)
+
+    def run(self) -> None:
+        """
+        override the thread.run() method
+        this method will execute in its own thread
+        """
+        try:
+            super().run()
+        finally:
+            # no more events, so let the consumers drain their queues and finish
+            for subscriber in self._subscribers:
+                subscriber.close()
+
+
+class EventConsumer(threading.Thread):
+    """
+    class to take the events from one subscriber queue, in a thread of its own.
+
+    The custom event handling logic in the child class is accomplished by
+    overloading the process_events() method
+    """
+
+    def __init__(self, bus: LogEventBus, name: str, maxsize: int = None, policy: str = BLOCK,
+                 categories: frozenset = None, block_timeout: float = BLOCK_TIMEOUT_SECONDS) -> None:
+        """
+        ctor
+
+        :param bus: LogEventBus to subscribe to
+        :param name: subscriber name
+        :param maxsize: see Subscriber
+        :param policy: see Subscriber
+        :param categories: see Subscriber
+        :param block_timeout: see Subscriber
+        """
+        # parent ctor
+        # the daemon=True parameter causes this child thread object to terminate
+        # when the parent thread terminates
+        super().__init__(daemon=True)
+
+        self.bus = bus
+        self.subscriber = bus.subscribe(name, maxsize, policy, categories, block_timeout)
+
+    def stop(self) -> None:
+        """
+        unsubscribe, and end the thread once the queued events have been processed
+        """
+        self.bus.unsubscribe(self.subscriber)
+
+    def run(self) -> None:
+        """
+        override the thread.run() method
+        this method will execute in its own thread
+        """
+        while True:
+            events = self.subscriber.get()
+            if events is None:
+                break
+            self.process_events(events)
+
+    def process_events(self, events: list[LogEvent]) -> None:
+        """
+        virtual method, to be overridden in derived classes to do whatever specialized
+        processing is required for that application.
+
+        Default behavior is to simply print the lines, at VERBOSE level
+
+        :param events: list of LogEvents, oldest first
+        """
+        if ConsoleWriter.is_enabled(ConsoleWriter.VERBOSE):
+            for event in events:
+                ConsoleWriter.write(self.bus.decode(event.line).rstrip(), ConsoleWriter.VERBOSE)
+
+
+class LogFileConsumer(EventConsumer):
+    """
+    class to run an EverquestLogFile child class, e.g. DeathLoopVaccine, off a shared LogEventBus.
+    the object's own thread is never started, and it never opens the log file
+    """
+
+    def __init__(self, bus: LogEventBus, elf: EverquestLogFile.EverquestLogFile, name: str = None,
+                 maxsize: int = None, policy: str = BLOCK, block_timeout: float = BLOCK_TIMEOUT_SECONDS) -> None:
+        """
+        ctor
+
+        :param bus: LogEventBus to subscribe to
+        :param elf: EverquestLogFile object, whose process_event() is called with every event
+        :param name: subscriber name, None for the class name of elf
+        :param maxsize: see Subscriber
+        :param policy: see Subscriber
+        :param block_timeout: see Subscriber
+        """
+        super().__init__(bus, name or type(elf).__name__, maxsize, policy, None, block_timeout)
+        self.elf = elf
+        self.elf.bytes_mode = True
+        self.elf.encoding = bus.encoding
+
+        # the log file the object was last handed events from, so it is backfilled once per file
+        self._source = None
+
+    def backfill(self, event: LogEvent) -> None:
+        """
+        give the EverquestLogFile object the chance to rebuild its state from the log, as its own open()
+        would, by reading back from just before the first event it is handed, through a handle of its own
+
+        :param event: the first event from a new log file
+        """
+        elf = self.elf
+        self._source = event.source
+        elf.filename = event.source.filename
+        elf.char_name = event.source.char_name
+        end = event.offset
+        try:
+            with open(elf.filename, 'rb') as f:
+                f.seek(end)
+                elf.file = f
+                elf.backfill()
+        except OSError as err:
+            EverquestLogFile.starprint('Unable to backfill from log file: {0}'.format(err))
+        finally:
+            elf.file = None
+
+    def process_events(self, events: list[LogEvent]) -> None:
+        """
+        hand the raw lines, with their categories and date-time stamps, to the EverquestLogFile object,
+        backfilling it first from each new log file, at the first event read from it
+
+        :param events: list of LogEvents, oldest first
+        """
+        elf = self.elf
+        elf.prevtime = time.time()
+        process_event = elf.process_event
+        source = self._source
+        for event in events:
+            if event.source is not source and event.source is not None:
+                self.backfill(event)
+                source = event.source
+            process_event(event.epoch, event.category, event.line)
+
+
+#
+# test driver
+#
+class _DeathCounter(EventConsumer):
+    """
+    example consumer, which only subscribes to the deaths
+    """
+
+    def __init__(self, bus: LogEventBus) -> None:
+        super().__init__(bus, 'death-counter', policy=DROP_OLDEST, categories=DeathLoopVaccine.DEATHS)
+        self.count = 0
+
+    def process_events(self, events: list[LogEvent]) -> None:
+        self.count += len(events)
+        EverquestLogFile.starprint(f'LogEventBus:  {self.count} death(s) seen')
+
+
+def main():
+    bus = LogEventBus()
+    consumers = [LogFileConsumer(bus, DeathLoopVaccine.DeathLoopVaccine()), _DeathCounter(bus)]
+    for consumer in consumers:
+        consumer.start()
+
+    # block, without using any CPU, until Ctrl-C or SIGTERM, then shut down cleanly
+    supervisor = EverquestLogFile.Supervisor(bus)
+    supervisor.install_signal_handlers()
+    started = supervisor.start()
+    if started:
+        supervisor.join()
+    for consumer in consumers:
+        consumer.stop()
+        consumer.join()
+    if not started:
+        EverquestLogFile.starprint('LogEventBus - unable to start parsing, exiting')
+        ConsoleWriter.flush()
+        sys.exit(1)
+    EverquestLogFile.starprint('LogEventBus - shut down')
+    ConsoleWriter.flush()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,265 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import sys
+import threading
+import time
+
+
+#
+# pluggable wait strategies, used by the EverquestLogFile parsing thread to block
+# until a log file actually grows, rather than sleeping a fixed interval between reads.
+#
+#   InotifyWaiter:  Linux only.  Blocks in select() on an inotify file descriptor, so the
+#                   thread wakes up essentially as soon as the file is written to, and uses
+#                   no CPU at all while the log is quiet.
+#
+#   PollingWaiter:  Portable fallback.  Checks the size and mod time of the watched files,
+#                   starting with a very short interval and backing off towards a maximum
+#                   interval the longer the files stay quiet.
+#
+class LogFileWaiter:
+    """
+    base class for the wait strategies.
+    """
+
+    def watch(self, filename: str) -> None:
+        """
+        begin watching a file for changes
+
+        :param filename: full log filename
+        """
+        raise NotImplementedError
+
+    def unwatch(self, filename: str) -> None:
+        """
+        stop watching a file for changes
+
+        :param filename: full log filename
+        """
+        raise NotImplementedError
+
+    def wait(self, timeout: float) -> bool:
+        """
+        block until one of the watched files changes, or the timeout expires
+
+        :param timeout: maximum number of seconds to wait
+        :return: True if a watched file (probably) changed, or the waiter was woken,
+                 False if the wait timed out
+        """
+        raise NotImplementedError
+
+    def wake(self) -> None:
+        """
+        wake up a thread blocked in wait(), e.g. at shutdown.  safe to call from any thread
+        """
+        raise NotImplementedError
+
+    def poll(self) -> bool:
+        """
+        check, without blocking, whether any of the watched files has changed since the last check
+
+        :return: True if a watched file (probably) changed
+        """
+        raise NotImplementedError
+
+    def fileno(self) -> int or None:
+        """
+        :return: a file descriptor which becomes readable when a watched file changes, for use with
+                 select() or an event loop, or None if this wait strategy does not provide one
+        """
+        return None
+
+    def close(self) -> None:
+        """
+        release any resources held by the waiter
+        """
+        pass
+
+
+class PollingWaiter(LogFileWaiter):
+    """
+    portable wait strategy, which polls the size and mod time of the watched files
+    with an adaptive backoff
+    """
+
+    def __init__(self, min_interval: float = 0.005, max_interval: float = 0.1) -> None:
+        """
+        ctor
+
+        :param min_interval: initial polling interval, seconds
+        :param max_interval: the polling interval doubles up to this limit, seconds
+        """
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+
+        # dictionary of filename: (size, mod time) as of the last check
+        self._signatures = dict()
+
+        # set by wake() to interrupt a wait
+        self._wakeup = threading.Event()
+
+    @staticmethod
+    def _signature(filename: str) -> tuple:
+        """
+        :param filename: full log filename
+        :return: (size, mod time) tuple, or None if the file cannot be stat'ed
+        """
+        try:
+            st = os.stat(filename)
+            return st.st_size, st.st_mtime_ns
+        except OSError:
+            return None
+
+    def watch(self, filename: str) -> None:
+        self._signatures[filename] = self._signature(filename)
+
+    def unwatch(self, filename: str) -> None:
+        self._signatures.pop(filename, None)
+
+    def poll(self) -> bool:
+        changed = False
+        for filename, signature in self._signatures.items():
+            current = self._signature(filename)
+            if current != signature:
+                self._signatures[filename] = current
+                changed = True
+        return changed
+
+    def wait(self, timeout: float) -> bool:
+        deadline = time.monotonic() + timeout
+        interval = self.min_interval
+        while True:
+            if self.poll():
+                return True
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            if self._wakeup.wait(min(interval, remaining)):
+                self._wakeup.clear()
+                return True
+            interval = min(interval * 2, self.max_interval)
+
+    def wake(self) -> None:
+        self._wakeup.set()
+
+
+class InotifyWaiter(LogFileWaiter):
+    """
+    Linux wait strategy, which blocks on an inotify file descriptor
+    """
+
+    # inotify constants, from <sys/inotify.h>
+    IN_MODIFY = 0x00000002
+    IN_ATTRIB = 0x00000004
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVE_SELF = 0x00000800
+    IN_DELETE_SELF = 0x00000400
+    IN_NONBLOCK = os.O_NONBLOCK
+    IN_CLOEXEC = 0o2000000
+
+    WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVE_SELF | IN_DELETE_SELF
+
+    def __init__(self) -> None:
+        """
+        ctor
+
+        :raises OSError: if inotify is not available
+        """
+        libc_name = ctypes.util.find_library('c') or 'libc.so.6'
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+
+        self._fd = self._libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self._fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+
+        # dictionary of filename: watch descriptor
+        self._watches = dict()
+
+        # self-pipe, written to by wake() to interrupt a wait
+        self._wake_r, self._wake_w = os.pipe()
+        os.set_blocking(self._wake_r, False)
+        os.set_blocking(self._wake_w, False)
+
+    def watch(self, filename: str) -> None:
+        if filename in self._watches:
+            return
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(filename), self.WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), filename)
+        self._watches[filename] = wd
+
+    def unwatch(self, filename: str) -> None:
+        wd = self._watches.pop(filename, None)
+        if wd is not None:
+            # the watch may already be gone, if the file was deleted, so ignore any error
+            self._libc.inotify_rm_watch(self._fd, wd)
+
+    @staticmethod
+    def _drain(fd: int) -> bool:
+        """
+        read and discard everything pending on a non-blocking file descriptor
+
+        :return: True if there was anything pending
+        """
+        rv = False
+        try:
+            while os.read(fd, 4096):
+                rv = True
+        except BlockingIOError:
+            pass
+        return rv
+
+    def wait(self, timeout: float) -> bool:
+        readable, _, _ = select.select([self._fd, self._wake_r], [], [], max(timeout, 0.0))
+        if not readable:
+            return False
+
+        # drain the pending events, we only care that something happened
+        for fd in readable:
+            self._drain(fd)
+        return True
+
+    def poll(self) -> bool:
+        return self._drain(self._fd)
+
+    def fileno(self) -> int or None:
+        return self._fd
+
+    def wake(self) -> None:
+        try:
+            os.write(self._wake_w, b'\0')
+        except BlockingIOError:
+            # pipe is full, so a wakeup is already pending
+            pass
+
+    def close(self) -> None:
+        if self._fd >= 0:
+            os.close(self._fd)
+            os.close(self._wake_r)
+            os.close(self._wake_w)
+            self._fd = -1
+            self._watches.clear()
+
+
+#################################################################################################
+#
+# standalone functions
+#
+
+def create_waiter() -> LogFileWaiter:
+    """
+    create the best wait strategy available on this platform
+
+    :return: LogFileWaiter object
+    """
+    if sys.platform.startswith('linux'):
+        try:
+            return InotifyWaiter()
+        except (OSError, AttributeError):
+            pass
+    return PollingWaiter()
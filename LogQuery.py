@@ -0,0 +1,356 @@
+import argparse
+import calendar
+import collections
+import concurrent.futures
+import datetime
+import glob
+import locale
+import os
+import re
+import sys
+
+import ConsoleWriter
+import DeathLoopVaccine
+import EverquestLogFile
+import LogArchiver
+
+
+#
+# time range queries over a character's log, and its archived segments.
+#
+# The live log is binary searched on the line date-time stamps, to find the byte range covering
+# the requested times, and that range is split into chunks.  Archived segments are seeked into
+# using their sidecar time index.  The chunks and segments are then scanned in parallel across a
+# process pool, and the matching lines are yielded, oldest first, as each chunk completes.
+#
+# Lines are matched using the same LineClassifier as DeathLoopVaccine, so the answers match what
+# the detector would have seen.
+#
+# usage:
+#
+#   python LogQuery.py CHARNAME [--start "2026-10-01 20:00"] [--end "2026-10-01 21:00"] [--category deaths]
+#
+
+# one matching line
+QueryMatch = collections.namedtuple('QueryMatch', ['filename', 'epoch', 'category', 'line'])
+
+# query categories, each the set of LineClassifier categories it matches, None for any
+TELLS = 'tells'
+QUERY_CATEGORIES = {
+    'all': None,
+    'deaths': frozenset((DeathLoopVaccine.DEATH,)),
+    'test-deaths': frozenset((DeathLoopVaccine.TEST_DEATH,)),
+    'afk-breakers': DeathLoopVaccine.AFK_BREAKERS,
+    'casting': frozenset((DeathLoopVaccine.CASTING,)),
+    'communication': frozenset((DeathLoopVaccine.COMMUNICATION,)),
+    'melee': frozenset((DeathLoopVaccine.MELEE,)),
+
+    # tells sent are communication, but tells received are not proof of life, so are classified as other
+    TELLS: frozenset((DeathLoopVaccine.COMMUNICATION, DeathLoopVaccine.OTHER)),
+}
+
+# the binary search stops once the range is narrowed to this many bytes
+SEARCH_SPAN = 64 * 1024
+
+# the live log is split into chunks of this many bytes, to be scanned in parallel
+CHUNK_BYTES = 16 * 1024 * 1024
+
+# latest possible epoch, for open ended queries
+END_OF_TIME = 2 ** 62
+
+
+class LineFilter:
+    """
+    class to decide whether a log line matches a query
+    """
+
+    def __init__(self, charname: str, category: str = 'all', start: int = 0, end: int = END_OF_TIME) -> None:
+        """
+        ctor
+
+        :param charname: Everquest character the log belongs to
+        :param category: query category name, from QUERY_CATEGORIES
+        :param start: earliest epoch to match, inclusive
+        :param end: latest epoch to match, inclusive
+        """
+        if category not in QUERY_CATEGORIES:
+            raise ValueError(f'Unknown category [{category}], choose from {sorted(QUERY_CATEGORIES)}')
+        self.category = category
+        self.categories = QUERY_CATEGORIES[category]
+        self.start = start
+        self.end = end
+
+        self._classifier = DeathLoopVaccine.LineClassifier(charname)
+        self._parser = EverquestLogFile.TimestampParser()
+        self._tell_regexp = None
+        if category == TELLS:
+            self._tell_regexp = re.compile(rf'You told|You tell|\w+ tells you,|{re.escape(charname)} ->')
+
+    def match(self, line: str) -> tuple[int, str] or None:
+        """
+        :param line: string with a single line from the logfile
+        :return: (epoch, category) tuple if the line matches, else None
+        """
+        category = self._classifier.classify(line)
+        if self.categories is not None and category not in self.categories:
+            return None
+        if self._tell_regexp and not self._tell_regexp.match(line, EverquestLogFile.MESSAGE_OFFSET):
+            return None
+        try:
+            epoch = self._parser.parse(line)
+        except ValueError:
+            return None
+        if epoch < self.start or epoch > self.end:
+            return None
+        return epoch, category
+
+
+#################################################################################################
+#
+# standalone functions
+#
+
+def parse_time(text: str) -> int:
+    """
+    convert a local date-time, e.g. '2026-10-01 20:15', to an epoch in the same convention
+    as TimestampParser, i.e. local time treated as UTC
+
+    :param text: date-time in ISO format, with or without the time
+    :return: epoch seconds
+    """
+    return calendar.timegm(datetime.datetime.fromisoformat(text).timetuple())
+
+
+def _first_stamp(f, pos: int, limit: int, parser: EverquestLogFile.TimestampParser) -> tuple[int, int] or None:
+    """
+    find the first line starting at or after pos which has a date-time stamp
+
+    :return: (line start offset, epoch) tuple, or None if there is no such line before limit
+    """
+    f.seek(pos)
+    if pos > 0:
+        f.readline()
+    offset = f.tell()
+    while offset < limit:
+        line = f.readline()
+        if not line:
+            break
+        try:
+            return offset, parser.parse(line)
+        except ValueError:
+            offset += len(line)
+    return None
+
+
+def find_range(f, size: int, epoch: int) -> tuple[int, int]:
+    """
+    binary search an open log file for the lines stamped epoch
+
+    :param f: log file, opened in binary mode
+    :param size: size of the file
+    :param epoch: epoch to search for
+    :return: (lo, hi) tuple, where lo is a line start with every line before it stamped earlier than epoch,
+             and every line starting at or after hi is stamped epoch or later
+    """
+    parser = EverquestLogFile.TimestampParser()
+    lo, hi = 0, size
+    while hi - lo > SEARCH_SPAN:
+        mid = (lo + hi) // 2
+        stamp = _first_stamp(f, mid, hi, parser)
+        if stamp is None or stamp[1] >= epoch:
+            hi = mid
+        else:
+            lo = stamp[0]
+    return lo, hi
+
+
+def scan_file(filename: str, charname: str, category: str, start: int, end: int, lo: int, hi: int) -> list[QueryMatch]:
+    """
+    scan the lines starting within one byte range of a log file.  runs in a process pool worker
+
+    :param filename: full log filename
+    :param charname: Everquest character the log belongs to
+    :param category: query category name
+    :param start: earliest epoch to match
+    :param end: latest epoch to match
+    :param lo: byte range start
+    :param hi: byte range end
+    :return: list of QueryMatch
+    """
+    line_filter = LineFilter(charname, category, start, end)
+    encoding = locale.getpreferredencoding(False)
+
+    with open(filename, 'rb') as f:
+        # skip the line straddling lo, which belongs to the previous range
+        if lo > 0:
+            f.seek(lo - 1)
+            if f.read(1) != b'\n':
+                f.readline()
+        pos = f.tell()
+        if pos >= hi:
+            return list()
+        data = f.read(hi - pos)
+
+        # and finish the line straddling hi
+        if data and not data.endswith(b'\n'):
+            data += f.readline()
+
+    rv = list()
+    for line in data.decode(encoding, errors='ignore').split('\n'):
+        line = line.rstrip('\r')
+        hit = line_filter.match(line)
+        if hit:
+            rv.append(QueryMatch(filename, hit[0], hit[1], line))
+    return rv
+
+
+def scan_segment(filename: str, charname: str, category: str, start: int, end: int) -> list[QueryMatch]:
+    """
+    scan one archived segment, using its time index to skip the blocks outside the time range.
+    runs in a process pool worker
+
+    :param filename: full segment filename
+    :param charname: Everquest character the log belongs to
+    :param category: query category name
+    :param start: earliest epoch to match
+    :param end: latest epoch to match
+    :return: list of QueryMatch
+    """
+    line_filter = LineFilter(charname, category, start, end)
+    encoding = locale.getpreferredencoding(False)
+    index = LogArchiver.read_index(filename)
+
+    first = LogArchiver.find_block(index, start)
+    if first is None:
+        return list()
+
+    # stop at the first block stamped after the end of the range
+    after = LogArchiver.find_block_after(index, end)
+    remaining = (after[1] if after else index['bytes']) - first[1]
+
+    rv = list()
+    with LogArchiver.open_segment(filename, start, index) as f:
+        for raw in f:
+            if remaining <= 0:
+                break
+            remaining -= len(raw)
+            line = raw.decode(encoding, errors='ignore').rstrip('\r\n')
+            hit = line_filter.match(line)
+            if hit:
+                rv.append(QueryMatch(filename, hit[0], hit[1], line))
+    return rv
+
+
+def plan(charname: str, category: str = 'all', start: int = 0, end: int = END_OF_TIME,
+         archive: bool = True) -> list[tuple]:
+    """
+    work out which segments, and which byte ranges of the live log, cover the time range
+
+    :param charname: Everquest character
+    :param category: query category name
+    :param start: earliest epoch to match
+    :param end: latest epoch to match
+    :param archive: True to include the archived segments
+    :return: list of (function, args) tuples, oldest first
+    """
+    # validate the category up front, rather than in every worker
+    LineFilter(charname, category)
+
+    elf = EverquestLogFile.EverquestLogFile()
+    live = elf.build_filename(charname)
+    rv = list()
+
+    if archive:
+        stem = os.path.basename(live)[:-len('.txt')]
+        archive_directory = elf.base_directory + elf.logs_directory + LogArchiver.ARCHIVE_DIRECTORY + os.sep
+        segments = list()
+        for filename in glob.glob(glob.escape(archive_directory + stem) + '.*.txt.gz'):
+            try:
+                index = LogArchiver.read_index(filename)
+            except (OSError, ValueError):
+                continue
+            first_epoch = index['first_epoch']
+            last_epoch = index['last_epoch']
+            if first_epoch is not None and first_epoch > end:
+                continue
+            if last_epoch is not None and last_epoch < start:
+                continue
+            segments.append((first_epoch or 0, filename))
+        for first_epoch, filename in sorted(segments):
+            rv.append((scan_segment, (filename, charname, category, start, end)))
+
+    try:
+        with open(live, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            lo = find_range(f, size, start)[0] if start > 0 else 0
+            hi = find_range(f, size, end + 1)[1] if end < END_OF_TIME else size
+    except OSError:
+        return rv
+
+    for chunk_lo in range(lo, hi, CHUNK_BYTES):
+        rv.append((scan_file, (live, charname, category, start, end, chunk_lo, min(chunk_lo + CHUNK_BYTES, hi))))
+    return rv
+
+
+def query(charname: str, category: str = 'all', start: int = 0, end: int = END_OF_TIME,
+          archive: bool = True, max_workers: int = None):
+    """
+    find the lines in a character's logs matching a category and a time range.
+    matches are yielded oldest first, as soon as each chunk of the logs has been scanned
+
+    :param charname: Everquest character
+    :param category: query category name, from QUERY_CATEGORIES
+    :param start: earliest epoch to match, inclusive
+    :param end: latest epoch to match, inclusive
+    :param archive: True to include the archived segments
+    :param max_workers: number of worker processes, None for one per CPU
+    :return: generator of QueryMatch
+    """
+    tasks = plan(charname, category, start, end, archive)
+
+    # not worth a process pool
+    if len(tasks) <= 1:
+        for function, args in tasks:
+            yield from function(*args)
+        return
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(function, *args) for function, args in tasks]
+        try:
+            for future in futures:
+                yield from future.result()
+        finally:
+            for future in futures:
+                future.cancel()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Find the lines in an Everquest character log '
+                                                 'matching an event category and a time range')
+    parser.add_argument('charname', help='Everquest character')
+    parser.add_argument('--start', type=parse_time, default=0, help='local date-time, e.g. "2026-10-01 20:15"')
+    parser.add_argument('--end', type=parse_time, default=END_OF_TIME, help='local date-time, e.g. "2026-10-01 21:00"')
+    parser.add_argument('--category', default='deaths', help=f'event category, from {sorted(QUERY_CATEGORIES)}')
+    parser.add_argument('--no-archive', action='store_true', help='only search the live log, not the archived segments')
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes')
+    args = parser.parse_args()
+
+    try:
+        # the matches are the output of the query, so they are written straight out, every one exactly as it
+        # is in the log, rather than through the console writer, which may coalesce, rate limit or hide them
+        count = 0
+        for match in query(args.charname, args.category, args.start, args.end, not args.no_archive, args.workers):
+            sys.stdout.write(match.line + '\n')
+            count += 1
+        sys.stdout.flush()
+        EverquestLogFile.starprint(f'{count} matching line(s)')
+        ConsoleWriter.flush()
+
+    except (OSError, ValueError) as err:
+        EverquestLogFile.starprint(f'ERROR: {err}', ConsoleWriter.QUIET)
+        ConsoleWriter.flush()
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,312 @@
+import bisect
+import http.server
+import threading
+
+
+#
+# lightweight, always-on metrics, exposed in the Prometheus text format over a small local HTTP endpoint.
+#
+# Counters, gauges and histograms are plain python objects, updated with simple arithmetic, so they
+# are cheap enough to leave on all the time.  Counters and histograms are updated from several threads,
+# e.g. the parsing threads, the kill executor and the event publisher, and a read-modify-write from
+# two of them at once would lose one of the updates, so each one guards its updates with a lock of its
+# own.  Setting a gauge is a single assignment, and needs no lock.
+#
+# Each metric may have labels, e.g. the category of a classified line.  metric.labels('death')
+# returns the child metric for that label value, which can be kept and updated directly.
+# metric.remove('death') drops it again, e.g. once the character whose log it counted is no longer
+# being followed, so the label sets do not pile up forever.
+#
+
+# all metrics, in order of creation
+_metrics = list()
+
+
+class _Metric:
+    """
+    base class for the metrics
+    """
+
+    type_name = ''
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple = ()) -> None:
+        """
+        ctor
+
+        :param name: metric name
+        :param help_text: description
+        :param labelnames: tuple of label names, if the metric is labelled
+        """
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+
+        # dictionary of label values tuple: child metric, for labelled metrics, and its lock
+        self._children = dict()
+        self._children_lock = threading.Lock()
+        _metrics.append(self)
+
+    def labels(self, *values):
+        """
+        :param values: one value for each of the label names
+        :return: the child metric for these label values
+        """
+        child = self._children.get(values)
+        if child is None:
+            with self._children_lock:
+                child = self._children.get(values)
+                if child is None:
+                    child = self._new_child()
+                    self._children[values] = child
+        return child
+
+    def remove(self, *values) -> None:
+        """
+        drop the child metric for these label values, if there is one
+
+        :param values: one value for each of the label names
+        """
+        with self._children_lock:
+            self._children.pop(values, None)
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _samples(self, suffix_labels: str) -> list[str]:
+        """
+        :return: list of sample lines for this (unlabelled, or child) metric
+        """
+        raise NotImplementedError
+
+    def render(self) -> str:
+        """
+        :return: this metric in the Prometheus text format
+        """
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} {self.type_name}']
+        if self.labelnames:
+            for values, child in list(self._children.items()):
+                label_text = ','.join(f'{name}="{_escape(str(value))}"' for name, value in zip(self.labelnames, values))
+                lines.extend(child._samples(label_text))
+        else:
+            lines.extend(self._samples(''))
+        return '\n'.join(lines) + '\n'
+
+
+class Counter(_Metric):
+    """
+    monotonically increasing count
+    """
+
+    type_name = 'counter'
+
+    def __init__(self, name: str = '', help_text: str = '', labelnames: tuple = (), register: bool = True) -> None:
+        if register:
+            super().__init__(name, help_text, labelnames)
+        else:
+            self.name = name
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def _new_child(self):
+        return Counter(self.name, register=False)
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self.value += amount
+
+    def _samples(self, label_text: str) -> list[str]:
+        labels = f'{{{label_text}}}' if label_text else ''
+        return [f'{self.name}{labels} {self.value}']
+
+
+class Gauge(_Metric):
+    """
+    value which can go up and down
+    """
+
+    type_name = 'gauge'
+
+    def __init__(self, name: str = '', help_text: str = '', labelnames: tuple = (), register: bool = True) -> None:
+        if register:
+            super().__init__(name, help_text, labelnames)
+        else:
+            self.name = name
+        self.value = 0
+
+    def _new_child(self):
+        return Gauge(self.name, register=False)
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def _samples(self, label_text: str) -> list[str]:
+        labels = f'{{{label_text}}}' if label_text else ''
+        return [f'{self.name}{labels} {self.value}']
+
+
+class Histogram(_Metric):
+    """
+    distribution of observed values, counted into fixed buckets
+    """
+
+    type_name = 'histogram'
+
+    # default buckets, in seconds, from 1 microsecond to 10 seconds
+    DEFAULT_BUCKETS = (1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4,
+                       1e-3, 2.5e-3, 5e-3, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, name: str = '', help_text: str = '', labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS,
+                 register: bool = True) -> None:
+        if register:
+            super().__init__(name, help_text, labelnames)
+        else:
+            self.name = name
+        self.buckets = tuple(sorted(buckets))
+
+        # one count per bucket, plus one for +Inf
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def _new_child(self):
+        return Histogram(self.name, buckets=self.buckets, register=False)
+
+    def observe(self, value: float, count: int = 1) -> None:
+        """
+        :param value: observed value
+        :param count: number of times this value was observed, e.g. the per-line average over a batch
+        """
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += count
+            self.sum += value * count
+            self.count += count
+
+    def _samples(self, label_text: str) -> list[str]:
+        prefix = label_text + ',' if label_text else ''
+        # a consistent copy, so the buckets always add up to the count
+        with self._lock:
+            counts, total, count_total = list(self.counts), self.sum, self.count
+        lines = list()
+        cumulative = 0
+        for bound, count in zip(self.buckets, counts):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+        lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {count_total}')
+        labels = f'{{{label_text}}}' if label_text else ''
+        lines.append(f'{self.name}_sum{labels} {total}')
+        lines.append(f'{self.name}_count{labels} {count_total}')
+        return lines
+
+
+#################################################################################################
+#
+# the metrics themselves
+#
+
+LINES = Counter('eqlog_lines_total', 'Log lines processed', ('char',))
+LINES_PER_SECOND = Gauge('eqlog_lines_per_second', 'Log lines processed per second, over the last second or so', ('char',))
+PROCESS_LINE_SECONDS = Histogram('eqlog_process_line_seconds', 'Time spent processing each log line, averaged per batch')
+CLASSIFIED = Counter('eqlog_classified_lines_total', 'Log lines classified, by category', ('category',))
+TAIL_LAG_BYTES = Gauge('eqlog_tail_lag_bytes', 'Log file size minus the current read offset', ('char',))
+TAIL_LAG_SECONDS = Gauge('eqlog_tail_lag_seconds', 'Wall clock minus the timestamp of the last parsed log line', ('char',))
+HEARTBEAT_ROLLOVERS = Counter('eqlog_heartbeat_rollovers_total', 'New log files opened after a heartbeat expired')
+DETECTION_TO_KILL_SECONDS = Histogram('deathloop_detection_to_kill_seconds',
+                                      'Time from death loop detection until the kill signals are sent')
+KILLS = Counter('deathloop_kills_total', 'Death loop responses triggered', ('armed',))
+KILL_BUDGET_EXCEEDED = Counter('deathloop_kill_budget_exceeded_total',
+                               'Kills whose time from detection to signal was over the latency budget')
+BUS_DROPPED_EVENTS = Counter('eqlog_bus_dropped_events_total', 'Log events dropped by a full subscriber queue', ('subscriber',))
+BUS_QUEUE_DEPTH = Gauge('eqlog_bus_queue_depth', 'Log events waiting in a subscriber queue', ('subscriber',))
+PUBLISHED_EVENTS = Counter('eqlog_published_events_total', 'Events streamed to the event socket clients')
+PUBLISHER_DROPPED_EVENTS = Counter('eqlog_publisher_dropped_events_total',
+                                   'Events dropped because the event socket clients could not keep up')
+PUBLISHER_CLIENTS = Gauge('eqlog_publisher_clients', 'Clients connected to the event socket')
+PUBLISHER_SLOW_DISCONNECTS = Counter('eqlog_publisher_slow_disconnects_total',
+                                     'Event socket clients disconnected for falling too far behind')
+
+
+class MetricsServer(threading.Thread):
+    """
+    class to serve the metrics over HTTP, from a background thread
+    """
+
+    def __init__(self, port: int, host: str = '127.0.0.1') -> None:
+        """
+        ctor
+
+        :param port: TCP port
+        :param host: interface to listen on, loopback only by default
+        """
+        # parent ctor
+        # the daemon=True parameter causes this child thread object to terminate
+        # when the parent thread terminates
+        super().__init__(daemon=True)
+        self.server = http.server.ThreadingHTTPServer((host, port), _MetricsHandler)
+        self.server.daemon_threads = True
+
+    def run(self) -> None:
+        """
+        override the thread.run() method
+        this method will execute in its own thread
+        """
+        self.server.serve_forever()
+
+    def shutdown(self) -> None:
+        """
+        stop serving
+        """
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class _MetricsHandler(http.server.BaseHTTPRequestHandler):
+    """
+    HTTP request handler, which serves the metrics at /metrics
+    """
+
+    def do_GET(self) -> None:
+        if self.path.split('?', 1)[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args) -> None:
+        # keep the console quiet
+        pass
+
+
+#################################################################################################
+#
+# standalone functions
+#
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render() -> str:
+    """
+    :return: all metrics in the Prometheus text format
+    """
+    return ''.join(metric.render() for metric in list(_metrics))
+
+
+def start_server(port: int) -> MetricsServer or None:
+    """
+    start the metrics HTTP endpoint on the loopback interface
+
+    :param port: TCP port, or 0 / None to not start the endpoint
+    :return: the running MetricsServer, or None
+    """
+    if not port:
+        return None
+    server = MetricsServer(port)
+    server.start()
+    return server
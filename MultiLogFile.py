@@ -0,0 +1,172 @@
+import threading
+import time
+
+import myconfig
+import EventPublisher
+import EverquestLogFile
+import LogDirectoryIndex
+import LogFileWaiter
+import Metrics
+
+
+class MultiLogFile(threading.Thread):
+    """
+    class to follow every active character log file on the server at once, e.g. for
+    players running several Everquest clients simultaneously.
+
+    A single background thread, and a single shared wait strategy, service all of the
+    log files.  Each log file is handled by its own EverquestLogFile (or child class)
+    object, which keeps its own parsing state, but whose own thread is never started.
+    Instead, this class reads each batch of new lines and hands them to that object's
+    process_lines() method.
+
+    A log file is considered active if it has been modified within the last
+    myconfig.MULTILOG_ACTIVE_SECONDS seconds.  The logs directory is rescanned for newly
+    active (and newly inactive) log files every heartbeat.  Each log file begun, or dropped, by
+    one of those rescans counts as a heartbeat rollover, the same as a single log file rolling over.
+    """
+
+    def __init__(self, factory=EverquestLogFile.EverquestLogFile) -> None:
+        """
+        ctor
+
+        :param factory: callable which returns a new EverquestLogFile object, e.g. a child class
+        """
+        # parent ctor
+        # the daemon=True parameter causes this child thread object to terminate
+        # when the parent thread terminates
+        super().__init__(daemon=True)
+
+        self.factory = factory
+        self.heartbeat = myconfig.HEARTBEAT
+        self.active_seconds = myconfig.MULTILOG_ACTIVE_SECONDS
+
+        # dictionary of filename: EverquestLogFile object, for every log file being followed
+        self.logs = dict()
+
+        # one wait strategy, shared by all of the log files
+        self.waiter = LogFileWaiter.create_waiter()
+
+        # cached index of the log files in the logs directory, used to find the active ones
+        self.directory_index = LogDirectoryIndex.LogDirectoryIndex(myconfig.BASE_DIRECTORY + myconfig.LOGS_DIRECTORY,
+                                                                   myconfig.SERVER_NAME)
+
+        self.prevscan = 0.0
+
+        # set by shutdown() to end the thread
+        self._shutdown = threading.Event()
+
+    def scan(self) -> None:
+        """
+        scan the logs directory, begin following any newly active log files,
+        and stop following any which have gone inactive
+        """
+        now = time.time()
+
+        # every log file is checked, not just the followed ones, once one of those has gone a heartbeat
+        # without growing, e.g. because its player has switched to a previously played character
+        full = not self.logs or any(now - elf.prevtime > self.heartbeat for elf in self.logs.values())
+        active = dict(self.directory_index.active(now, self.active_seconds, tuple(self.logs), full))
+
+        # the logs found by the first scan are where parsing starts, not rollovers
+        rollover = self.prevscan > 0.0
+
+        # stop following inactive logs
+        for filename in list(self.logs):
+            if filename not in active:
+                elf = self.logs.pop(filename)
+                elf.close()
+                EverquestLogFile.starprint('No longer parsing character log for: [{}]'.format(elf.char_name))
+                if rollover:
+                    self._rollover(now, elf.char_name, 1)
+
+        # begin following newly active logs
+        for filename, char_name in active.items():
+            if filename not in self.logs and char_name:
+                elf = self.factory()
+                elf.waiter = self.waiter
+                if elf.open(char_name, filename):
+                    self.logs[filename] = elf
+                    EverquestLogFile.starprint('Now parsing character log for: [{}]'.format(char_name))
+                    if rollover:
+                        self._rollover(now, char_name, 0)
+
+        self.prevscan = now
+
+    @staticmethod
+    def _rollover(now: float, char_name: str, dropped: int) -> None:
+        """
+        record a log file begun, or dropped, by a heartbeat rescan
+
+        :param now: time of the rescan
+        :param char_name: character name of the log file
+        :param dropped: 1 if the log file went inactive and was dropped, 0 if it was begun
+        """
+        Metrics.HEARTBEAT_ROLLOVERS.inc()
+        EventPublisher.publish(EventPublisher.HEARTBEAT_ROLLOVER, int(now + time.localtime(now).tm_gmtoff),
+                               dropped, char_name)
+
+    def go(self) -> bool:
+        """
+        call this method to kick off the parsing thread
+
+        :return: True if at least one log file is being followed
+        """
+        self.scan()
+        if not self.is_alive():
+            self.start()
+        if not self.logs:
+            EverquestLogFile.starprint('No active character logs found, will keep checking every heartbeat')
+        return len(self.logs) > 0
+
+    def shutdown(self) -> None:
+        """
+        call this function to end the parsing thread for good, and close all the files.
+        safe to call from any thread.  use join() to wait for the thread to finish
+        """
+        self._shutdown.set()
+        self.waiter.wake()
+
+        # if the thread never started, then there is no one else to close the files
+        if not self.is_alive():
+            self._close_all()
+
+    def _close_all(self) -> None:
+        """
+        stop following all log files
+        """
+        for elf in self.logs.values():
+            elf.close()
+        self.logs.clear()
+
+    def run(self) -> None:
+        """
+        override the thread.run() method
+        this method will execute in its own thread
+        """
+        # run until shutdown
+        while not self._shutdown.is_set():
+
+            # give every log file a chance to process its new lines
+            now = time.time()
+            busy = False
+            for elf in list(self.logs.values()):
+                lines = elf.read_lines()
+                if lines:
+                    busy = True
+                    elf.prevtime = now
+                    elf.dispatch_lines(lines)
+
+            # time to check for newly active, or inactive, log files?  this is checked even while busy,
+            # so a chatty log can't hold up following a new, or rolled over, one
+            elapsed_seconds = now - self.prevscan
+            if elapsed_seconds > self.heartbeat:
+                self.scan()
+                elapsed_seconds = 0.0
+
+            # block until one of the files grows, or the next scan is due
+            if not busy:
+                self.waiter.wait(self.heartbeat - elapsed_seconds)
+
+        # all done
+        self._close_all()
@@ -0,0 +1,330 @@
+import ctypes
+import os
+import subprocess
+import sys
+import threading
+
+
+#
+# pluggable process enumeration, used to find the process ID's of the eqgame.exe processes.
+#
+#   ProcFsProcessFinder:    Linux (e.g. Everquest under Wine), reads /proc directly
+#   WindowsProcessFinder:   Windows, uses the Toolhelp32 snapshot API via ctypes
+#   PsProcessFinder:        any other POSIX system, parses the output of ps
+#
+#   CachedProcessFinder:    wraps any of the above, refreshing a cached PID list in a
+#                           background thread, so the list is ready the moment it is needed
+#
+# Process names are compared case-insensitively, since Windows process names are.  Processes which have
+# exited, but not yet been reaped (zombies), are not counted as running.
+#
+class ProcessFinder:
+    """
+    base class for the process finders
+    """
+
+    def __init__(self, name: str) -> None:
+        """
+        ctor
+
+        :param name: process name to search for, e.g. 'eqgame.exe'
+        """
+        self.name = name
+        self._lower_name = name.lower()
+
+    def find(self) -> list[int]:
+        """
+        enumerate the running processes
+
+        :return: list of process ID's of all processes with the desired name
+        """
+        raise NotImplementedError
+
+    def matches(self, pid: int) -> bool:
+        """
+        check a previously found process is still running, and still has the desired name,
+        i.e. the process ID has not been reused by some other process
+
+        :param pid: process ID
+        :return: True if the process is still running and still has the desired name
+        """
+        raise NotImplementedError
+
+    def open_files(self, pid: int) -> list[str]:
+        """
+        list the files a process has open, e.g. to find out which client is writing which log file
+
+        Default behavior is to return an empty list, i.e. not known on this platform
+
+        :param pid: process ID
+        :return: list of full paths of the files the process has open
+        """
+        return []
+
+
+class ProcFsProcessFinder(ProcessFinder):
+    """
+    Linux process finder, which reads /proc
+    """
+
+    def _process_names(self, pid: str) -> tuple[str, str]:
+        """
+        :param pid: process ID, as a string
+        :return: (comm, argv[0] base name) tuple, both lowercase.  Under Wine, the comm name is
+                 usually the Windows executable name, and argv[0] its Windows path
+        :raises OSError: if the process has gone away, or cannot be read
+        """
+        with open(f'/proc/{pid}/comm', 'rb') as f:
+            comm = f.read().rstrip(b'\n').decode(errors='ignore').lower()
+        with open(f'/proc/{pid}/cmdline', 'rb') as f:
+            argv0 = f.read().split(b'\0', 1)[0].decode(errors='ignore')
+        argv0 = argv0.replace('\\', '/').rsplit('/', 1)[-1].lower()
+        return comm, argv0
+
+    def _process_state(self, pid: str) -> str:
+        """
+        :param pid: process ID, as a string
+        :return: process state letter, e.g. 'R' running, 'S' sleeping, 'Z' zombie
+        :raises OSError: if the process has gone away, or cannot be read
+        """
+        with open(f'/proc/{pid}/stat', 'rb') as f:
+            data = f.read()
+        # the state follows the command name, which is in parentheses, and may itself contain them
+        end = data.rfind(b')')
+        return data[end + 2:end + 3].decode()
+
+    def _is_match(self, pid: str) -> bool:
+        comm, argv0 = self._process_names(pid)
+        # note that the kernel truncates comm to 15 characters
+        if argv0 != self._lower_name and comm != self._lower_name[:15]:
+            return False
+        return self._process_state(pid) not in ('Z', 'X')
+
+    def find(self) -> list[int]:
+        pid_list = list()
+        for entry in os.listdir('/proc'):
+            if entry.isdigit():
+                try:
+                    if self._is_match(entry):
+                        pid_list.append(int(entry))
+                except OSError:
+                    pass
+        return pid_list
+
+    def matches(self, pid: int) -> bool:
+        try:
+            return self._is_match(str(pid))
+        except OSError:
+            return False
+
+    def open_files(self, pid: int) -> list[str]:
+        rv = list()
+        directory = f'/proc/{pid}/fd'
+        try:
+            entries = os.listdir(directory)
+        except OSError:
+            return rv
+        for entry in entries:
+            try:
+                rv.append(os.readlink(os.path.join(directory, entry)))
+            except OSError:
+                # closed meanwhile
+                pass
+        return rv
+
+
+class WindowsProcessFinder(ProcessFinder):
+    """
+    Windows process finder, which uses the Toolhelp32 snapshot API
+    """
+
+    TH32CS_SNAPPROCESS = 0x00000002
+    PROCESS_QUERY_LIMITED_INFORMATION = 0x1000
+    STILL_ACTIVE = 259
+    MAX_PATH = 260
+
+    class PROCESSENTRY32W(ctypes.Structure):
+        _fields_ = [('dwSize', ctypes.c_uint32),
+                    ('cntUsage', ctypes.c_uint32),
+                    ('th32ProcessID', ctypes.c_uint32),
+                    ('th32DefaultHeapID', ctypes.c_size_t),
+                    ('th32ModuleID', ctypes.c_uint32),
+                    ('cntThreads', ctypes.c_uint32),
+                    ('th32ParentProcessID', ctypes.c_uint32),
+                    ('pcPriClassBase', ctypes.c_long),
+                    ('dwFlags', ctypes.c_uint32),
+                    ('szExeFile', ctypes.c_wchar * 260)]
+
+    def __init__(self, name: str) -> None:
+        super().__init__(name)
+        self._kernel32 = ctypes.WinDLL('kernel32', use_last_error=True)
+        self._kernel32.CreateToolhelp32Snapshot.restype = ctypes.c_void_p
+        self._kernel32.OpenProcess.restype = ctypes.c_void_p
+        self._kernel32.Process32FirstW.argtypes = [ctypes.c_void_p, ctypes.POINTER(self.PROCESSENTRY32W)]
+        self._kernel32.Process32NextW.argtypes = [ctypes.c_void_p, ctypes.POINTER(self.PROCESSENTRY32W)]
+        self._kernel32.CloseHandle.argtypes = [ctypes.c_void_p]
+
+    def find(self) -> list[int]:
+        pid_list = list()
+        snapshot = self._kernel32.CreateToolhelp32Snapshot(self.TH32CS_SNAPPROCESS, 0)
+        if snapshot is None or snapshot == ctypes.c_void_p(-1).value:
+            raise ctypes.WinError(ctypes.get_last_error())
+        try:
+            entry = self.PROCESSENTRY32W()
+            entry.dwSize = ctypes.sizeof(entry)
+            ok = self._kernel32.Process32FirstW(snapshot, ctypes.byref(entry))
+            while ok:
+                if entry.szExeFile.lower() == self._lower_name:
+                    pid_list.append(entry.th32ProcessID)
+                ok = self._kernel32.Process32NextW(snapshot, ctypes.byref(entry))
+        finally:
+            self._kernel32.CloseHandle(snapshot)
+        return pid_list
+
+    def matches(self, pid: int) -> bool:
+        handle = self._kernel32.OpenProcess(self.PROCESS_QUERY_LIMITED_INFORMATION, False, pid)
+        if not handle:
+            return False
+        try:
+            exit_code = ctypes.c_uint32()
+            if not self._kernel32.GetExitCodeProcess(ctypes.c_void_p(handle), ctypes.byref(exit_code)):
+                return False
+            if exit_code.value != self.STILL_ACTIVE:
+                return False
+
+            buffer = ctypes.create_unicode_buffer(self.MAX_PATH)
+            size = ctypes.c_uint32(self.MAX_PATH)
+            if not self._kernel32.QueryFullProcessImageNameW(ctypes.c_void_p(handle), 0, buffer, ctypes.byref(size)):
+                return False
+            return os.path.basename(buffer.value).lower() == self._lower_name
+        finally:
+            self._kernel32.CloseHandle(handle)
+
+
+class PsProcessFinder(ProcessFinder):
+    """
+    generic POSIX process finder, which parses the output of ps
+    """
+
+    def _ps(self, *args) -> list[tuple[int, str]]:
+        """
+        :return: list of (pid, lowercase process name) tuples, for every process but the zombies
+        """
+        output = subprocess.check_output(['ps', *args, '-o', 'pid=', '-o', 'stat=', '-o', 'comm='])
+        rv = list()
+        for line in output.decode(errors='ignore').splitlines():
+            fields = line.strip().split(None, 2)
+            if len(fields) == 3 and fields[0].isdigit() and not fields[1].startswith('Z'):
+                rv.append((int(fields[0]), os.path.basename(fields[2]).lower()))
+        return rv
+
+    def find(self) -> list[int]:
+        return [pid for pid, name in self._ps('-ax') if name == self._lower_name]
+
+    def matches(self, pid: int) -> bool:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        try:
+            return any(name == self._lower_name for _, name in self._ps('-p', str(pid)))
+        except subprocess.CalledProcessError:
+            return False
+
+
+class CachedProcessFinder(threading.Thread):
+    """
+    class to keep a cached list of process ID's up to date in a background thread.
+
+    pid_list() returns the cached list, after checking each process is still running.
+    If the list is empty, or any process has gone away (e.g. the game was restarted),
+    the processes are enumerated again on the spot.
+    """
+
+    def __init__(self, finder: ProcessFinder, refresh_seconds: float = 5.0) -> None:
+        """
+        ctor
+
+        :param finder: ProcessFinder backend
+        :param refresh_seconds: number of seconds between background refreshes
+        """
+        # parent ctor
+        # the daemon=True parameter causes this child thread object to terminate
+        # when the parent thread terminates
+        super().__init__(daemon=True)
+
+        self.finder = finder
+        self.refresh_seconds = refresh_seconds
+        self._pids = list()
+        self._shutdown = threading.Event()
+
+    def refresh(self) -> list[int]:
+        """
+        enumerate the processes now, and update the cache
+
+        :return: list of process ID's
+        """
+        pids = self.finder.find()
+        self._pids = pids
+        return pids
+
+    def pid_list(self) -> list[int]:
+        """
+        :return: list of process ID's for the running processes
+        """
+        pids = self._pids
+        live = [pid for pid in pids if self.finder.matches(pid)]
+        if not live or len(live) != len(pids):
+            live = self.refresh()
+        return live
+
+    def shutdown(self) -> None:
+        """
+        end the background refresh thread
+        """
+        self._shutdown.set()
+
+    def run(self) -> None:
+        """
+        override the thread.run() method
+        this method will execute in its own thread
+        """
+        while True:
+            try:
+                self.refresh()
+            except (OSError, subprocess.SubprocessError):
+                pass
+            if self._shutdown.wait(self.refresh_seconds):
+                break
+
+
+#################################################################################################
+#
+# standalone functions
+#
+
+def create_finder(name: str) -> ProcessFinder:
+    """
+    create the best process finder available on this platform
+
+    :param name: process name to search for, e.g. 'eqgame.exe'
+    :return: ProcessFinder object
+    """
+    if sys.platform == 'win32':
+        return WindowsProcessFinder(name)
+    elif os.path.isdir('/proc/self'):
+        return ProcFsProcessFinder(name)
+    else:
+        return PsProcessFinder(name)
+
+
+def main():
+    name = sys.argv[1] if len(sys.argv) > 1 else 'eqgame.exe'
+    finder = create_finder(name)
+    print(f'{type(finder).__name__}: [{name}] process id list = {finder.find()}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,399 @@
+import collections
+import datetime
+import functools
+import inspect
+import os
+import signal
+import sys
+import threading
+import time
+import tracemalloc
+
+import myconfig
+import ConsoleWriter
+import EverquestLogFile
+import SlidingWindow
+
+
+#
+# on-demand profiling, switched on and off while the program is running, so a slowdown can be
+# looked at while it is happening, rather than after a restart under a profiler.
+#
+# A profiling session is started (or, if one is running, stopped early) by:
+#
+#   - SIGUSR1, where the platform has it, once install_signal_handler() has been called, or
+#   - creating the control file, CONTROL_FILENAME, in the logs directory.  it is removed as the session starts
+#
+# and ends by itself after myconfig.PROFILE_SECONDS.  A session captures:
+#
+#   - per-stage timers.  each stage is a method or function (e.g. reading, classifying, timestamp parsing,
+#     window purging, console output) which is wrapped with a timer for the session, by replacing it on its
+#     class or module, and on any child class which overrides it, and restored afterwards.  when no session
+#     is running nothing is wrapped, so there is no overhead at all on the parsing path
+#   - a sampling profile.  the stacks of every other thread are sampled every myconfig.PROFILE_SAMPLE_SECONDS
+#   - a tracemalloc snapshot of the memory allocated during the session, by allocation site
+#
+# and at the end writes a report, and the sampled stacks in the collapsed format used by flame graph
+# tools, to time-stamped files in the logs directory.
+#
+# usage:
+#
+#   kill -USR1 <pid>
+#   touch <logs directory>/profile-now
+#
+
+# name of the control file, in the logs directory
+CONTROL_FILENAME = 'profile-now'
+
+# number of seconds between checks for the control file, while no session is running
+CONTROL_CHECK_SECONDS = 1.0
+
+# number of functions, and allocation sites, listed in the report
+REPORT_TOP = 25
+
+# the stages timed by default, as (stage name, class or module, attribute name) tuples
+DEFAULT_STAGES = (
+    ('read', EverquestLogFile.EverquestLogFile, 'read_lines'),
+    ('process', EverquestLogFile.EverquestLogFile, 'dispatch_lines'),
+    ('timestamp parse', EverquestLogFile.TimestampParser, 'parse'),
+    ('window purge', SlidingWindow.RuleEngine, 'expire'),
+    ('output', ConsoleWriter, 'write'),
+)
+
+
+class StageTimers:
+    """
+    class to time calls to a set of methods or functions, by temporarily wrapping them.
+
+    A method is wrapped on its class, and on every child class which overrides it, so the stage
+    is timed whichever class is in use.  A call from an override up to the method it overrides is
+    counted once, as a single call to the stage.  The stages may be called from any thread.
+    """
+
+    def __init__(self, stages: list[tuple]) -> None:
+        """
+        ctor
+
+        :param stages: list of (stage name, class or module, attribute name) tuples
+        """
+        self.stages = list(stages)
+
+        # dictionary of stage name: [call count, total seconds], and a lock for updating them
+        self.totals = {name: [0, 0.0] for name, owner, attribute in self.stages}
+        self._lock = threading.Lock()
+
+        # list of (class or module, attribute name, original) tuples, while wrapped.  the original is
+        # None where the attribute was inherited, rather than defined on the class itself
+        self._originals = list()
+
+    @staticmethod
+    def targets(owner, attribute: str) -> list:
+        """
+        :return: the class or module, followed by every child class which overrides the attribute
+        """
+        rv = [owner]
+        if isinstance(owner, type):
+            pending = list(owner.__subclasses__())
+            while pending:
+                child = pending.pop()
+                if child not in rv:
+                    if attribute in vars(child):
+                        rv.append(child)
+                    pending.extend(child.__subclasses__())
+        return rv
+
+    def wrap(self) -> None:
+        """
+        replace every stage with a timed wrapper.  if any of them can't be wrapped, all are put back
+
+        :raise AttributeError: if a stage's method or function doesn't exist
+        """
+        try:
+            for name, owner, attribute in self.stages:
+                # each stage has its own marker, per thread, of whether a call to it is already being timed
+                active = threading.local()
+                for target in self.targets(owner, attribute):
+                    original = vars(target).get(attribute)
+                    function = inspect.getattr_static(target, attribute)
+                    if isinstance(function, (staticmethod, classmethod)):
+                        wrapper = type(function)(self._timed(function.__func__, self.totals[name], active))
+                    else:
+                        wrapper = self._timed(function, self.totals[name], active)
+                    self._originals.append((target, attribute, original))
+                    setattr(target, attribute, wrapper)
+        except AttributeError:
+            self.unwrap()
+            raise
+
+    def unwrap(self) -> None:
+        """
+        put back the originals
+        """
+        for owner, attribute, original in reversed(self._originals):
+            if original is None:
+                delattr(owner, attribute)
+            else:
+                setattr(owner, attribute, original)
+        self._originals.clear()
+
+    def _timed(self, function, total: list, active: threading.local):
+        """
+        :return: wrapper which adds the count and duration of each call to total
+        """
+        perf_counter = time.perf_counter
+        lock = self._lock
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            # already timed further up the stack, e.g. an override calling the method it overrides
+            if getattr(active, 'timing', False):
+                return function(*args, **kwargs)
+            active.timing = True
+            start = perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                elapsed = perf_counter() - start
+                active.timing = False
+                with lock:
+                    total[0] += 1
+                    total[1] += elapsed
+        return wrapper
+
+
+class Profiler(threading.Thread):
+    """
+    class to run profiling sessions on demand, from a background thread
+    """
+
+    def __init__(self, stages: list[tuple] = DEFAULT_STAGES, seconds: float = None,
+                 sample_seconds: float = None, directory: str = None) -> None:
+        """
+        ctor
+
+        :param stages: list of (stage name, class or module, attribute name) tuples to be timed
+        :param seconds: length of a session, None for myconfig.PROFILE_SECONDS
+        :param sample_seconds: interval between stack samples, None for myconfig.PROFILE_SAMPLE_SECONDS
+        :param directory: where the control file is looked for, and the profiles written, None for the logs directory
+        """
+        # parent ctor
+        # the daemon=True parameter causes this child thread object to terminate
+        # when the parent thread terminates
+        super().__init__(daemon=True)
+
+        self.stages = list()
+        for name, owner, attribute in stages:
+            self.add_stage(name, owner, attribute)
+        self.seconds = seconds or myconfig.PROFILE_SECONDS
+        self.sample_seconds = sample_seconds or myconfig.PROFILE_SAMPLE_SECONDS
+        self.directory = directory or myconfig.BASE_DIRECTORY + myconfig.LOGS_DIRECTORY
+        self.control_filename = os.path.join(self.directory, CONTROL_FILENAME)
+
+        # set to start or stop a session, and to end the thread
+        self._toggle = threading.Event()
+        self._shutdown = threading.Event()
+
+        # the current session, None if there is none
+        self._timers = None
+        self._samples = None
+        self._sample_count = 0
+        self._started_tracemalloc = False
+        self._start_time = None
+        self._start_perf = None
+
+    def add_stage(self, name: str, owner, attribute: str) -> None:
+        """
+        add a stage to be timed, from the next session on
+
+        :param name: stage name
+        :param owner: class or module the method or function is defined on, or inherited by
+        :param attribute: method or function name
+        :raise ValueError: if there is no such method or function
+        """
+        if not callable(getattr(owner, attribute, None)):
+            raise ValueError(f'Unknown stage [{name}], [{getattr(owner, "__name__", owner)}] has no method [{attribute}]')
+        self.stages.append((name, owner, attribute))
+
+    def install_signal_handler(self) -> bool:
+        """
+        toggle profiling on SIGUSR1.  must be called from the main thread
+
+        :return: True if the platform has SIGUSR1
+        """
+        signum = getattr(signal, 'SIGUSR1', None)
+        if signum is None:
+            return False
+        signal.signal(signum, self._signal_handler)
+        return True
+
+    def _signal_handler(self, signum, frame) -> None:
+        """
+        signal handler, which just requests a toggle
+        """
+        self.toggle()
+
+    def toggle(self) -> None:
+        """
+        start a session, or stop the running one early.  safe to call from any thread, or from a signal handler
+        """
+        self._toggle.set()
+
+    def is_profiling(self) -> bool:
+        return self._timers is not None
+
+    def shutdown(self) -> None:
+        """
+        end the profiler thread, stopping any running session first
+        """
+        self._shutdown.set()
+        self._toggle.set()
+
+    def _control_file_found(self) -> bool:
+        """
+        :return: True if the control file exists, in which case it is removed
+        """
+        try:
+            os.remove(self.control_filename)
+            return True
+        except OSError:
+            return False
+
+    def start_session(self) -> bool:
+        """
+        begin timing the stages, sampling the stacks and tracing memory allocations
+
+        :return: True if the session started, False if the stages could not be timed
+        """
+        timers = StageTimers(self.stages)
+        try:
+            timers.wrap()
+        except AttributeError as err:
+            EverquestLogFile.starprint(f'Profiler:  Unable to time the stages, not profiling: {err}')
+            return False
+
+        self._timers = timers
+        self._samples = collections.Counter()
+        self._sample_count = 0
+        self._started_tracemalloc = not tracemalloc.is_tracing()
+        if self._started_tracemalloc:
+            tracemalloc.start()
+        self._start_time = time.time()
+        self._start_perf = time.perf_counter()
+        EverquestLogFile.starprint(f'Profiler:  Profiling for {self.seconds} seconds')
+        return True
+
+    def stop_session(self) -> str or None:
+        """
+        end the session, and write out the results
+
+        :return: report filename, or None if it could not be written
+        """
+        self._timers.unwrap()
+        elapsed = time.perf_counter() - self._start_perf
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+
+        stem = os.path.join(self.directory, 'profile-' + datetime.datetime.fromtimestamp(self._start_time)
+                            .strftime('%Y%m%d-%H%M%S'))
+        rv = stem + '.txt'
+        try:
+            with open(rv, 'w', encoding='utf-8') as f:
+                f.write(self.report(elapsed, snapshot, current, peak))
+            with open(stem + '.folded', 'w', encoding='utf-8') as f:
+                for stack, count in self._samples.most_common():
+                    f.write(f'{stack} {count}\n')
+            EverquestLogFile.starprint(f'Profiler:  Profile written to [{rv}]')
+        except OSError as err:
+            EverquestLogFile.starprint(f'Profiler:  Unable to write profile: {err}')
+            rv = None
+
+        self._timers = None
+        self._samples = None
+        return rv
+
+    def _sample(self) -> None:
+        """
+        record the current stack of every other thread, as a collapsed stack string
+        """
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        me = threading.get_ident()
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            stack = list()
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+                frame = frame.f_back
+            stack.append(names.get(ident, str(ident)))
+            self._samples[';'.join(reversed(stack))] += 1
+        self._sample_count += 1
+
+    def report(self, elapsed: float, snapshot: tracemalloc.Snapshot, current: int, peak: int) -> str:
+        """
+        :return: the session report, as text
+        """
+        lines = [f'Profile from {datetime.datetime.fromtimestamp(self._start_time):%Y-%m-%d %H:%M:%S}, '
+                 f'for {elapsed:.1f} seconds', '']
+
+        lines.append('Stage timers:')
+        lines.append(f'    {"stage":<20} {"calls":>12} {"total ms":>12} {"mean us":>10} {"% of time":>10}')
+        for name, (count, seconds) in self._timers.totals.items():
+            mean = seconds / count * 1e6 if count else 0.0
+            lines.append(f'    {name:<20} {count:>12,} {seconds * 1000:>12.1f} {mean:>10.2f} '
+                         f'{seconds / elapsed * 100:>9.1f}%')
+        lines.append('')
+
+        # where each thread spends its time, by the innermost function of each sampled stack
+        threads = dict()
+        for stack, count in self._samples.items():
+            thread = stack.split(';', 1)[0]
+            threads.setdefault(thread, collections.Counter())[stack.rsplit(';', 1)[-1]] += count
+        lines.append(f'Sampled stacks: {self._sample_count} samples, every {self.sample_seconds * 1000:.1f} ms')
+        for thread, functions in sorted(threads.items()):
+            lines.append(f'    {thread}:')
+            lines.append(f'        {"samples":>8} {"%":>6}  function (innermost frame)')
+            total = sum(functions.values())
+            for function, count in functions.most_common(REPORT_TOP):
+                lines.append(f'        {count:>8} {count / total * 100:>5.1f}%  {function}')
+        lines.append('')
+
+        lines.append(f'Memory: {current / 1024:,.0f} KiB traced, {peak / 1024:,.0f} KiB peak')
+        lines.append(f'    {"KiB":>10} {"blocks":>8}  allocation site')
+        for stat in snapshot.statistics('lineno')[:REPORT_TOP]:
+            frame = stat.traceback[0]
+            lines.append(f'    {stat.size / 1024:>10,.1f} {stat.count:>8}  {frame.filename}:{frame.lineno}')
+        lines.append('')
+        return '\n'.join(lines)
+
+    def run(self) -> None:
+        """
+        override the thread.run() method
+        this method will execute in its own thread
+        """
+        # run until shutdown
+        while not self._shutdown.is_set():
+
+            # no session, so wait for a toggle, checking for the control file every so often
+            if self._timers is None:
+                if self._toggle.wait(CONTROL_CHECK_SECONDS):
+                    self._toggle.clear()
+                    if not self._shutdown.is_set():
+                        self.start_session()
+                elif self._control_file_found():
+                    self.start_session()
+
+            # sample until the session is over, or toggled off
+            else:
+                self._sample()
+                if self._toggle.wait(self.sample_seconds):
+                    self._toggle.clear()
+                    self.stop_session()
+                elif time.perf_counter() - self._start_perf >= self.seconds:
+                    self.stop_session()
+
+        # all done
+        if self._timers is not None:
+            self.stop_session()
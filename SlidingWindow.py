@@ -0,0 +1,215 @@
+import collections
+
+
+#
+# incremental sliding window rules over timestamped events.
+#
+# A SlidingWindow holds the (epoch, ref) pairs for the events of the last so many seconds, oldest
+# first, in a deque, so adding an event and expiring the oldest are both O(1).  The ref is whatever
+# small reference the caller wants back, e.g. the log line which triggered the event.
+#
+# A WindowRule fires when a number of events occur within a window, with no "breaker" events in
+# between, e.g. "4 deaths in 120 seconds", or "3 deaths in 60 seconds, with no spell casting".
+# The rule never needs more than its event count in the window, so the window length is capped at
+# that count, and memory stays bounded however long the window is.
+#
+# A RuleEngine evaluates any number of rules side by side, from the one stream of events.
+#
+
+class SlidingWindow:
+    """
+    class to hold the events of the last so many seconds
+    """
+
+    def __init__(self, seconds: float, maxlen: int = None) -> None:
+        """
+        ctor
+
+        :param seconds: length of the window, events older than this are expired
+        :param maxlen: maximum number of events held, the oldest are dropped beyond this.  None for no limit
+        """
+        self.seconds = seconds
+        self._events = collections.deque(maxlen=maxlen)
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+    def __bool__(self) -> bool:
+        return bool(self._events)
+
+    def __iter__(self):
+        """
+        :return: iterator of (epoch, ref) tuples, oldest first
+        """
+        return iter(self._events)
+
+    def append(self, epoch: int, ref=None) -> None:
+        """
+        add an event
+
+        :param epoch: event time, epoch seconds
+        :param ref: reference to the event, e.g. the log line
+        """
+        self._events.append((epoch, ref))
+
+    def expire(self, now: int) -> int:
+        """
+        remove the events which have scrolled out of the window
+
+        :param now: current time, epoch seconds
+        :return: number of events removed
+        """
+        events = self._events
+        rv = 0
+        while events and now - events[0][0] > self.seconds:
+            events.popleft()
+            rv += 1
+        return rv
+
+    def clear(self) -> None:
+        self._events.clear()
+
+    def oldest(self) -> tuple or None:
+        """
+        :return: the oldest (epoch, ref) tuple, or None if the window is empty
+        """
+        return self._events[0] if self._events else None
+
+    def newest(self) -> tuple or None:
+        """
+        :return: the newest (epoch, ref) tuple, or None if the window is empty
+        """
+        return self._events[-1] if self._events else None
+
+
+class WindowRule:
+    """
+    class for a rule which fires when a number of events occur within a window, with no breakers in between
+    """
+
+    def __init__(self, name: str, count: int, seconds: float, events: frozenset,
+                 breakers: frozenset = frozenset(), description: str = None) -> None:
+        """
+        ctor
+
+        :param name: rule name
+        :param count: number of events which fire the rule
+        :param seconds: length of the window
+        :param events: set of event categories counted by the rule
+        :param breakers: set of event categories which clear the window
+        :param description: human readable description, for reports
+        """
+        self.name = name
+        self.count = count
+        self.seconds = seconds
+        self.events = frozenset(events)
+        self.breakers = frozenset(breakers)
+        self.description = description or f'{count} events in {seconds} seconds'
+        self.window = SlidingWindow(seconds, maxlen=count)
+
+    def is_triggered(self) -> bool:
+        return len(self.window) >= self.count
+
+
+class RuleEngine:
+    """
+    class to evaluate a number of WindowRules side by side
+    """
+
+    def __init__(self, rules: list[WindowRule] = ()) -> None:
+        """
+        ctor
+
+        :param rules: list of WindowRules
+        """
+        self.rules = list()
+        self._windows = list()
+
+        # dictionary of category: list of rules counting it, and of rules broken by it
+        self._counting = dict()
+        self._breaking = dict()
+
+        # all the categories counted, and all the categories which break any rule
+        self.event_categories = frozenset()
+        self.breaker_categories = frozenset()
+
+        for rule in rules:
+            self.add(rule)
+
+    def add(self, rule: WindowRule) -> None:
+        """
+        :param rule: WindowRule to evaluate
+        """
+        self.rules.append(rule)
+        self._windows.append(rule.window)
+        self.event_categories = self.event_categories | rule.events
+        self.breaker_categories = self.breaker_categories | rule.breakers
+        for category in rule.events:
+            self._counting.setdefault(category, list()).append(rule)
+        for category in rule.breakers:
+            self._breaking.setdefault(category, list()).append(rule)
+
+    @property
+    def pending(self) -> bool:
+        """
+        :return: True if any rule has events in its window
+        """
+        for window in self._windows:
+            if window:
+                return True
+        return False
+
+    def observe(self, epoch: int, category: str, ref=None) -> None:
+        """
+        add an event to every rule which counts its category, then expire the old events
+
+        :param epoch: event time, epoch seconds
+        :param category: event category
+        :param ref: reference to the event, e.g. the log line
+        """
+        for rule in self._counting.get(category, ()):
+            rule.window.append(epoch, ref)
+        self.expire(epoch)
+
+    def expire(self, now: int) -> int:
+        """
+        remove the events which have scrolled out of every window
+
+        :param now: current time, epoch seconds
+        :return: number of events removed
+        """
+        rv = 0
+        for window in self._windows:
+            if window:
+                rv += window.expire(now)
+        return rv
+
+    def interrupt(self, category: str) -> bool:
+        """
+        clear the window of every rule broken by this category
+
+        :param category: event category
+        :return: True if any events were cleared
+        """
+        rv = False
+        for rule in self._breaking.get(category, ()):
+            if rule.window:
+                rule.window.clear()
+                rv = True
+        return rv
+
+    def triggered(self) -> WindowRule or None:
+        """
+        :return: the first rule which has fired, or None
+        """
+        for rule in self.rules:
+            if len(rule.window) >= rule.count:
+                return rule
+        return None
+
+    def reset(self) -> None:
+        """
+        clear every window
+        """
+        for window in self._windows:
+            window.clear()
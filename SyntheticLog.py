@@ -0,0 +1,178 @@
+import argparse
+import datetime
+import random
+
+
+#
+# synthetic Everquest log generator, for benchmarks and backtesting.
+#
+# Generates lines in the standard '[Ddd Mmm dd HH:MM:SS YYYY] message' log format, with a
+# configurable mix of message kinds, and timestamps advancing at a configurable average rate.
+#
+# usage:
+#
+#   python SyntheticLog.py OUTFILE [--lines 1000000] [--rate 20] [--seed 1]
+#
+
+# default message mix, i.e. relative weights of each kind of message
+DEFAULT_MIX = {
+    'combat': 80.0,
+    'tell': 4.0,
+    'casting': 5.0,
+    'death': 0.5,
+    'other': 10.5,
+}
+
+MOBS = ['a gnoll pup', 'a decaying skeleton', 'Lord Nagafen', 'a froglok tad', 'an orc centurion',
+        'a sand giant', 'Trakanon', 'a Teir`Dal shadowknight']
+NAMES = ['Soandso', 'Kyrax', 'Fippy', 'Aradune', 'Lodizal', 'Mysstie']
+SPELLS = ['Complete Heal', 'Gate', 'Spirit of Wolf', 'Clarity', 'Tashan', 'Fire Bolt']
+MELEE = ['hit', 'slash', 'pierce', 'crush', 'kick', 'bash', 'backstab']
+OTHER = ['You have entered The Feerrott.', 'Your faction standing with Guards of Qeynos got worse.',
+         'LOADING, PLEASE WAIT...', 'You feel a bit dizzy.', 'Your target is too far away, get closer!',
+         'You are no longer auto attacking.', 'Welcome to EverQuest!']
+
+
+class SyntheticLog:
+    """
+    class to generate synthetic Everquest log lines
+    """
+
+    def __init__(self, char_name: str = 'Testchar', mix: dict = None, start: datetime.datetime = None,
+                 lines_per_second: float = 20.0, seed: int = None) -> None:
+        """
+        ctor
+
+        :param char_name: character name, used in outgoing communication messages
+        :param mix: dictionary of message kind: relative weight, see DEFAULT_MIX
+        :param start: timestamp of the first line, defaults to now
+        :param lines_per_second: average number of lines per second of log time
+        :param seed: random seed, for repeatable logs
+        """
+        self.char_name = char_name
+        self.mix = dict(mix or DEFAULT_MIX)
+        self.now = start or datetime.datetime.now().replace(microsecond=0)
+        self.lines_per_second = lines_per_second
+        self._random = random.Random(seed)
+
+        self._kinds = list(self.mix.keys())
+        self._weights = list(self.mix.values())
+        self._generators = {
+            'combat': self.combat_message,
+            'tell': self.tell_message,
+            'casting': self.casting_message,
+            'death': self.death_message,
+            'other': self.other_message,
+        }
+
+        # the stamp is reformatted only when the second changes
+        self._offset = 0.0
+        self._stamp_time = None
+        self._stamp = ''
+
+    def stamp(self) -> str:
+        """
+        :return: date-time stamp for the current log time
+        """
+        if self.now != self._stamp_time:
+            self._stamp = self.now.strftime('[%a %b %d %H:%M:%S %Y] ')
+            self._stamp_time = self.now
+        return self._stamp
+
+    def advance(self) -> None:
+        """
+        advance the log time by a random interval, averaging 1 / lines_per_second seconds
+        """
+        self._offset += self._random.expovariate(self.lines_per_second)
+        whole = int(self._offset)
+        if whole:
+            self.now += datetime.timedelta(seconds=whole)
+            self._offset -= whole
+
+    def combat_message(self) -> str:
+        r = self._random
+        mob = r.choice(MOBS)
+        kind = r.randrange(4)
+        if kind == 0:
+            return f'{mob[0].upper()}{mob[1:]} hits YOU for {r.randint(1, 250)} points of damage.'
+        elif kind == 1:
+            return f'{mob[0].upper()}{mob[1:]} tries to hit YOU, but misses!'
+        elif kind == 2:
+            return f'You {r.choice(MELEE)} {mob} for {r.randint(1, 60)} points of damage.'
+        else:
+            return f'You try to {r.choice(MELEE)} {mob}, but miss!'
+
+    def tell_message(self) -> str:
+        r = self._random
+        kind = r.randrange(3)
+        if kind == 0:
+            return f"{r.choice(NAMES)} tells you, 'lfg?'"
+        elif kind == 1:
+            return f"You told {r.choice(NAMES)}, 'omw'"
+        else:
+            return f"{self.char_name} -> {r.choice(NAMES)}: brb"
+
+    def casting_message(self) -> str:
+        return f'You begin casting {self._random.choice(SPELLS)}.'
+
+    def death_message(self) -> str:
+        return f'You have been slain by {self._random.choice(MOBS)}!'
+
+    def other_message(self) -> str:
+        return self._random.choice(OTHER)
+
+    def line(self, kind: str = None) -> str:
+        """
+        generate the next line
+
+        :param kind: message kind, or None to choose one at random using the mix weights
+        :return: log line, without line terminator
+        """
+        self.advance()
+        if kind is None:
+            kind = self._random.choices(self._kinds, self._weights)[0]
+        return self.stamp() + self._generators[kind]()
+
+    def lines(self, count: int):
+        """
+        generate a number of lines
+
+        :param count: number of lines
+        :return: generator of log lines, without line terminators
+        """
+        for _ in range(count):
+            yield self.line()
+
+    def write(self, filename: str, count: int, mode: str = 'w') -> None:
+        """
+        write a number of lines to a file
+
+        :param filename: output filename
+        :param count: number of lines
+        :param mode: 'w' to overwrite the file, 'a' to append
+        """
+        with open(filename, mode) as f:
+            for line in self.lines(count):
+                f.write(line + '\n')
+
+
+#################################################################################################
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic Everquest log file')
+    parser.add_argument('outfile', help='output filename')
+    parser.add_argument('--lines', type=int, default=1000000, help='number of lines')
+    parser.add_argument('--rate', type=float, default=20.0, help='average lines per second of log time')
+    parser.add_argument('--char', default='Testchar', help='character name')
+    parser.add_argument('--seed', type=int, default=None, help='random seed')
+    for kind, weight in DEFAULT_MIX.items():
+        parser.add_argument(f'--{kind}', type=float, default=weight, help=f'relative weight of {kind} messages')
+    args = parser.parse_args()
+
+    mix = {kind: getattr(args, kind) for kind in DEFAULT_MIX}
+    SyntheticLog(args.char, mix, lines_per_second=args.rate, seed=args.seed).write(args.outfile, args.lines)
+
+
+if __name__ == '__main__':
+    main()
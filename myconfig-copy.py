@@ -10,3 +10,41 @@ HEARTBEAT                   = 15
 # parameters that define a deathloop, i.e. X deaths in Y seconds
 DEATHLOOP_DEATHS            = 4
 DEATHLOOP_SECONDS           = 120
+
+# multi-client mode.  if True, every active character log on the server is monitored at once, rather than only
+# the most recently modified one.  log files modified within MULTILOG_ACTIVE_SECONDS seconds are considered active
+MONITOR_ALL_LOGS            = False
+MULTILOG_ACTIVE_SECONDS     = 600
+
+# local TCP port for the Prometheus-format metrics endpoint, at http://127.0.0.1:<port>/metrics.  0 to disable
+METRICS_PORT                = 9187
+
+# archival.  completed sessions are only rolled off log files which have not been modified for this many seconds
+ARCHIVE_IDLE_SECONDS        = 3600
+
+# shared log reader.  maximum number of parsed log events queued for each consumer
+EVENT_QUEUE_SIZE            = 10000
+
+# local event stream for external tools, e.g. overlays.  a Unix-domain socket path, if EVENT_SOCKET is set and the
+# platform supports it, else a TCP port on the loopback interface.  EVENT_PORT = 0 and EVENT_SOCKET = '' to disable
+EVENT_PORT                  = 0
+EVENT_SOCKET                = ''
+
+# kill policy.  signals sent to the eqgame.exe processes, in order of escalation, with KILL_ESCALATE_SECONDS between
+# them for any process still running.  KILL_BUDGET_SECONDS is the target time from detection to the first signal
+KILL_SIGNALS                = ('SIGTERM', 'SIGKILL')
+KILL_ESCALATE_SECONDS       = 3.0
+KILL_BUDGET_SECONDS         = 0.005
+
+# kill scope.  'owner' kills only the eqgame.exe process which has the death looping character's log file open,
+# where the platform lets us find that out (Linux / Wine), and every eqgame.exe process otherwise.  'all' always
+# kills every eqgame.exe process
+KILL_SCOPE                  = 'owner'
+
+# on-demand profiling.  length of a profiling session, and the interval between stack samples, in seconds
+PROFILE_SECONDS             = 30
+PROFILE_SAMPLE_SECONDS      = 0.005
+
+# console output.  'QUIET' shows only errors, 'NORMAL' adds the status messages, and 'VERBOSE' also echoes every
+# log line as it is parsed
+CONSOLE_VERBOSITY           = 'VERBOSE'
@@ -0,0 +1,66 @@
+import importlib.util
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import time
+
+import pytest
+
+
+# the modules live in the repo root, and read their settings from myconfig.py, which is made by copying
+# myconfig-copy.py.  if there is no myconfig.py, the template is used, with the logs in a temporary directory
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+if importlib.util.find_spec('myconfig') is None:
+    spec = importlib.util.spec_from_file_location('myconfig', os.path.join(ROOT, 'myconfig-copy.py'))
+    myconfig = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(myconfig)
+    sys.modules['myconfig'] = myconfig
+
+
+@pytest.fixture
+def logs_directory(tmp_path, monkeypatch):
+    """
+    :return: a temporary logs directory, set as the configured one
+    """
+    import myconfig
+    monkeypatch.setattr(myconfig, 'BASE_DIRECTORY', str(tmp_path))
+    monkeypatch.setattr(myconfig, 'LOGS_DIRECTORY', os.sep + 'logs' + os.sep)
+    rv = tmp_path / 'logs'
+    rv.mkdir()
+    return rv
+
+
+@pytest.fixture
+def spawn(tmp_path):
+    """
+    :return: function to start a dummy eqgame.exe process, i.e. a copy of sleep, with its own log file open
+    """
+    import ProcessFinder
+    executable = tmp_path / 'eqgame.exe'
+    shutil.copy(shutil.which('sleep'), executable)
+    processes = list()
+
+    def rv(char_name: str, ignore_sigterm: bool = False) -> tuple[str, subprocess.Popen]:
+        filename = tmp_path / f'eqlog_{char_name}_P1999Green.txt'
+        filename.touch()
+        # an ignored signal stays ignored across exec
+        preexec_fn = (lambda: signal.signal(signal.SIGTERM, signal.SIG_IGN)) if ignore_sigterm else None
+        with open(filename) as f:
+            process = subprocess.Popen([str(executable), '30'], stdin=f, preexec_fn=preexec_fn)
+        processes.append(process)
+
+        # wait for the exec, so the process has its new name
+        finder = ProcessFinder.ProcFsProcessFinder('eqgame.exe')
+        deadline = time.monotonic() + 5
+        while not finder.matches(process.pid) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return str(filename), process
+
+    yield rv
+    for process in processes:
+        process.kill()
+        process.wait()
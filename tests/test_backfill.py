@@ -0,0 +1,73 @@
+import time
+
+import DeathLoopVaccine
+import EventPublisher
+
+
+def stamp(seconds_ago: float) -> str:
+    """
+    :return: log date-time stamp for the local time the given number of seconds ago
+    """
+    return time.strftime('[%a %b %d %H:%M:%S %Y]', time.localtime(time.time() - seconds_ago))
+
+
+def test_backfill_then_complete_partial_line(logs_directory):
+    filename = logs_directory / 'eqlog_Testchar_P1999Green.txt'
+    with open(filename, 'w', newline='\n') as f:
+        f.write(f'{stamp(30)} You have been slain by a gnoll!\n')
+        f.write(f'{stamp(20)} You have been slain by a gnoll!\n')
+        f.write(f'{stamp(10)} You are no lon')
+
+    dlv = DeathLoopVaccine.DeathLoopVaccine()
+    assert dlv.open('Testchar', str(filename), seek_end=True)
+    try:
+        assert dlv.death_count() == 2
+
+        # the rest of the partial line arrives, followed by a complete line
+        with open(filename, 'a', newline='\n') as f:
+            f.write(f'ger auto attacking.\n{stamp(5)} You have been slain by a gnoll!\n')
+
+        lines = dlv.read_lines()
+        assert lines[0].endswith(b'] You are no longer auto attacking.')
+        assert len(lines) == 2
+        dlv.process_lines(lines)
+        assert dlv.death_count() == 3
+    finally:
+        dlv.close()
+
+
+def test_lines_without_a_stamp_are_skipped(logs_directory):
+    dlv = DeathLoopVaccine.DeathLoopVaccine()
+    dlv.process_line(f'{stamp(10)} You have been slain by a gnoll!'.encode())
+    assert dlv.death_count() == 1
+
+    # neither a death nor any other line without a valid stamp may stop the parsing thread
+    for line in (b'ger auto attacking.', b'You have been slain by a gnoll!', b'You begin casting Gate.'):
+        category = dlv.classify(line)
+        dlv.check_for_death(line, category)
+        dlv.check_not_afk(line, category)
+    assert dlv.death_count() == 1
+
+
+def test_publishing_does_not_change_detection(logs_directory, monkeypatch):
+    class Recorder:
+        def __init__(self):
+            self.events = list()
+
+        def publish(self, kind, epoch, value, text):
+            self.events.append(kind)
+
+    recorder = Recorder()
+    monkeypatch.setattr(EventPublisher, '_publisher', recorder)
+
+    dlv = DeathLoopVaccine.DeathLoopVaccine()
+    dlv.process_line(f'{stamp(10)} You have been slain by a gnoll!'.encode())
+    assert dlv.death_count() == 1
+
+    # proof of life, with a stamp which can't be parsed, so can't be published, but still clears the window
+    line = b'[Xxx Xxx 99 99:99:99 9999] You begin casting Gate.'
+    category = dlv.classify(line)
+    assert category in dlv.rules.breaker_categories
+    dlv.check_not_afk(line, category)
+    assert dlv.death_count() == 0
+    assert EventPublisher.AFK_BREAKER not in recorder.events
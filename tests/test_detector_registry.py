@@ -0,0 +1,39 @@
+import pytest
+
+import DetectorRegistry
+import EverquestLogFile
+
+
+class Recorder(DetectorRegistry.Detector):
+    """
+    detector which records the lines it detects
+    """
+
+    def __init__(self, prefixes: tuple) -> None:
+        self.prefixes = prefixes
+        super().__init__()
+        self.lines = list()
+
+    def detect(self, elf, line, m) -> None:
+        self.lines.append(line)
+
+
+@pytest.mark.parametrize('bytes_mode', [False, True])
+@pytest.mark.parametrize('prefix, message', [
+    ('You have been', 'You have been slain by a gnoll!'),
+    ('Yo', 'You have been slain by a gnoll!'),
+    ('Soandso', "Soandso's corpse has decayed."),
+    (' ', ' leading space'),
+])
+def test_every_prefix_is_dispatched(prefix, message, bytes_mode):
+    elf = EverquestLogFile.EverquestLogFile()
+    registry = DetectorRegistry.DetectorRegistry()
+    detector = registry.register(Recorder((prefix,)))
+
+    line = '[Sat Oct 17 03:46:16 2026] ' + message
+    if bytes_mode:
+        assert registry.dispatch_bytes(elf, line.encode()) == 1
+    else:
+        assert registry.dispatch(elf, line) == 1
+    assert registry.dispatch(elf, '[Sat Oct 17 03:46:16 2026] Welcome to EverQuest!') == 0
+    assert detector.lines == [line]
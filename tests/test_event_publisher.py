@@ -0,0 +1,75 @@
+import socket
+import threading
+import time
+
+import pytest
+
+import EventPublisher
+
+
+pytestmark = pytest.mark.skipif(not hasattr(socket, 'AF_UNIX'), reason='needs Unix-domain sockets')
+
+
+def test_only_replaces_a_socket(tmp_path):
+    path = tmp_path / 'events'
+    path.write_text('not a socket')
+    with pytest.raises(FileExistsError):
+        EventPublisher.EventPublisher(path=str(path))
+    assert path.read_text() == 'not a socket'
+
+    # a socket left behind, e.g. by a crash
+    path.unlink()
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(str(path))
+    stale.close()
+    publisher = EventPublisher.EventPublisher(path=str(path))
+    publisher.listener.close()
+
+
+def test_slow_client_does_not_hold_up_the_others(tmp_path, monkeypatch):
+    monkeypatch.setattr(EventPublisher, 'SLOW_CLIENT_SECONDS', 60.0)
+    path = str(tmp_path / 'events')
+    publisher = EventPublisher.EventPublisher(path=path)
+    publisher.start()
+
+    # one client which never reads, and one which does
+    slow = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    slow.connect(path)
+    fast = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    fast.connect(path)
+    deadline = time.monotonic() + 5
+    while publisher.client_count() < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    count = 50000
+    received = list()
+
+    def reader():
+        for event in EventPublisher.read_events(fast):
+            received.append(event)
+            if len(received) == count:
+                return
+    thread = threading.Thread(target=reader, daemon=True)
+    thread.start()
+
+    try:
+        start = time.monotonic()
+        text = 'x' * 100
+        for i in range(count):
+            publisher.publish(EventPublisher.DEATH, i, 0, text)
+            if i % 1000 == 0:
+                time.sleep(0.001)
+        thread.join(30)
+
+        # everything reached the reading client, long before the stuck one could be disconnected,
+        # and the stuck one missed what it couldn't take
+        assert len(received) == count
+        assert [event[1] for event in received] == list(range(count))
+        assert time.monotonic() - start < 20
+        assert publisher.dropped > 0
+        assert publisher.client_count() == 2
+    finally:
+        publisher.shutdown()
+        publisher.join(5)
+        slow.close()
+        fast.close()
@@ -0,0 +1,63 @@
+import os
+import signal
+import subprocess
+import time
+
+import pytest
+
+import KillExecutor
+import ProcessFinder
+
+
+pytestmark = pytest.mark.skipif(not os.path.isdir('/proc/self'), reason='needs /proc')
+
+
+@pytest.fixture
+def executor():
+    finder = ProcessFinder.CachedProcessFinder(ProcessFinder.ProcFsProcessFinder('eqgame.exe'))
+    rv = KillExecutor.KillExecutor(finder, signal_names=('SIGTERM', 'SIGKILL'), escalate_seconds=0.5,
+                                   budget_seconds=0.5, scope='owner')
+    yield rv
+    rv.shutdown()
+    if rv.ident is not None:
+        rv.join(5)
+
+
+def test_owner_scope_kills_only_the_owner(spawn, executor):
+    looping, looping_process = spawn('Alpha')
+    other, other_process = spawn('Bravo')
+    executor.refresh_targets()
+    assert sorted(executor.targets) == sorted((looping_process.pid, other_process.pid))
+
+    executor.start()
+    executor.fire(True, 'test', looping)
+    assert looping_process.wait(5) != 0
+    assert other_process.poll() is None
+
+
+def test_ready_while_escalating(spawn, executor):
+    stubborn, stubborn_process = spawn('Alpha', ignore_sigterm=True)
+    executor.start()
+    time.sleep(0.1)
+
+    # SIGTERM is ignored, so SIGKILL follows after the grace period, but meanwhile further kills
+    # are carried out straight away, and none of them is lost
+    assert executor.fire(True, 'first', stubborn)
+    assert executor.fire(False, 'second', stubborn)
+    assert executor.fire(False, 'third', stubborn)
+    assert stubborn_process.poll() is None
+    assert stubborn_process.wait(5) == -signal.SIGKILL
+
+
+def test_stale_targets_are_refreshed(spawn, executor):
+    filename, process = spawn('Alpha')
+    executor.start()
+    time.sleep(0.1)
+
+    # e.g. the game was restarted since the targets were last found
+    gone = subprocess.Popen(['true'])
+    gone.wait()
+    executor.targets = (gone.pid,)
+    executor.owners = dict()
+    assert executor.fire(True, 'test', filename)
+    assert process.wait(5) == -signal.SIGTERM
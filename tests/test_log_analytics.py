@@ -0,0 +1,39 @@
+import datetime
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+import Backtest
+import LogAnalytics
+import SyntheticLog
+
+
+def kill_counts(filename: str, deaths: int, seconds: int) -> tuple[int, int]:
+    """
+    :return: (LogAnalytics death loops, Backtest kills) tuple for the same log and death loop definition
+    """
+    analyzer = LogAnalytics.LogAnalyzer('Testchar', deaths, seconds)
+    analyzer.analyze_file(filename)
+    return len(analyzer.finish()['death_loops']), len(Backtest.replay(filename, deaths, seconds).kill_points)
+
+
+def test_session_start_does_not_clear_deaths(tmp_path):
+    filename = str(tmp_path / 'eqlog_Testchar_P1999Green.txt')
+    with open(filename, 'w') as f:
+        f.write('[Sat Oct 17 03:46:00 2026] You have been slain by a gnoll!\n'
+                '[Sat Oct 17 03:46:05 2026] Welcome to EverQuest!\n'
+                '[Sat Oct 17 03:46:10 2026] You have been slain by a gnoll!\n'
+                '[Sat Oct 17 03:46:16 2026] You have been slain by a gnoll!\n')
+    assert kill_counts(filename, 3, 60) == (1, 1)
+
+
+@pytest.mark.parametrize('deaths, seconds', [(3, 60), (4, 120)])
+def test_kill_count_matches_backtest(tmp_path, deaths, seconds):
+    filename = str(tmp_path / 'eqlog_Testchar_P1999Green.txt')
+    mix = dict(SyntheticLog.DEFAULT_MIX, death=10.0)
+    SyntheticLog.SyntheticLog('Testchar', mix, datetime.datetime(2026, 10, 17), seed=1).write(filename, 50000)
+
+    analytics, backtest = kill_counts(filename, deaths, seconds)
+    assert analytics > 0
+    assert analytics == backtest
@@ -0,0 +1,118 @@
+import gzip
+import os
+
+import LogArchiver
+
+
+def session(day: int, lines: int) -> bytes:
+    rv = f'[Mon Jan {day:02d} 10:00:00 2024] Welcome to EverQuest!\n'
+    for n in range(lines):
+        rv += f'[Mon Jan {day:02d} 10:00:{n % 60:02d} 2024] line {n}\n'
+    return rv.encode()
+
+
+def make_log(logs_directory) -> str:
+    filename = str(logs_directory / 'eqlog_Testchar_P1999Green.txt')
+    with open(filename, 'wb') as f:
+        f.write(session(1, 10) + session(2, 10) + session(3, 5))
+    return filename
+
+
+def archived(segments: list[str]) -> bytes:
+    rv = b''
+    for segment in segments:
+        with gzip.open(segment, 'rb') as f:
+            rv += f.read()
+    return rv
+
+
+def test_archive(logs_directory):
+    filename = make_log(logs_directory)
+    segments = LogArchiver.LogArchiver().archive_file(filename, 'Testchar')
+    assert archived(segments) == session(1, 10) + session(2, 10)
+    with open(filename, 'rb') as f:
+        assert f.read() == session(3, 5)
+
+
+def test_lines_written_while_archiving_are_kept(logs_directory, monkeypatch):
+    filename = make_log(logs_directory)
+    archiver = LogArchiver.LogArchiver()
+
+    # a line, and a new session, arrive once the log has been stat'ed, which must not be archived
+    find_sessions = archiver.find_sessions
+
+    def find_sessions_then_write(*args):
+        rv = find_sessions(*args)
+        with open(filename, 'ab') as f:
+            f.write(b'[Wed Jan 03 10:01:00 2024] late line\n' + session(4, 1))
+        return rv
+    monkeypatch.setattr(archiver, 'find_sessions', find_sessions_then_write)
+
+    segments = archiver.archive_file(filename, 'Testchar')
+    assert archived(segments) == session(1, 10) + session(2, 10)
+    with open(filename, 'rb') as f:
+        assert f.read() == session(3, 5) + b'[Wed Jan 03 10:01:00 2024] late line\n' + session(4, 1)
+
+
+def test_lines_written_to_the_old_log_after_the_swap_are_kept(logs_directory, monkeypatch):
+    filename = make_log(logs_directory)
+    archiver = LogArchiver.LogArchiver()
+
+    # a writer which has the log open, and writes to it just after it has been replaced
+    writer = open(filename, 'ab')
+    replace = os.replace
+
+    def replace_then_write(*args):
+        replace(*args)
+        writer.write(b'[Wed Jan 03 10:01:00 2024] late line\n')
+        writer.flush()
+    monkeypatch.setattr(os, 'replace', replace_then_write)
+
+    try:
+        segments = archiver.archive_file(filename, 'Testchar')
+    finally:
+        writer.close()
+    assert archived(segments) == session(1, 10) + session(2, 10)
+    with open(filename, 'rb') as f:
+        assert f.read() == session(3, 5) + b'[Wed Jan 03 10:01:00 2024] late line\n'
+
+
+def linear_find_block(index: dict, epoch: int) -> list:
+    rv = None
+    for block in index['blocks']:
+        if rv is not None and block[0] is not None and block[0] >= epoch:
+            break
+        rv = block
+    return rv
+
+
+def test_find_block():
+    blocks = [[None, 0, 0], [None, 10, 5]] + [[epoch, n * 10 + 20, n * 5 + 10]
+                                              for n, epoch in enumerate((100, 100, 105, 110, 110, 120))]
+    for leading in (0, 2):
+        index = {'blocks': blocks[leading:]}
+        for epoch in range(90, 130):
+            assert LogArchiver.find_block(index, epoch) is linear_find_block(index, epoch)
+            after = LogArchiver.find_block_after(index, epoch)
+            assert after is next((block for block in index['blocks'] if block[0] is not None and block[0] > epoch),
+                                 None)
+    assert LogArchiver.find_block({'blocks': []}, 100) is None
+
+
+def test_unstamped_block_takes_the_previous_epoch(logs_directory):
+    filename = str(logs_directory / 'segment.txt.gz')
+    writer = LogArchiver.SegmentWriter(filename, filename, index_interval=1)
+    for line in (b'no stamp\n', b'[Mon Jan 01 10:00:00 2024] one\n', b'no stamp either\n',
+                 b'[Mon Jan 01 10:00:05 2024] two\n'):
+        writer.write_line(line)
+    writer.close()
+    epochs = [block[0] for block in LogArchiver.read_index(filename)['blocks']]
+    assert epochs[0] is None
+    assert epochs[1] == epochs[2]
+    assert epochs[3] == epochs[1] + 5
+
+    # the lines stamped epoch may begin part way through the block before, so reading starts there
+    with LogArchiver.open_segment(filename, epochs[3]) as f:
+        assert f.read() == b'no stamp either\n[Mon Jan 01 10:00:05 2024] two\n'
+        raw = f.fileobj
+    assert raw.closed
@@ -0,0 +1,70 @@
+import os
+
+import LogDirectoryIndex
+
+
+def make_logs(directory, count: int) -> list[str]:
+    rv = list()
+    for n in range(count):
+        filename = os.path.join(str(directory), f'eqlog_Char{n}_server.txt')
+        with open(filename, 'w') as f:
+            f.write('old\n')
+        os.utime(filename, (1000 + n, 1000 + n))
+        rv.append(filename)
+    return rv
+
+
+def count_stats(monkeypatch) -> list[str]:
+    rv = list()
+    stat = os.stat
+
+    def counting_stat(path, *args, **kwargs):
+        rv.append(path)
+        return stat(path, *args, **kwargs)
+    monkeypatch.setattr(os, 'stat', counting_stat)
+    return rv
+
+
+def test_only_followed_files_restatted(tmp_path, monkeypatch):
+    filenames = make_logs(tmp_path, 50)
+    index = LogDirectoryIndex.LogDirectoryIndex(str(tmp_path) + os.sep, 'server', restat_seconds=3600)
+    assert index.latest() == (filenames[-1], 'Char49')
+
+    stats = count_stats(monkeypatch)
+    os.utime(filenames[0], (5000, 5000))
+    assert index.latest((filenames[0],)) == (filenames[0], 'Char0')
+
+    # the directory, and the followed file, and nothing else
+    assert sorted(stats) == sorted([str(tmp_path) + os.sep, filenames[0]])
+
+
+def test_every_file_restatted_eventually(tmp_path, monkeypatch):
+    filenames = make_logs(tmp_path, 5)
+    index = LogDirectoryIndex.LogDirectoryIndex(str(tmp_path) + os.sep, 'server', restat_seconds=3600)
+    assert index.latest() == (filenames[-1], 'Char4')
+
+    # a previously played character logs in, which appends to its log without changing the directory
+    os.utime(filenames[1], (5000, 5000))
+    assert index.latest((filenames[-1],)) == (filenames[-1], 'Char4')
+
+    index.restat_seconds = 0
+    assert index.latest((filenames[-1],)) == (filenames[1], 'Char1')
+
+
+def test_new_file_rescans(tmp_path):
+    index = LogDirectoryIndex.LogDirectoryIndex(str(tmp_path) + os.sep, 'server', restat_seconds=3600)
+    assert index.latest() is None
+
+    filenames = make_logs(tmp_path, 2)
+    os.utime(str(tmp_path), ns=(os.stat(str(tmp_path)).st_mtime_ns + 1,) * 2)
+    assert index.latest() == (filenames[-1], 'Char1')
+
+
+def test_full_refresh_restats_every_file(tmp_path):
+    filenames = make_logs(tmp_path, 5)
+    index = LogDirectoryIndex.LogDirectoryIndex(str(tmp_path) + os.sep, 'server', restat_seconds=3600)
+    assert index.latest() == (filenames[-1], 'Char4')
+
+    # the heartbeat expires with Char4 idle, and it turns out Char1 has logged in
+    os.utime(filenames[1], (5000, 5000))
+    assert index.latest((filenames[-1],), full=True) == (filenames[1], 'Char1')
@@ -0,0 +1,91 @@
+import os
+import time
+
+import DeathLoopVaccine
+import EverquestLogFile
+import LogEventBus
+
+from test_backfill import stamp
+
+
+def test_consumer_is_backfilled_and_handed_parsed_events(logs_directory):
+    filename = logs_directory / 'eqlog_Testchar_P1999Green.txt'
+    with open(filename, 'w', newline='\n') as f:
+        f.write(f'{stamp(30)} You have been slain by a gnoll!\n')
+        f.write(f'{stamp(20)} You have been slain by a gnoll!\n')
+
+    bus = LogEventBus.LogEventBus()
+    dlv = DeathLoopVaccine.DeathLoopVaccine()
+    consumer = LogEventBus.LogFileConsumer(bus, dlv)
+    assert bus.open('Testchar', str(filename), seek_end=True)
+    try:
+        with open(filename, 'a', newline='\n') as f:
+            f.write(f'{stamp(10)} You have been slain by a gnoll!\n')
+        bus.dispatch_lines(bus.read_lines())
+
+        # the two deaths before the consumer's first event come from the backfill, and the category and
+        # stamp of the new one from the bus, so the consumer only classifies the backfilled lines itself
+        classified = list()
+        classify = dlv.classify
+        dlv.classify = lambda line: classified.append(line) or classify(line)
+        consumer.process_events(consumer.subscriber.get(0))
+        assert dlv.death_count() == 3
+        assert len(classified) == 2
+    finally:
+        bus.close()
+
+
+def test_rollover_with_events_still_queued(logs_directory):
+    filenames = list()
+    for char_name in ('Alpha', 'Beta'):
+        filename = str(logs_directory / f'eqlog_{char_name}_P1999Green.txt')
+        with open(filename, 'w', newline='\n') as f:
+            f.write(f'{stamp(30)} You have been slain by a gnoll!\n')
+        filenames.append(filename)
+
+    bus = LogEventBus.LogEventBus()
+    dlv = DeathLoopVaccine.DeathLoopVaccine()
+    consumer = LogEventBus.LogFileConsumer(bus, dlv)
+
+    # where each backfill starts, and which file each event is processed as being from
+    backfills = list()
+    backfill = dlv.backfill
+    dlv.backfill = lambda: backfills.append((dlv.filename, dlv.file.tell())) or backfill()
+    processed = list()
+    process_event = dlv.process_event
+    dlv.process_event = lambda epoch, category, line: processed.append((dlv.filename, line)) or \
+        process_event(epoch, category, line)
+
+    # a line from each log is queued, with the bus rolling over from one to the other in between
+    starts = list()
+    for char_name, filename in zip(('Alpha', 'Beta'), filenames):
+        assert bus.open(char_name, filename, seek_end=True)
+        starts.append(os.path.getsize(filename))
+        with open(filename, 'a', newline='\n') as f:
+            f.write(f'{stamp(10)} {char_name} line\n')
+        bus.dispatch_lines(bus.read_lines())
+        bus.close()
+
+    consumer.process_events(consumer.subscriber.get(0))
+    assert backfills == list(zip(filenames, starts))
+    assert [(filename, line[EverquestLogFile.MESSAGE_OFFSET:]) for filename, line in processed] == [(filenames[0], b'Alpha line'),
+                                                                       (filenames[1], b'Beta line')]
+
+
+def test_stuck_consumer_only_holds_up_the_reader_once():
+    subscriber = LogEventBus.Subscriber('stuck', maxsize=1, block_timeout=0.1)
+    events = [LogEventBus.LogEvent(0, DeathLoopVaccine.OTHER, 0, b'') for _ in range(3)]
+
+    start = time.monotonic()
+    assert subscriber.put(events) == 1
+    assert time.monotonic() - start >= 0.1
+
+    # the consumer is known to be stuck, so the reader doesn't wait for it again
+    start = time.monotonic()
+    assert subscriber.put(events) == 0
+    assert time.monotonic() - start < 0.05
+    assert subscriber.dropped == 5
+
+    # until it takes some events
+    assert len(subscriber.get(0)) == 1
+    assert subscriber.put(events) == 1
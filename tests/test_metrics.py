@@ -0,0 +1,45 @@
+import sys
+import threading
+
+import EverquestLogFile
+import Metrics
+
+
+def test_concurrent_updates_are_not_lost():
+    counter = Metrics.Counter('test_counter', register=False)
+    histogram = Metrics.Histogram('test_histogram', register=False)
+
+    def update():
+        for n in range(20000):
+            counter.inc()
+            histogram.observe(0.001)
+    threads = [threading.Thread(target=update) for n in range(4)]
+
+    # switch threads as often as possible, so any unguarded update is sure to race
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(interval)
+
+    assert counter.value == 80000
+    assert histogram.count == 80000
+    assert sum(histogram.counts) == 80000
+
+
+def test_character_metrics_removed_on_close(logs_directory):
+    filename = logs_directory / 'eqlog_Testchar_P1999Green.txt'
+    filename.write_text('')
+
+    elf = EverquestLogFile.EverquestLogFile()
+    assert elf.open('Testchar', str(filename))
+    for metric in (Metrics.LINES, Metrics.LINES_PER_SECOND, Metrics.TAIL_LAG_BYTES, Metrics.TAIL_LAG_SECONDS):
+        assert 'char="Testchar"' in metric.render()
+
+    elf.close()
+    for metric in (Metrics.LINES, Metrics.LINES_PER_SECOND, Metrics.TAIL_LAG_BYTES, Metrics.TAIL_LAG_SECONDS):
+        assert 'char="Testchar"' not in metric.render()
@@ -0,0 +1,71 @@
+import os
+import time
+
+import myconfig
+import EventPublisher
+import Metrics
+import MultiLogFile
+
+
+def test_rescan_counts_rollovers(logs_directory, monkeypatch):
+    class Recorder:
+        def __init__(self):
+            self.events = list()
+
+        def publish(self, kind, epoch, value, text):
+            self.events.append((kind, value, text))
+
+    recorder = Recorder()
+    monkeypatch.setattr(EventPublisher, '_publisher', recorder)
+
+    alpha = logs_directory / 'eqlog_Alpha_P1999Green.txt'
+    alpha.write_text('')
+    multi = MultiLogFile.MultiLogFile()
+    rollovers = Metrics.HEARTBEAT_ROLLOVERS.value
+    try:
+        # where parsing starts is not a rollover
+        multi.scan()
+        assert list(multi.logs) == [str(alpha)]
+        assert Metrics.HEARTBEAT_ROLLOVERS.value == rollovers
+        assert recorder.events == []
+
+        # Alpha goes idle, and Beta logs in
+        old = time.time() - 2 * multi.active_seconds
+        os.utime(alpha, (old, old))
+        beta = logs_directory / 'eqlog_Beta_P1999Green.txt'
+        beta.write_text('')
+        os.utime(logs_directory, ns=(os.stat(logs_directory).st_mtime_ns + 1,) * 2)
+        multi.scan()
+        assert list(multi.logs) == [str(beta)]
+        assert Metrics.HEARTBEAT_ROLLOVERS.value == rollovers + 2
+        assert recorder.events == [(EventPublisher.HEARTBEAT_ROLLOVER, 1, 'Alpha'),
+                                   (EventPublisher.HEARTBEAT_ROLLOVER, 0, 'Beta')]
+    finally:
+        multi.shutdown()
+
+
+def test_idle_log_checks_every_file(logs_directory):
+    alpha = logs_directory / 'eqlog_Alpha_P1999Green.txt'
+    beta = logs_directory / 'eqlog_Beta_P1999Green.txt'
+    alpha.write_text('')
+    old = time.time() - 2 * myconfig.MULTILOG_ACTIVE_SECONDS
+    beta.write_text('')
+    os.utime(beta, (old, old))
+
+    multi = MultiLogFile.MultiLogFile()
+    multi.directory_index.restat_seconds = 3600
+    try:
+        multi.scan()
+        assert list(multi.logs) == [str(alpha)]
+
+        # Alpha's player switches to Beta, which appends to its log without changing the directory
+        os.utime(beta, None)
+        multi.scan()
+        assert list(multi.logs) == [str(alpha)]
+
+        # once Alpha has gone a heartbeat without growing, Beta is found
+        multi.logs[str(alpha)].prevtime -= 2 * multi.heartbeat
+        multi.scan()
+        assert str(beta) in multi.logs
+    finally:
+        multi.shutdown()
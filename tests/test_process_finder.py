@@ -0,0 +1,40 @@
+import os
+import shutil
+import signal
+import time
+
+import pytest
+
+import ProcessFinder
+
+
+FINDERS = [
+    pytest.param(ProcessFinder.ProcFsProcessFinder, marks=pytest.mark.skipif(not os.path.isdir('/proc/self'),
+                                                                             reason='needs /proc')),
+    pytest.param(ProcessFinder.PsProcessFinder, marks=pytest.mark.skipif(shutil.which('ps') is None or
+                                                                         not os.path.isdir('/proc/self'),
+                                                                         reason='needs ps, and /proc for the test')),
+]
+
+
+def is_zombie(pid: int) -> bool:
+    with open(f'/proc/{pid}/stat', 'rb') as f:
+        data = f.read()
+    return data[data.rfind(b')') + 2:data.rfind(b')') + 3] == b'Z'
+
+
+@pytest.mark.parametrize('finder_class', FINDERS)
+def test_killed_process_is_gone(spawn, finder_class):
+    finder = finder_class('eqgame.exe')
+    filename, process = spawn('Alpha')
+    assert process.pid in finder.find()
+    assert finder.matches(process.pid)
+
+    # killed, but not yet reaped, i.e. a zombie
+    process.send_signal(signal.SIGKILL)
+    deadline = time.monotonic() + 5
+    while not is_zombie(process.pid) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert is_zombie(process.pid)
+    assert process.pid not in finder.find()
+    assert not finder.matches(process.pid)
@@ -0,0 +1,80 @@
+import sys
+import threading
+
+import pytest
+
+import Profiler
+
+
+class Base:
+    def step(self, n):
+        return n + 1
+
+    @staticmethod
+    def helper(n):
+        return n * 2
+
+
+class Inheritor(Base):
+    pass
+
+
+class Overrider(Inheritor):
+    def step(self, n):
+        return super().step(n) + 1
+
+
+def test_inherited_and_overridden_methods():
+    timers = Profiler.StageTimers([('step', Inheritor, 'step'), ('helper', Base, 'helper')])
+    timers.wrap()
+    try:
+        assert Inheritor().step(1) == 2
+        assert Overrider().step(1) == 3
+        assert Base.helper(2) == 4
+    finally:
+        timers.unwrap()
+
+    # Inheritor's own call, and Overrider's, which calls up to Base, each once
+    assert timers.totals['step'][0] == 2
+    assert timers.totals['helper'][0] == 1
+
+    # back to inheriting, with nothing left behind
+    assert 'step' not in vars(Inheritor)
+    assert vars(Overrider)['step'].__qualname__ == 'Overrider.step'
+    assert isinstance(vars(Base)['helper'], staticmethod)
+
+
+def test_missing_stage(tmp_path):
+    profiler = Profiler.Profiler(stages=(), seconds=1, sample_seconds=0.01, directory=str(tmp_path))
+    with pytest.raises(ValueError):
+        profiler.add_stage('missing', Base, 'no_such_method')
+
+    # a stage which disappears after being added doesn't start a session, or leave anything wrapped
+    profiler.add_stage('step', Base, 'step')
+    profiler.stages.append(('gone', Inheritor, 'no_such_method'))
+    assert not profiler.start_session()
+    assert not profiler.is_profiling()
+    assert vars(Base)['step'].__qualname__ == 'Base.step'
+
+
+def test_calls_from_many_threads():
+    interval = sys.getswitchinterval()
+    timers = Profiler.StageTimers([('step', Base, 'step')])
+    timers.wrap()
+    sys.setswitchinterval(1e-6)
+    try:
+        base = Base()
+
+        def caller():
+            for i in range(20000):
+                base.step(i)
+        threads = [threading.Thread(target=caller) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(interval)
+        timers.unwrap()
+
+    assert timers.totals['step'][0] == 4 * 20000